@@ -1,3 +1,4 @@
+import multiprocessing
 import os
 import sys
 
@@ -91,4 +92,6 @@ def main():
 
 # this main block is required to generate executable by pyinstaller
 if __name__ == "__main__":
+    # the COCO export uses a process pool, which needs this in the executable
+    multiprocessing.freeze_support()
     main()
\ No newline at end of file
@@ -25,7 +25,7 @@ class models_inference():
     @torch.no_grad()
     def decode_file(self, img, model, classdict, threshold=0.3, img_array_flag=False):
 
-        if model.__class__.__name__ == "YOLO":  
+        if model.__class__.__name__ in ["YOLO", "YOLOOnnxModel"]:
             if isinstance(img, str):
                 img = cv2.imread(img)
 
@@ -36,28 +36,35 @@ class models_inference():
                 # conf_thres=0.25,  # confidence threshold
                 # iou_thres=0.45,  # NMS IOU threshold
                 # max_det=1000,  # maximum detections per image
-            results = model(img_resized , conf = 0.25 , iou=  0.45 , verbose = False)
-            results = results[0]
-            # if len results is 0 then return empty dict
-            if results.masks is None:
-                return {"results": {}}
-
-            masks = results.masks.cpu().numpy().masks
-            masks = masks > 0.0
+            if model.__class__.__name__ == "YOLOOnnxModel":
+                boxes, confidences, class_ids, masks = model(img_resized , conf = 0.25 , iou=  0.45)
+                if len(masks) == 0:
+                    return {"results": {}}
+            else:
+                results = model(img_resized , conf = 0.25 , iou=  0.45 , verbose = False)
+                results = results[0]
+                # if len results is 0 then return empty dict
+                if results.masks is None:
+                    return {"results": {}}
+
+                masks = results.masks.cpu().numpy().masks
+                masks = masks > 0.0
+                boxes = results.boxes.xyxy.cpu().numpy()
+                confidences = results.boxes.conf.cpu().numpy()
+                class_ids = results.boxes.cls.cpu().numpy().astype(int)
             org_size = img.shape[:2]
             out_size = masks.shape[1:]
 
             # print(f'org_size : {org_size} , out_size : {out_size}')
 
             # convert boxes to original image size same as the masks (coords = coords * org_size / out_size)
-            boxes = results.boxes.xyxy.cpu().numpy()
             boxes = boxes * np.array([org_size[1] / out_size[1], org_size[0] /
                                      out_size[0], org_size[1] / out_size[1], org_size[0] / out_size[0]])
 
             detections = Detections(
                 xyxy=boxes,
-                confidence=results.boxes.conf.cpu().numpy(),
-                class_id=results.boxes.cls.cpu().numpy().astype(int)
+                confidence=confidences,
+                class_id=class_ids
             )
 
             polygons = []
@@ -93,9 +100,13 @@ class models_inference():
             return result_dict
 
         if img_array_flag:
-            results = inference_detector(model, img)
+            img_array = img
         else:
-            results = inference_detector(model, plt.imread(img))
+            img_array = plt.imread(img)
+        if getattr(model, "is_onnx", False):
+            results = model.inference(img_array)
+        else:
+            results = inference_detector(model, img_array)
         # results = async_inference_detector(model, plt.imread(img_path))
         torch.cuda.empty_cache()
 
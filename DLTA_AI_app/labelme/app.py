@@ -11,6 +11,7 @@ import warnings
 import os
 import os.path as osp
 import numpy as np
+import PIL.Image
 from pathlib import Path
 
 from PyQt6 import QtCore
@@ -25,6 +26,9 @@ from . import QT5
 from . import utils
 
 from .utils.sam import Sam_Predictor
+from .utils.sam_cache import SamEmbeddingCache, file_token, video_frame_token
+from .utils.sam_precompute import SamEmbeddingPrecomputer
+from .utils.sam_propagation import SamPropagator
 from .utils.helpers import visualizations, mathOps
 from .utils.custom_exports import custom_exports_list
 
@@ -43,12 +47,21 @@ from .widgets import runtime_data_UI, preferences_UI, shortcut_selector_UI, link
 from .widgets.editLabel_videoMode import editLabel_idChanged_UI, editLabel_handle_data
 from .widgets.segmentation_options_UI import SegmentationOptionsUI
 from .widgets.merge_feature_UI import MergeFeatureUI
+from .widgets.file_list_widget import FileListWidget
 
 from .intelligence import Intelligence
 from .intelligence import coco_classes, color_palette
 
 from supervision.detection.core import Detections
 from trackers.multi_tracker_zoo import create_tracker
+from trackers.cmc import CMCService
+from .utils.detection_cache import DetectionCache
+from .utils.quantization import quantize_reid
+from .utils.prefetch import ImagePrefetcher
+from .utils import compact_format
+from .utils import interpolation
+from .utils.dir_index import DirectoryIndex, DirScanWorker
+from .utils.trajectories import Trajectories
 from ultralytics.yolo.utils.torch_utils import select_device
 
 warnings.filterwarnings("ignore")
@@ -186,7 +199,7 @@ class MainWindow(QtWidgets.QMainWindow):
         self.fileSearch = QtWidgets.QLineEdit()
         self.fileSearch.setPlaceholderText(self.tr("Search Filename"))
         self.fileSearch.textChanged.connect(self.fileSearchChanged)
-        self.fileListWidget = QtWidgets.QListWidget()
+        self.fileListWidget = FileListWidget()
         self.fileListWidget.itemSelectionChanged.connect(
             self.fileSelectionChanged
         )
@@ -246,10 +259,26 @@ class MainWindow(QtWidgets.QMainWindow):
         
         # SAM predictor
         self.sam_predictor = None
+        # image embeddings of the SAM models, so an image is only encoded once
+        self.samEmbeddingCache = SamEmbeddingCache(
+            memory_mb=self._config["sam"]["embedding_cache_mb"],
+            cache_dir=self._config["sam"]["embedding_cache_dir"],
+            disk_mb=self._config["sam"]["embedding_cache_disk_mb"])
+        # computes the embeddings of the next video frames in the background
+        self.samPrecomputer = SamEmbeddingPrecomputer(
+            memory_mb=self._config["sam"]["precompute_memory_mb"])
         self.current_sam_shape = None
         self.SAM_SHAPES_IN_IMAGE = []
         self.sam_last_mode = "rectangle"
 
+        # decodes the neighbouring images of dir mode in the background
+        self.imagePrefetcher = ImagePrefetcher(
+            count=self._config["prefetch"]["count"],
+            memory_mb=self._config["prefetch"]["memory_mb"])
+        # directories are scanned on a worker thread with a persistent index
+        self.dirIndex = None
+        self.dirScanWorker = None
+
         self.setCentralWidget(scrollArea)
 
         # for Export
@@ -276,8 +305,7 @@ class MainWindow(QtWidgets.QMainWindow):
                                          "mask": True,
                                          "polygons": True,
                                          "conf": True}
-        self.CURRENT_ANNOATAION_TRAJECTORIES = {'length': 30,
-                                                'alpha': 0.70}
+        self.CURRENT_ANNOATAION_TRAJECTORIES = Trajectories()
         self.CURRENT_SHAPES_IN_IMG = []
         self.featuresOptions = {'deleteDefault': "this frame only",
                                 'interpolationDefMethod': "linear",
@@ -1204,7 +1232,10 @@ class MainWindow(QtWidgets.QMainWindow):
         self.filename = None
         self.imagePath = None
         self.imageData = None
+        self.decodedImage = None
         self.CURRENT_FRAME_IMAGE = None
+        # identifies the current image for SAM (file path and mtime, or video frame)
+        self.CURRENT_FRAME_TOKEN = None
         self.labelFile = None
         self.otherData = None
         self.canvas.resetState()
@@ -1380,10 +1411,16 @@ class MainWindow(QtWidgets.QMainWindow):
             method / 'configs' / (method + '.yaml')
         with torch.no_grad():
             device = select_device('')
+            weights = reid_weights
+            if self._config["tracking"]["reid_int8"]:
+                try:
+                    weights = quantize_reid(reid_weights)
+                except Exception as e:
+                    print(f'Error in quantizing the ReID model, using FP32 instead\n{e}')
             print(
-                f'tracking method {self.tracking_method} , config {self.tracking_config} , reid {reid_weights} , device {device} , half {False}')
+                f'tracking method {self.tracking_method} , config {self.tracking_config} , reid {weights} , device {device} , half {False}')
             self.tracker = create_tracker(
-                self.tracking_method, self.tracking_config, reid_weights, device, False)
+                self.tracking_method, self.tracking_config, weights, device, False, external_cmc=True)
             if hasattr(self.tracker, 'model'):
                 if hasattr(self.tracker.model, 'warmup'):
                     self.tracker.model.warmup()
@@ -1616,13 +1653,8 @@ class MainWindow(QtWidgets.QMainWindow):
             if with_sam:
                 self.interpolate_with_sam(ids, with_keyframes)
             else:
-                for id in ids:
-                    QtWidgets.QApplication.processEvents()
-                    if self.interrupted:
-                        self.interrupted = False
-                        break
-                    self.interpolate(id=id,
-                                     only_edited=with_keyframes)
+                self.interpolate_ids(ids, only_edited=with_keyframes)
+                self.interrupted = False
             self.waitWindow()
         except Exception as e:
             MsgBox.OKmsgBox("Error", f"Error: {e}", "critical")
@@ -1630,96 +1662,52 @@ class MainWindow(QtWidgets.QMainWindow):
     def interpolate(self, id, only_edited=False):
         """
         Summary:
-            This function is called when the user presses the "Interpolate" button.
-            It interpolates the object with the given id.
+            It interpolates the object with the given id (see `interpolate_ids`).
 
         Args:
             id (int): The id of the object.
             only_edited (bool, optional): True to interpolate using only the key frames. Defaults to False.
         """
 
-        self.waitWindow(
-            visible=True, text=f'Please Wait.\nID {id} is being interpolated...')
-
-        listObj = self.load_objects_from_json__orjson()
+        self.interpolate_ids([id], only_edited)
 
-        if only_edited:
-            try:
-                FRAMES = list(self.key_frames['id_' + str(id)])
-            except:
-                return
-        else:
-            FRAMES = list(self.id_frames_rec['id_' + str(id)]) if len(
-                self.id_frames_rec['id_' + str(id)]) > 1 else [-1]
-
-        first_frame_idx = min(FRAMES)
-        last_frame_idx = max(FRAMES)
+    def interpolate_ids(self, ids, only_edited=False):
+        """
+        Summary:
+            This function is called when the user presses the "Interpolate" button.
+            It interpolates the objects with the given ids in one pass over the tracking results
+            and saves them once.
 
-        if (first_frame_idx >= last_frame_idx):
-            return
+        Args:
+            ids (list): The ids of the objects.
+            only_edited (bool, optional): True to interpolate using only the key frames. Defaults to False.
+        """
 
-        records = [None for i in range(first_frame_idx - 1, last_frame_idx, 1)]
-        for frame in range(first_frame_idx, last_frame_idx + 1, 1):
-            listobjframe = listObj[frame - 1]['frame_idx']
-            frameobjects = listObj[frame - 1]['frame_data']
-            for object_ in frameobjects:
-                if (object_['tracker_id'] == id):
-                    if ((not only_edited) or (listobjframe in FRAMES)):
-                        records[frame -
-                                first_frame_idx] = copy.deepcopy(object_)
-                    break
+        self.waitWindow(
+            visible=True, text=f'Please Wait.\n{len(ids)} IDs are being interpolated...')
 
-        baseObject = None
-        baseObjectFrame = None
-        nextObject = None
-        nextObjectFrame = None
+        listObj = self.load_objects_from_json__orjson()
 
-        for frame in range(first_frame_idx, last_frame_idx, 1):
+        key_frames = None
+        if only_edited:
+            key_frames = {id: self.key_frames.get('id_' + str(id), set()) for id in ids}
 
+        def stop():
             QtWidgets.QApplication.processEvents()
-            if self.interrupted:
-                break
-
-            listobjframe = listObj[frame - 1]['frame_idx']
-            frameobjects = listObj[frame - 1]['frame_data']
+            return self.interrupted
 
-            # if object is present in this frame, then it is base object and we calculate next object
-            if (records[frame - first_frame_idx] is not None):
-
-                # assign it as base object
-                baseObject = copy.deepcopy(records[frame - first_frame_idx])
-                baseObjectFrame = frame
-
-                # find next object
-                for j in range(frame + 1, last_frame_idx + 1, 1):
-                    if (records[j - first_frame_idx] != None):
-                        nextObject = copy.deepcopy(
-                            records[j - first_frame_idx])
-                        nextObjectFrame = j
-                        break
-
-                # job done, go to next frame
-                continue
+        added = interpolation.interpolate_ids(listObj, ids, key_frames, stop=stop)
+        if len(added) == 0:
+            return
 
-            # if only_edited is true and the frame is not key, then we remove the object from the frame to be interpolated
-            if (only_edited and (frame not in FRAMES)):
-                for object_ in frameobjects:
-                    if (object_['tracker_id'] == id):
-                        listObj[frame - 1]['frame_data'].remove(object_)
-                        break
-
-            # if object is not present in this frame, then we calculate the object for this frame
-            cur = mathOps.getInterpolated(baseObject=baseObject,
-                                          baseObjectFrame=baseObjectFrame,
-                                          nextObject=nextObject,
-                                          nextObjectFrame=nextObjectFrame,
-                                          curFrame=frame,)
-            listObj[frame - 1]['frame_data'].append(cur)
-            self.rec_frame_for_id(id, frame)
+        for id, frames in added.items():
+            for frame in frames:
+                self.rec_frame_for_id(id, frame)
 
         self.load_objects_to_json__orjson(listObj)
-        frames = range(first_frame_idx - 1, last_frame_idx, 1)
-        self.calculate_trajectories(frames)
+        first_frame_idx = min(min(frames) for frames in added.values())
+        last_frame_idx = max(max(frames) for frames in added.values())
+        self.calculate_trajectories(range(first_frame_idx - 1, last_frame_idx, 1))
         self.main_video_frames_slider_changed()
 
     def interpolate_with_sam(self, idsLISTX, only_edited=False):
@@ -1781,6 +1769,10 @@ class MainWindow(QtWidgets.QMainWindow):
                                        first_frame_idxLIST[index]] = copy.deepcopy(object_)
                     listObj[i]['frame_data'].remove(object_)
 
+        # the embeddings of the next frames are computed in the background while a frame is processed
+        self.samPrecomputer.request(self.CURRENT_VIDEO_FILE, range(
+            min(first_frame_idxLIST) + 1, max(last_frame_idxLIST) + 1))
+
         for frameIDX in range(min(first_frame_idxLIST), max(last_frame_idxLIST) + 1):
             QtWidgets.QApplication.processEvents()
             if self.interrupted:
@@ -1791,6 +1783,7 @@ class MainWindow(QtWidgets.QMainWindow):
 
             frameIMAGE = self.get_frame_by_idx(frameIDX)
 
+            toBeRefined = []
             for ididx in range(len(idsLIST)):
                 i = frameIDX - first_frame_idxLIST[ididx]
                 self.waitWindow(visible=True)
@@ -1821,21 +1814,26 @@ class MainWindow(QtWidgets.QMainWindow):
 
                     records[i] = current
 
+                toBeRefined.append((ididx, current, cur_bbox))
+
+            if len(toBeRefined) > 0:
                 try:
                     same_image = self.sam_predictor.check_image(
-                        frameIMAGE)
+                        frameIMAGE, video_frame_token(self.CURRENT_VIDEO_FILE, frameIDX))
                 except:
                     return
 
-                cur_bbox, cur_segment = self.sam_enhanced_bbox_segment(
-                    frameIMAGE, cur_bbox, 1.2, max_itr=5, forSHAPE=False)
+                # the boxes of all the ids in the frame are refined together
+                results = self.sam_enhanced_bboxes_segments(
+                    frameIMAGE, [cur_bbox for _, _, cur_bbox in toBeRefined], 1.2, max_itr=5, forSHAPE=False)
 
-                current['bbox'] = copy.deepcopy(cur_bbox)
-                current['segment'] = copy.deepcopy(cur_segment)
+                for (ididx, current, _), (cur_bbox, cur_segment) in zip(toBeRefined, results):
+                    current['bbox'] = copy.deepcopy(cur_bbox)
+                    current['segment'] = copy.deepcopy(cur_segment)
 
-                # append the shape frame by frame (cause we already removed it in the prev. for loop)
-                listObj[frameIDX - 1]['frame_data'].append(current)
-                self.rec_frame_for_id(idsLIST[ididx], frameIDX)
+                    # append the shape frame by frame (cause we already removed it in the prev. for loop)
+                    listObj[frameIDX - 1]['frame_data'].append(current)
+                    self.rec_frame_for_id(idsLIST[ididx], frameIDX)
 
             # update frame by frame to the to-be-uploaded listObj
             listObjNEW[frameIDX - 1] = copy.deepcopy(listObj[frameIDX - 1])
@@ -1916,27 +1914,21 @@ class MainWindow(QtWidgets.QMainWindow):
             self.update_current_frame_annotation_button_clicked()
 
     def fileSearchChanged(self):
-        self.importDirImages(
-            self.lastOpenDir,
-            pattern=self.fileSearch.text(),
-            load=False,
-        )
+        # the listed files are filtered, the directory is not scanned again
+        self.fileListWidget.setFilter(self.fileSearch.text())
 
     def fileSelectionChanged(self):
-        items = self.fileListWidget.selectedItems()
-        if not items:
+        files = self.fileListWidget.selectedFiles()
+        if not files:
             return
-        item = items[0]
+        filename = files[0]
 
         if not self.mayContinue():
             return
 
-        currIndex = self.imageList.index(str(item.text()))
-        if currIndex < len(self.imageList):
-            filename = self.imageList[currIndex]
-            if filename:
-                self.loadFile(filename)
-                self.refresh_image_MODE()
+        if filename:
+            self.loadFile(filename)
+            self.refresh_image_MODE()
 
     # React to canvas signals.
     def shapeSelectionChanged(self, selected_shapes):
@@ -2111,13 +2103,7 @@ class MainWindow(QtWidgets.QMainWindow):
                 flags=flags,
             )
             self.labelFile = lf
-            items = self.fileListWidget.findItems(
-                self.imagePath, Qt.MatchFlag.MatchExactly
-            )
-            if len(items) > 0:
-                if len(items) != 1:
-                    raise RuntimeError("There are duplicate files.")
-                items[0].setCheckState(Qt.CheckState.Checked)
+            self.fileListWidget.setChecked(self.imagePath, True)
             # disable allows next and previous image to proceed
             return True
         except LabelFileError as e:
@@ -2297,8 +2283,13 @@ class MainWindow(QtWidgets.QMainWindow):
         self.canvas.set_show_cross_line(enabled)
 
     def brightnessContrast(self, value):
+        if self.decodedImage is not None:
+            img = self.decodedImage.pil()
+        else:
+            # video frames are not decoded images, CURRENT_FRAME_IMAGE is BGR
+            img = PIL.Image.fromarray(self.CURRENT_FRAME_IMAGE[..., ::-1])
         dialog = BrightnessContrastDialog(
-            utils.img_data_to_pil(self.imageData),
+            img,
             self.onNewBrightnessContrast,
             parent=self,
         )
@@ -2322,10 +2313,9 @@ class MainWindow(QtWidgets.QMainWindow):
     def loadFile(self, filename=None):
         """Load the specified file, or the last opened file if None."""
         # changing fileListWidget loads file
-        if filename in self.imageList and (
-            self.fileListWidget.currentRow() != self.imageList.index(filename)
-        ):
-            self.fileListWidget.setCurrentRow(self.imageList.index(filename))
+        row = self.fileListWidget.row(filename)
+        if row >= 0 and self.fileListWidget.currentRow() != row:
+            self.fileListWidget.setCurrentRow(row)
             self.fileListWidget.repaint()
             return
 
@@ -2341,17 +2331,17 @@ class MainWindow(QtWidgets.QMainWindow):
                 self.tr("No such file: <b>%s</b>") % filename,
             )
             return False
-        # assumes same name, but json extension
         self.status(self.tr("Loading %s...") % osp.basename(str(filename)))
-        label_file = osp.splitext(filename)[0] + ".json"
-        if self.output_dir:
-            label_file_without_path = osp.basename(label_file)
-            label_file = osp.join(self.output_dir, label_file_without_path)
+        label_file = self.labelFilePath(filename)
+        prefetched = self.imagePrefetcher.get(filename, label_file)
         if QtCore.QFile.exists(label_file) and LabelFile.is_label_file(
             label_file
         ):
             try:
-                self.labelFile = LabelFile(label_file)
+                if prefetched is not None and prefetched["label_file"] is not None:
+                    self.labelFile = prefetched["label_file"]
+                else:
+                    self.labelFile = LabelFile(label_file)
             except LabelFileError as e:
                 self.errorMessage(
                     self.tr("Error opening file"),
@@ -2363,6 +2353,7 @@ class MainWindow(QtWidgets.QMainWindow):
                 )
                 self.status(self.tr("Error reading %s") % label_file)
                 return False
+            self.decodedImage = self.labelFile.image
             self.imageData = self.labelFile.imageData
             self.imagePath = osp.join(
                 osp.dirname(label_file),
@@ -2370,11 +2361,19 @@ class MainWindow(QtWidgets.QMainWindow):
             )
             self.otherData = self.labelFile.otherData
         else:
-            self.imageData = LabelFile.load_image_file(filename)
-            if self.imageData:
+            # decoded only once, the canvas, SAM and the models share its buffer
+            if prefetched is not None:
+                self.decodedImage = prefetched["image"]
+            else:
+                self.decodedImage = LabelFile.load_decoded_image(filename)
+            if self.decodedImage is not None:
+                self.imageData = self.decodedImage.data()
                 self.imagePath = filename
             self.labelFile = None
-        image = QtGui.QImage.fromData(self.imageData)
+        if self.decodedImage is not None:
+            image = self.decodedImage.qimage()
+        else:
+            image = QtGui.QImage()
 
         if image.isNull():
             formats = [
@@ -2391,7 +2390,8 @@ class MainWindow(QtWidgets.QMainWindow):
             self.status(self.tr("Error reading %s") % filename)
             return False
         self.image = image
-        self.CURRENT_FRAME_IMAGE = cv2.imread(filename)
+        self.CURRENT_FRAME_IMAGE = self.decodedImage.bgr()
+        self.CURRENT_FRAME_TOKEN = file_token(filename)
         self.filename = filename
         if self._config["keep_prev"]:
             prev_shapes = self.canvas.shapes
@@ -2430,12 +2430,10 @@ class MainWindow(QtWidgets.QMainWindow):
         if self.sam_predictor is not None:
             self.sam_predictor.clear_logit()
             self.canvas.SAM_coordinates = []
+            if prefetched is not None and prefetched["sam"] is not None and prefetched["sam"][0] is self.sam_predictor:
+                self.sam_predictor.set_embedding(
+                    self.CURRENT_FRAME_IMAGE, prefetched["sam"][1], self.CURRENT_FRAME_TOKEN)
         # set brightness constrast values
-        dialog = BrightnessContrastDialog(
-            utils.img_data_to_pil(self.imageData),
-            self.onNewBrightnessContrast,
-            parent=self,
-        )
         brightness, contrast = self.brightnessContrast_values.get(
             self.filename, (None, None)
         )
@@ -2447,20 +2445,38 @@ class MainWindow(QtWidgets.QMainWindow):
             _, contrast = self.brightnessContrast_values.get(
                 self.recentFiles[0], (None, None)
             )
-        if brightness is not None:
-            dialog.slider_brightness.setValue(brightness)
-        if contrast is not None:
-            dialog.slider_contrast.setValue(contrast)
         self.brightnessContrast_values[self.filename] = (brightness, contrast)
         if brightness is not None or contrast is not None:
+            # the dialog (and its PIL image) is only needed to apply the values
+            dialog = BrightnessContrastDialog(
+                self.decodedImage.pil(),
+                self.onNewBrightnessContrast,
+                parent=self,
+            )
+            if brightness is not None:
+                dialog.slider_brightness.setValue(brightness)
+            if contrast is not None:
+                dialog.slider_contrast.setValue(contrast)
             dialog.onNewValue(None)
         self.paintCanvas()
         self.addRecentFile(self.filename)
         self.toggleActions(True)
         self.canvas.setFocus()
         self.status(self.tr("Loaded %s") % osp.basename(str(filename)))
+        row = self.fileListWidget.row(self.filename)
+        if row >= 0:
+            self.imagePrefetcher.prefetch(self.imageList, row, self.labelFilePath)
         return True
 
+    def labelFilePath(self, filename):
+        # assumes same name, but json extension
+        label_file = osp.splitext(filename)[0] + ".json"
+        if self.output_dir:
+            label_file_without_path = osp.basename(label_file)
+            label_file = osp.join(self.output_dir, label_file_without_path)
+        # the compact sidecar is used if it is newer than the json file
+        return compact_format.resolve(label_file)
+
     def resizeEvent(self, event):
         if (
             self.canvas
@@ -2515,6 +2531,10 @@ class MainWindow(QtWidgets.QMainWindow):
         self.settings.setValue("window/position", self.pos())
         self.settings.setValue("window/state", self.saveState())
         self.settings.setValue("recentFiles", self.recentFiles)
+        self.imagePrefetcher.shutdown()
+        self.samPrecomputer.shutdown()
+        self.stopDirScan()
+        self.save_trajectories()
         # ask the use for where to save the labels
         # self.settings.setValue('window/geometry', self.saveGeometry())
 
@@ -2602,10 +2622,11 @@ class MainWindow(QtWidgets.QMainWindow):
             return
 
         filename = None
-        if self.filename is None:
+        currIndex = self.fileListWidget.row(self.filename)
+        if currIndex < 0:
+            # no file opened yet, or it is not listed (filtered out)
             filename = self.imageList[0]
         else:
-            currIndex = self.imageList.index(self.filename)
             if currIndex + 1 < len(self.imageList):
                 filename = self.imageList[currIndex + 1]
             else:
@@ -2687,15 +2708,8 @@ class MainWindow(QtWidgets.QMainWindow):
         )
         self.statusBar().show()
 
-        current_filename = self.filename
-        self.importDirImages(self.lastOpenDir, load=False)
-
-        if current_filename in self.imageList:
-            # retain currently selected file
-            self.fileListWidget.setCurrentRow(
-                self.imageList.index(current_filename)
-            )
-            self.fileListWidget.repaint()
+        # retain currently selected file once the directory is scanned
+        self.importDirImages(self.lastOpenDir, load=False, select=self.filename)
 
     def saveFile(self, _value=False):
         assert not self.image.isNull(), "cannot save empty image"
@@ -2937,8 +2951,7 @@ class MainWindow(QtWidgets.QMainWindow):
             os.remove(label_file)
             logger.info("Label file is removed: {}".format(label_file))
 
-            item = self.fileListWidget.currentItem()
-            item.setCheckState(Qt.CheckState.Unchecked)
+            self.fileListWidget.setChecked(self.filename, False)
 
             self.resetState()
 
@@ -3061,8 +3074,7 @@ class MainWindow(QtWidgets.QMainWindow):
                 id = object_['tracker_id']
                 if id in deleted_ids:
                     listObj[i]['frame_data'].remove(object_)
-                    self.CURRENT_ANNOATAION_TRAJECTORIES['id_' +
-                                                         str(id)][frame_idx - 1] = (-1, -1)
+                    self.CURRENT_ANNOATAION_TRAJECTORIES.remove(id, [frame_idx])
                     self.rec_frame_for_id(id, frame_idx, type_='remove')
 
         self.load_objects_to_json__orjson(listObj)
@@ -3161,11 +3173,8 @@ class MainWindow(QtWidgets.QMainWindow):
 
     @property
     def imageList(self):
-        lst = []
-        for i in range(self.fileListWidget.count()):
-            item = self.fileListWidget.item(i)
-            lst.append(item.text())
-        return lst
+        # the listed files (not a copy, do not modify it)
+        return self.fileListWidget.files
 
     def importDroppedImageFiles(self, imageFiles):
         extensions = [
@@ -3175,7 +3184,7 @@ class MainWindow(QtWidgets.QMainWindow):
 
         self.filename = None
         for file in imageFiles:
-            if file in self.imageList or not file.lower().endswith(
+            if self.fileListWidget.contains(file) or not file.lower().endswith(
                 tuple(extensions)
             ):
                 continue
@@ -3183,19 +3192,28 @@ class MainWindow(QtWidgets.QMainWindow):
             if self.output_dir:
                 label_file_without_path = osp.basename(label_file)
                 label_file = osp.join(self.output_dir, label_file_without_path)
-            item = QtWidgets.QListWidgetItem(file)
-            # item.setFlags(Qt.ItemFlag.ItemIsEnabled | Qt.ItemFlag.ItemIsSelectable)
-            if QtCore.QFile.exists(label_file) and LabelFile.is_label_file(
+            label_file = compact_format.resolve(label_file)
+            labeled = QtCore.QFile.exists(label_file) and LabelFile.is_label_file(
                 label_file
-            ):
-                item.setCheckState(Qt.CheckState.Checked)
-            else:
-                item.setCheckState(Qt.CheckState.Unchecked)
-            self.fileListWidget.addItem(item)
+            )
+            self.fileListWidget.addFiles([(file, labeled)])
 
             self.openNextImg()
 
-    def importDirImages(self, dirpath, pattern=None, load=True):
+    def importDirImages(self, dirpath, pattern=None, load=True, select=None):
+        """
+        Summary:
+            Fill the file list with the images of a directory.
+            The directory is scanned on a worker thread using its persistent index
+            (only the sub directories that changed are listed again) and the list is
+            filled incrementally, the first image is opened as soon as it is found.
+
+        Args:
+            dirpath (str): the directory
+            pattern (str): only list the images whose path contains it
+            load (bool): load the first image
+            select (str): image to select once the scan is done (if it is listed)
+        """
 
         self.actions.export.setEnabled(True)
 
@@ -3206,40 +3224,52 @@ class MainWindow(QtWidgets.QMainWindow):
         self.filename = None
         self.fileListWidget.clear()
         self.uniqLabelList.clear()
-        for filename in self.scanAllImages(dirpath):
-            if pattern and pattern not in filename:
-                continue
-            label_file = osp.splitext(filename)[0] + ".json"
-            if self.output_dir:
-                label_file_without_path = osp.basename(label_file)
-                label_file = osp.join(self.output_dir, label_file_without_path)
-            item = QtWidgets.QListWidgetItem(filename)
-            # item.setFlags(Qt.ItemFlag.ItemIsEnabled | Qt.ItemFlag.ItemIsSelectable)
-            if QtCore.QFile.exists(label_file) and LabelFile.is_label_file(
-                label_file
-            ):
-                item.setCheckState(Qt.CheckState.Checked)
-            else:
-                item.setCheckState(Qt.CheckState.Unchecked)
-            self.fileListWidget.addItem(item)
-        self.openNextImg(load=load)
+        if self.dirIndex is None or self.dirIndex.root != osp.abspath(dirpath):
+            self.dirIndex = DirectoryIndex(dirpath, self.imageExtensions())
+        self.fileListWidget.setFilter(pattern)
+        worker = DirScanWorker(self, self.dirIndex, self.output_dir)
+        worker.batch.connect(lambda images: self.addDirImages(worker, images, load))
+        worker.finished.connect(lambda: self.dirScanFinished(worker, select))
+        self.dirScanWorker = worker
+        worker.start()
+
+    def addDirImages(self, worker, images, load):
+        # batches of a previous scan are dropped
+        if worker is not self.dirScanWorker:
+            return
+        self.fileListWidget.addFiles(images)
+        if self.filename is None:
+            self.openNextImg(load=load)
+
+    def dirScanFinished(self, worker, select):
+        if worker is not self.dirScanWorker:
+            return
+        if self.fileListWidget.row(select) >= 0:
+            self.fileListWidget.setCurrentRow(self.fileListWidget.row(select))
+            self.fileListWidget.repaint()
         self.fileListWidget.horizontalScrollBar().setValue(
             self.fileListWidget.horizontalScrollBar().maximum()
         )
 
-    def scanAllImages(self, folderPath):
-        extensions = [
+    def stopDirScan(self):
+        if self.dirScanWorker is not None and self.dirScanWorker.isRunning():
+            self.dirScanWorker.requestInterruption()
+            self.dirScanWorker.wait()
+        self.dirScanWorker = None
+
+    def isScanningDir(self):
+        return self.dirScanWorker is not None and self.dirScanWorker.isRunning()
+
+    def imageExtensions(self):
+        return [
             ".%s" % fmt.data().decode().lower()
             for fmt in QtGui.QImageReader.supportedImageFormats()
         ]
 
-        images = []
-        for root, dirs, files in os.walk(folderPath):
-            for file in files:
-                if file.lower().endswith(tuple(extensions)):
-                    relativePath = osp.join(root, file)
-                    images.append(relativePath)
-        images.sort(key=lambda x: x.lower())
+    def scanAllImages(self, folderPath):
+        index = DirectoryIndex(folderPath, self.imageExtensions())
+        images = [filename for batch in index.scan() for filename, _ in batch]
+        index.save()
         return images
     
     def refresh_image_MODE(self, fromSignal=False):
@@ -3306,6 +3336,9 @@ class MainWindow(QtWidgets.QMainWindow):
         self.setDirty()
 
     def annotate_batch(self):
+        if self.isScanningDir():
+            MsgBox.OKmsgBox("Directory not loaded", "The directory is still being scanned, try again when all its images are listed.", "warning")
+            return
         images = []
         self._config = get_config()
         notif = [self._config["mute"], self, notification.PopUp]
@@ -3357,59 +3390,88 @@ class MainWindow(QtWidgets.QMainWindow):
 
     # VIDEO PROCESSING FUNCTIONS (ALL CONNECTED TO THE VIDEO PROCESSING TOOLBAR)
 
-    def calculate_trajectories(self, frames=None):
+    def calculate_trajectories(self, frames=None, listObj=None):
         """
         Summary:
             Calculate trajectories for all objects in the video
 
         Args:
             frames (list): list of frames to calculate trajectories for (default: None -> all frames)
+            listObj (list): the tracking results (default: None -> loaded from the json file)
         """
 
-        listObj = self.load_objects_from_json__orjson()
+        if listObj is None:
+            listObj = self.load_objects_from_json__orjson()
         if len(listObj) == 0:
             return
 
         frames = frames if frames else range(len(listObj))
 
+        self.record_frames_ids(listObj, frames)
+        self.CURRENT_ANNOATAION_TRAJECTORIES.update(
+            [listObj[i] for i in frames], self.label_color)
+
+    def record_frames_ids(self, listObj, frames):
+        """
+        Summary:
+            Record the frames of each id (id_frames_rec) from some frames of the tracking results,
+            the ids that are no longer in these frames are removed from them.
+
+        Args:
+            listObj (list): the tracking results
+            frames (list): indices of the frames in listObj
+        """
+
+        frame_idxs = {listObj[i]['frame_idx'] for i in frames}
+        for key in list(self.id_frames_rec.keys()):
+            self.id_frames_rec[key] -= frame_idxs
+            if len(self.id_frames_rec[key]) == 0:
+                del self.id_frames_rec[key]
+
         for i in frames:
             listobjframe = listObj[i]['frame_idx']
             for object in listObj[i]['frame_data']:
                 id = object['tracker_id']
                 self.minID = min(self.minID, id - 1)
                 self.rec_frame_for_id(id, listobjframe)
-                label = object['class_name']
-                label_ascii = sum([ord(c) for c in label])
-                idx = label_ascii % len(color_palette)
-                color = color_palette[idx]
-                center = mathOps.centerOFmass(object['segment'])
-                try:
-                    centers_rec = self.CURRENT_ANNOATAION_TRAJECTORIES['id_' + str(
-                        id)]
-
-                    try:
-                        (xp, yp) = centers_rec[listobjframe - 2]
-                        (xn, yn) = center
-                        if (xp == -1 or xn == -1):
-                            c = 5 / 0
-                        r = 0.5
-                        x = r * xn + (1 - r) * xp
-                        y = r * yn + (1 - r) * yp
-                        center = (int(x), int(y))
-                    except:
-                        pass
-                    centers_rec[listobjframe - 1] = center
-                    self.CURRENT_ANNOATAION_TRAJECTORIES['id_' +
-                                                         str(id)] = centers_rec
-                    self.CURRENT_ANNOATAION_TRAJECTORIES['id_color_' + str(
-                        id)] = color
-                except:
-                    centers_rec = [(-1, - 1)] * int(self.TOTAL_VIDEO_FRAMES)
-                    centers_rec[listobjframe - 1] = center
-                    self.CURRENT_ANNOATAION_TRAJECTORIES['id_' +
-                                                         str(id)] = centers_rec
-                    self.CURRENT_ANNOATAION_TRAJECTORIES['id_color_' + str(
-                        id)] = color
+
+    def label_color(self, label):
+        label_ascii = sum([ord(c) for c in label])
+        idx = label_ascii % len(color_palette)
+        return color_palette[idx]
+
+    def trajectories_file_name(self):
+        return f'{self.CURRENT_VIDEO_PATH}/{self.CURRENT_VIDEO_NAME}_trajectories.npz'
+
+    def load_trajectories(self):
+        """
+        Summary:
+            Load the trajectories saved with the tracking results of the video,
+            or calculate them if the tracking results changed since they were saved.
+            The frames of each id are always recorded from the tracking results,
+            the saved file only gives the centers.
+        """
+        json_file_name = f'{self.CURRENT_VIDEO_PATH}/{self.CURRENT_VIDEO_NAME}_tracking_results.json'
+        trajectories = Trajectories.load(
+            self.trajectories_file_name(), compact_format.resolve(json_file_name),
+            self.CURRENT_ANNOATAION_TRAJECTORIES.length, self.CURRENT_ANNOATAION_TRAJECTORIES.alpha)
+        if trajectories is None:
+            self.calculate_trajectories()
+            return
+        self.CURRENT_ANNOATAION_TRAJECTORIES = trajectories
+        listObj = self.load_objects_from_json__orjson()
+        self.record_frames_ids(listObj, range(len(listObj)))
+
+    def save_trajectories(self):
+        # the trajectories are saved with the signature of the tracking results, so they are only used with them
+        if self.current_annotation_mode != "video":
+            return
+        json_file_name = f'{self.CURRENT_VIDEO_PATH}/{self.CURRENT_VIDEO_NAME}_tracking_results.json'
+        try:
+            self.CURRENT_ANNOATAION_TRAJECTORIES.save(
+                self.trajectories_file_name(), compact_format.resolve(json_file_name))
+        except Exception as e:
+            print(f"Error saving the trajectories: {e}")
 
     def right_click_menu(self):
         """
@@ -3463,8 +3525,9 @@ class MainWindow(QtWidgets.QMainWindow):
                 self.menus.edit, (self.actions.menu[i] for i in image_menu_list))
 
     def reset_for_new_mode(self, mode):
-        self.CURRENT_ANNOATAION_TRAJECTORIES = {'length': 30,
-                                                'alpha': 0.70}
+        self.save_trajectories()
+        self.samPrecomputer.cancel()
+        self.CURRENT_ANNOATAION_TRAJECTORIES = Trajectories()
         self.key_frames.clear()
         self.id_frames_rec.clear()
 
@@ -3472,10 +3535,13 @@ class MainWindow(QtWidgets.QMainWindow):
             self.canvas.deleteShape(shape)
 
         self.resetState()
+        # a directory still being scanned does not fill the file list of the new mode
+        self.stopDirScan()
 
         self.CURRENT_SHAPES_IN_IMG = []
         self.image = QtGui.QImage()
         self.CURRENT_FRAME_IMAGE = None
+        self.CURRENT_FRAME_TOKEN = None
 
         self.current_annotation_mode = mode
         self.canvas.current_annotation_mode = mode
@@ -3505,13 +3571,14 @@ class MainWindow(QtWidgets.QMainWindow):
             self.uniqLabelList.clear()
             self.reset_for_new_mode("video")
 
+            self.CURRENT_VIDEO_FILE = videoFile[0]
             self.CURRENT_VIDEO_NAME = videoFile[0].split(
                 ".")[-2].split("/")[-1]
             self.CURRENT_VIDEO_PATH = "/".join(
                 videoFile[0].split(".")[-2].split("/")[:-1])
 
             json_file_name = f'{self.CURRENT_VIDEO_PATH}/{self.CURRENT_VIDEO_NAME}_tracking_results.json'
-            if os.path.exists(json_file_name):
+            if os.path.exists(compact_format.resolve(json_file_name)):
                 self.actions.export.setEnabled(True)
             else:
                 self.actions.export.setEnabled(False)
@@ -3533,9 +3600,18 @@ class MainWindow(QtWidgets.QMainWindow):
             # self.addToolBarBreak
             self.set_video_controls_visibility(True)
 
+            # camera motion is estimated once per frame and cached for re-tracking
+            self.cmc = CMCService(
+                method=self._config["tracking"]["cmc_method"],
+                pyramid_levels=self._config["tracking"]["cmc_pyramid_levels"],
+                cache_path=f'{self.CURRENT_VIDEO_PATH}/{self.CURRENT_VIDEO_NAME}_cmc.pkl')
+            # detections are cached so the video can be re-tracked without running the detector
+            self.detection_cache = DetectionCache(
+                f'{self.CURRENT_VIDEO_PATH}/{self.CURRENT_VIDEO_NAME}_detections.npz')
+
             self.update_tracking_method()
 
-            self.calculate_trajectories()
+            self.load_trajectories()
             keys = list(self.id_frames_rec.keys())
             idsORG = [int(keys[i][3:]) for i in range(len(keys))]
             if len(idsORG) > 0:
@@ -3605,6 +3681,7 @@ class MainWindow(QtWidgets.QMainWindow):
         self.imageData = frame_array.data
 
         self.CURRENT_FRAME_IMAGE = frame_array
+        self.CURRENT_FRAME_TOKEN = video_frame_token(self.CURRENT_VIDEO_FILE, index)
         image = QtGui.QImage(self.imageData, self.imageData.shape[1], self.imageData.shape[0],
                              QtGui.QImage.Format.Format_BGR888)
         self.image = image
@@ -3631,7 +3708,7 @@ class MainWindow(QtWidgets.QMainWindow):
 
             else:
                 json_file_name = f'{self.CURRENT_VIDEO_PATH}/{self.CURRENT_VIDEO_NAME}_tracking_results.json'
-                if os.path.exists(json_file_name):
+                if os.path.exists(compact_format.resolve(json_file_name)):
                     self.load_shapes_for_video_frame(json_file_name, index)
                     image = self.draw_bb_on_image(
                         image, self.CURRENT_SHAPES_IN_IMG)
@@ -3747,6 +3824,10 @@ class MainWindow(QtWidgets.QMainWindow):
         self.INDEX_OF_CURRENT_FRAME = frame_idx
         self.CAP.set(cv2.CAP_PROP_POS_FRAMES, frame_idx - 1)
 
+        # the embeddings of the current and the next frames are computed in the background
+        self.samPrecomputer.request(self.CURRENT_VIDEO_FILE, range(
+            frame_idx, min(frame_idx + self._config["sam"]["precompute_frames"], self.TOTAL_VIDEO_FRAMES) + 1))
+
         # setting text of labels
         fps = self.CAP.get(cv2.CAP_PROP_FPS)
         zeros = (int(np.log10(self.TOTAL_VIDEO_FRAMES + 0.9)) -
@@ -3825,6 +3906,13 @@ class MainWindow(QtWidgets.QMainWindow):
         self.selected_option = index
 
     def start_tracking_button_clicked(self):
+        if self.selected_option == 4:
+            # no fallback to the detector tracking, the user asked for SAM
+            try:
+                self.propagate_with_sam()
+            except Exception as e:
+                MsgBox.OKmsgBox("Error", f"Error: {e}", "critical")
+            return
         try:
             try:
                 if self.selected_option == 0:
@@ -3833,6 +3921,8 @@ class MainWindow(QtWidgets.QMainWindow):
                     self.track_assigned_objects_button_clicked()
                 elif self.selected_option == 2:
                     self.track_full_video_button_clicked()
+                elif self.selected_option == 3:
+                    self.track_from_detection_cache()
             except Exception as e:
                 self.track_buttonClicked()
         except Exception as e:
@@ -3860,11 +3950,15 @@ class MainWindow(QtWidgets.QMainWindow):
 
         self.TrackingMode = True
         curr_frame, prev_frame = None, None
+        prev_frame_idx = None
+        self.cmc.reset()
+        self.detection_cache.set_signature(self.detection_settings_signature())
 
         if self.FRAMES_TO_TRACK + self.INDEX_OF_CURRENT_FRAME <= self.TOTAL_VIDEO_FRAMES:
             number_of_frames_to_track = self.FRAMES_TO_TRACK
         else:
             number_of_frames_to_track = self.TOTAL_VIDEO_FRAMES - self.INDEX_OF_CURRENT_FRAME
+        start = self.INDEX_OF_CURRENT_FRAME
 
         self.interrupted = False
         for i in range(number_of_frames_to_track):
@@ -3874,6 +3968,7 @@ class MainWindow(QtWidgets.QMainWindow):
                 break
             if i % 100 == 0:
                 self.load_objects_to_json__orjson(listObj)
+                self.detection_cache.save()
             self.tracking_progress_bar.setValue(
                 int((i + 1) / number_of_frames_to_track * 100))
 
@@ -3881,57 +3976,28 @@ class MainWindow(QtWidgets.QMainWindow):
                 existing_annotation = False
                 shapes = self.canvas.shapes
                 shapes = mathOps.convert_qt_shapes_to_shapes(shapes)
+                # cached as the detections of the frame, so it can be re-tracked from it
+                self.detection_cache.put(self.INDEX_OF_CURRENT_FRAME, shapes)
             else:
-                with torch.no_grad():
-                    shapes = self.annotate_one(called_from_tracking=True)
+                shapes = self.detection_cache.get(self.INDEX_OF_CURRENT_FRAME)
+                if shapes is None:
+                    with torch.no_grad():
+                        shapes = self.annotate_one(called_from_tracking=True)
+                    if shapes is not None:
+                        self.detection_cache.put(self.INDEX_OF_CURRENT_FRAME, shapes)
 
             curr_frame = self.CURRENT_FRAME_IMAGE
             if len(shapes) == 0:
+                # the results of a previous run in this frame are replaced too
+                listObj[self.INDEX_OF_CURRENT_FRAME - 1] = self.shapes_to_json_frame(
+                    [], self.INDEX_OF_CURRENT_FRAME)
                 self.update_gui_after_tracking(i)
                 continue
 
-            for shape in shapes:
-                if shape['content'] is None:
-                    shape['content'] = 1.0
-            boxes, confidences, class_ids, segments = mathOps.get_boxes_conf_classids_segments(
-                shapes)
-
-            boxes = np.array(boxes, dtype=int)
-            confidences = np.array(confidences)
-            class_ids = np.array(class_ids)
-            detections = Detections(
-                xyxy=boxes,
-                confidence=confidences,
-                class_id=class_ids,
-            )
-            boxes = torch.from_numpy(detections.xyxy)
-            confidences = torch.from_numpy(detections.confidence)
-            class_ids = torch.from_numpy(detections.class_id)
-
-            dets = torch.cat((boxes, confidences.unsqueeze(
-                1), class_ids.unsqueeze(1)), dim=1)
-            dets = dets.to(torch.float32)
-            if hasattr(self.tracker, 'tracker') and hasattr(self.tracker.tracker, 'camera_update'):
-                if prev_frame is not None and curr_frame is not None:  # camera motion compensation
-                    self.tracker.tracker.camera_update(prev_frame, curr_frame)
+            shapes = self.track_shapes(shapes, curr_frame, self.INDEX_OF_CURRENT_FRAME,
+                                       prev_frame, prev_frame_idx)
             prev_frame = curr_frame
-            with torch.no_grad():
-                org_tracks = self.tracker.update(
-                    dets.cpu(), self.CURRENT_FRAME_IMAGE)
-
-            tracks = []
-            for org_track in org_tracks:
-                track = []
-                for i in range(6):
-                    track.append(int(org_track[i]))
-                track[4] += int(self.maxID)
-                track.append(org_track[6])
-
-                tracks.append(track)
-
-            matched_shapes, unmatched_shapes = mathOps.match_detections_with_tracks(
-                shapes, tracks)
-            shapes = matched_shapes
+            prev_frame_idx = self.INDEX_OF_CURRENT_FRAME
 
             self.CURRENT_SHAPES_IN_IMG = [
                 shape_ for shape_ in shapes if shape_["group_id"] is not None]
@@ -3954,36 +4020,18 @@ class MainWindow(QtWidgets.QMainWindow):
 
                     return
 
-            # to understand the json output file structure it is a dictionary of frames and each frame is a dictionary of tracker_ids and each tracker_id is a dictionary of bbox , confidence , class_id , segment
-            json_frame = {}
-            json_frame.update({'frame_idx': self.INDEX_OF_CURRENT_FRAME})
-            json_frame_object_list = []
-            for shape in self.CURRENT_SHAPES_IN_IMG:
-                self.rec_frame_for_id(
-                    int(shape["group_id"]), self.INDEX_OF_CURRENT_FRAME, type_='add')
-                json_tracked_object = {}
-                json_tracked_object['tracker_id'] = int(shape["group_id"])
-                json_tracked_object['bbox'] = [int(i) for i in shape['bbox']]
-                json_tracked_object['confidence'] = shape["content"]
-                json_tracked_object['class_name'] = shape["label"]
-                json_tracked_object['class_id'] = coco_classes.index(
-                    shape["label"]) if shape["label"] in coco_classes else -1
-                points = shape["points"]
-                segment = [[int(points[z]), int(points[z + 1])]
-                           for z in range(0, len(points), 2)]
-                json_tracked_object['segment'] = segment
-
-                json_frame_object_list.append(json_tracked_object)
-
-            json_frame.update({'frame_data': json_frame_object_list})
-
-            listObj[self.INDEX_OF_CURRENT_FRAME - 1] = json_frame
+            listObj[self.INDEX_OF_CURRENT_FRAME - 1] = self.shapes_to_json_frame(
+                self.CURRENT_SHAPES_IN_IMG, self.INDEX_OF_CURRENT_FRAME)
 
             QtWidgets.QApplication.processEvents()
             self.update_gui_after_tracking(i)
             print('finished tracking for frame ', self.INDEX_OF_CURRENT_FRAME)
             
         self.load_objects_to_json__orjson(listObj)
+        # the ids replaced by the tracking no longer have these frames or their centers in them
+        self.calculate_trajectories(range(start - 1, self.INDEX_OF_CURRENT_FRAME), listObj)
+        self.cmc.dump_cache()
+        self.detection_cache.save()
 
         # Notify the user that the tracking is finished
         self._config = get_config()
@@ -4007,6 +4055,277 @@ class MainWindow(QtWidgets.QMainWindow):
             self.TOTAL_VIDEO_FRAMES - self.INDEX_OF_CURRENT_FRAME)
         self.track_buttonClicked()
 
+    def propagate_with_sam(self):
+        """
+        Summary:
+            Track the objects of the current frame (the selected ones if any) for the frames to track
+            with SAM only (see `SamPropagator`), so objects the detector does not know can be tracked.
+        """
+
+        if self.sam_model_comboBox.currentText() == "Select Model (SAM disabled)":
+            MsgBox.OKmsgBox("SAM is disabled",
+                            f"SAM is disabled.\nPlease enable SAM.")
+            return
+
+        self.update_current_frame_annotation()
+        listObj = self.load_objects_from_json__orjson()
+        start = self.INDEX_OF_CURRENT_FRAME
+        selected = [shape.group_id for shape in self.canvas.selectedShapes]
+        objects = {object_['tracker_id']: object_ for object_ in listObj[start - 1]['frame_data']
+                   if len(selected) == 0 or object_['tracker_id'] in selected}
+        if len(objects) == 0:
+            MsgBox.OKmsgBox("No objects to propagate",
+                            "There are no annotated objects with IDs in this frame to propagate.", "warning")
+            return
+        number_of_frames = min(self.FRAMES_TO_TRACK, self.TOTAL_VIDEO_FRAMES - start)
+
+        self.actions.export.setEnabled(False)
+        self.tracking_progress_bar.setVisible(True)
+        last_frame_idx = start
+        try:
+            propagator = SamPropagator(self.sam_predictor)
+            propagator.start(self.CURRENT_FRAME_IMAGE, self.CURRENT_FRAME_TOKEN,
+                             {id: object_['segment'] for id, object_ in objects.items()})
+            # the embeddings of the next frames are computed in the background while a frame is processed
+            self.samPrecomputer.request(self.CURRENT_VIDEO_FILE, range(start + 1, start + number_of_frames + 1))
+            self.CAP.set(cv2.CAP_PROP_POS_FRAMES, start)
+
+            self.interrupted = False
+            for i, frame_idx in enumerate(range(start + 1, start + number_of_frames + 1)):
+                self.tracking_progress_bar.setValue(int((i + 1) / number_of_frames * 100))
+                QtWidgets.QApplication.processEvents()
+                if self.interrupted:
+                    self.interrupted = False
+                    break
+                success, frame = self.CAP.read()
+                if not success:
+                    break
+                results = propagator.step(frame, video_frame_token(self.CURRENT_VIDEO_FILE, frame_idx))
+                if len(results) == 0:
+                    break
+
+                # the propagated objects replace the objects with the same ids in the frame
+                frame_data = [object_ for object_ in listObj[frame_idx - 1]['frame_data']
+                              if object_['tracker_id'] not in results]
+                for id, (bbox, polygon, score) in results.items():
+                    current = copy.deepcopy(objects[id])
+                    current['bbox'] = [int(x) for x in bbox]
+                    current['segment'] = [[int(x), int(y)] for x, y in polygon]
+                    current['confidence'] = str(round(score, 2))
+                    frame_data.append(current)
+                    self.rec_frame_for_id(id, frame_idx)
+                listObj[frame_idx - 1]['frame_data'] = frame_data
+                last_frame_idx = frame_idx
+        except Exception as e:
+            MsgBox.OKmsgBox("SAM Propagation Error",
+                            f"Error in propagating the objects with SAM (the frames before are kept):\n{e}", "critical")
+        else:
+            # Notify the user that the propagation is finished
+            self._config = get_config()
+            if not self._config["mute"]:
+                if not self.isActiveWindow():
+                    notification.PopUp("SAM Propagation Completed")
+        finally:
+            # the frames propagated before an error or an interruption are saved
+            self.load_objects_to_json__orjson(listObj)
+            self.calculate_trajectories(range(start - 1, last_frame_idx), listObj)
+            self.tracking_progress_bar.hide()
+            self.tracking_progress_bar.setValue(0)
+            self.actions.export.setEnabled(True)
+
+        self.main_video_frames_slider.setValue(last_frame_idx)
+        self.main_video_frames_slider_changed()
+
+    def track_shapes(self, shapes, frame, frame_idx, prev_frame=None, prev_frame_idx=None):
+        """
+        Summary:
+            Run the tracker on the detections of one frame and give the detections their track ids.
+
+        Args:
+            shapes (list): detections of the frame (NOT QT shapes)
+            frame (np.ndarray): the frame (BGR), None if the tracker does not need it
+            frame_idx (int): index of the frame
+            prev_frame (np.ndarray): the previously tracked frame (for camera motion compensation)
+            prev_frame_idx (int): index of the previously tracked frame
+
+        Returns:
+            shapes (list): the detections matched with a track, with the track id as group_id
+        """
+
+        for shape in shapes:
+            if shape['content'] is None:
+                shape['content'] = 1.0
+        boxes, confidences, class_ids, segments = mathOps.get_boxes_conf_classids_segments(
+            shapes)
+
+        boxes = np.array(boxes, dtype=int)
+        confidences = np.array(confidences)
+        class_ids = np.array(class_ids)
+        detections = Detections(
+            xyxy=boxes,
+            confidence=confidences,
+            class_id=class_ids,
+        )
+        boxes = torch.from_numpy(detections.xyxy)
+        confidences = torch.from_numpy(detections.confidence)
+        class_ids = torch.from_numpy(detections.class_id)
+
+        dets = torch.cat((boxes, confidences.unsqueeze(
+            1), class_ids.unsqueeze(1)), dim=1)
+        dets = dets.to(torch.float32)
+        if prev_frame is not None and frame is not None:  # camera motion compensation
+            warp = self.cmc.compute(prev_frame, frame, prev_frame_idx,
+                                    frame_idx, detections=detections.xyxy)
+            self.cmc.apply(self.tracker, warp)
+        with torch.no_grad():
+            org_tracks = self.tracker.update(dets.cpu(), frame)
+
+        tracks = []
+        for org_track in org_tracks:
+            track = []
+            for i in range(6):
+                track.append(int(org_track[i]))
+            track[4] += int(self.maxID)
+            track.append(org_track[6])
+
+            tracks.append(track)
+
+        matched_shapes, unmatched_shapes = mathOps.match_detections_with_tracks(
+            shapes, tracks)
+        return matched_shapes
+
+    def shapes_to_json_frame(self, shapes, frame_idx):
+        """
+        Summary:
+            Convert the tracked shapes of a frame to a frame of the tracking results json
+            and record the frame for their ids.
+
+        Args:
+            shapes (list): tracked shapes (NOT QT shapes)
+            frame_idx (int): index of the frame
+
+        Returns:
+            json_frame (dict): dictionary with keys (frame_idx, frame_data)
+        """
+
+        # to understand the json output file structure it is a dictionary of frames and each frame is a dictionary of tracker_ids and each tracker_id is a dictionary of bbox , confidence , class_id , segment
+        json_frame = {}
+        json_frame.update({'frame_idx': frame_idx})
+        json_frame_object_list = []
+        for shape in shapes:
+            self.rec_frame_for_id(
+                int(shape["group_id"]), frame_idx, type_='add')
+            json_tracked_object = {}
+            json_tracked_object['tracker_id'] = int(shape["group_id"])
+            json_tracked_object['bbox'] = [int(i) for i in shape['bbox']]
+            json_tracked_object['confidence'] = shape["content"]
+            json_tracked_object['class_name'] = shape["label"]
+            json_tracked_object['class_id'] = coco_classes.index(
+                shape["label"]) if shape["label"] in coco_classes else -1
+            points = shape["points"]
+            segment = [[int(points[z]), int(points[z + 1])]
+                       for z in range(0, len(points), 2)]
+            json_tracked_object['segment'] = segment
+
+            json_frame_object_list.append(json_tracked_object)
+
+        json_frame.update({'frame_data': json_frame_object_list})
+        return json_frame
+
+    def detection_settings_signature(self):
+        """
+        Summary:
+            Describe the settings the detections of annotate_one depend on,
+            the detection cache is only reused while they don't change.
+        """
+
+        helper = self.intelligenceHelper
+        return json.dumps({
+            "models": sorted(helper.selectedmodels) if self.multi_model_flag else [helper.current_model_name],
+            "conf_threshold": helper.conf_threshold,
+            "iou_threshold": helper.iou_threshold,
+            "classes": sorted(int(c) for c in helper.selectedclasses.keys()),
+            "area": [[float(x), float(y)] for x, y in self.canvas.tracking_area_polygon],
+        })
+
+    def track_from_detection_cache(self):
+        """
+        Summary:
+            Re-track the frames to track from the cached detections of a previous tracking run,
+            without running the detector or redrawing the canvas for every frame.
+            Video frames are only decoded if the tracker needs them (ReID or camera motion compensation).
+        """
+
+        if self.detection_cache.signature != self.detection_settings_signature() or \
+                self.INDEX_OF_CURRENT_FRAME not in self.detection_cache:
+            MsgBox.OKmsgBox("No Cached Detections",
+                            "There are no cached detections for this frame with the current detection settings.\n"
+                            "Track the video once, then it can be re-tracked from the cached detections.", "warning")
+            return
+
+        # start from a fresh tracker so the results don't depend on previous runs
+        self.update_tracking_method(self.tracking_method)
+
+        self.actions.export.setEnabled(False)
+        self.tracking_progress_bar.setVisible(True)
+        listObj = self.load_objects_from_json__orjson()
+
+        start = self.INDEX_OF_CURRENT_FRAME
+        if self.FRAMES_TO_TRACK + start <= self.TOTAL_VIDEO_FRAMES:
+            number_of_frames_to_track = self.FRAMES_TO_TRACK
+        else:
+            number_of_frames_to_track = self.TOTAL_VIDEO_FRAMES - start
+
+        needs_frames = hasattr(self.tracker, 'model') or hasattr(
+            self.tracker, 'embedder') or self.cmc.method != 'none'
+        if needs_frames:
+            self.CAP.set(cv2.CAP_PROP_POS_FRAMES, start - 1)
+        self.cmc.reset()
+
+        prev_frame, prev_frame_idx = None, None
+        last_frame_idx = start
+        self.interrupted = False
+        for i, frame_idx in enumerate(range(start, start + number_of_frames_to_track)):
+            if i % 50 == 0:
+                self.tracking_progress_bar.setValue(
+                    int((i + 1) / number_of_frames_to_track * 100))
+                QtWidgets.QApplication.processEvents()
+            if self.interrupted:
+                self.interrupted = False
+                break
+            shapes = self.detection_cache.get(frame_idx)
+            if shapes is None:
+                print(f'No cached detections for frame {frame_idx}, stopping')
+                break
+            frame = None
+            if needs_frames:
+                success, frame = self.CAP.read()
+                if not success:
+                    break
+            last_frame_idx = frame_idx
+            if len(shapes) == 0:
+                # the results of the previous tracker in this frame are replaced too
+                listObj[frame_idx - 1] = self.shapes_to_json_frame([], frame_idx)
+                continue
+
+            shapes = self.track_shapes(shapes, frame, frame_idx, prev_frame, prev_frame_idx)
+            prev_frame, prev_frame_idx = frame, frame_idx
+            shapes = [shape_ for shape_ in shapes if shape_["group_id"] is not None]
+            listObj[frame_idx - 1] = self.shapes_to_json_frame(shapes, frame_idx)
+
+        self.load_objects_to_json__orjson(listObj)
+        self.cmc.dump_cache()
+        self.calculate_trajectories(range(start - 1, last_frame_idx), listObj)
+        print(f'finished tracking frames {start} to {last_frame_idx} from cached detections')
+
+        self.labelFile = None
+        self.main_video_frames_slider.setValue(last_frame_idx - 1)
+        self.main_video_frames_slider.setValue(last_frame_idx)
+
+        self.tracking_progress_bar.hide()
+        self.tracking_progress_bar.setValue(0)
+        self.actions.export.setEnabled(True)
+
     def set_video_controls_visibility(self, visible=False):
         # make it invisible by default
         self.videoControls.setVisible(visible)
@@ -4161,8 +4480,7 @@ class MainWindow(QtWidgets.QMainWindow):
 
     def clear_video_annotations_button_clicked(self):
         self.global_listObj = []
-        self.CURRENT_ANNOATAION_TRAJECTORIES = {'length': 30,
-                                                'alpha': 0.70}
+        self.CURRENT_ANNOATAION_TRAJECTORIES = Trajectories()
         self.key_frames.clear()
         self.id_frames_rec.clear()
         self.minID = -2
@@ -4177,8 +4495,9 @@ class MainWindow(QtWidgets.QMainWindow):
         # to delete the json file we need to know the name of the json file which is the same as the video name
         json_file_name = f'{self.CURRENT_VIDEO_PATH}/{self.CURRENT_VIDEO_NAME}_tracking_results.json'
         # now delete the json file if it exists
-        if os.path.exists(json_file_name):
-            os.remove(json_file_name)
+        for file_name in [json_file_name, compact_format.sidecar_path(json_file_name), self.trajectories_file_name()]:
+            if os.path.exists(file_name):
+                os.remove(file_name)
         MsgBox.OKmsgBox("clear annotations",
                         "All video frames annotations are cleared")
         self.main_video_frames_slider.setValue(2)
@@ -4234,12 +4553,15 @@ class MainWindow(QtWidgets.QMainWindow):
         listObj[self.INDEX_OF_CURRENT_FRAME - 1] = json_frame
         
         self.load_objects_to_json__orjson(listObj)
+        # the ids deleted from the frame no longer have it or their center in it
+        self.record_frames_ids(listObj, [self.INDEX_OF_CURRENT_FRAME - 1])
+        self.CURRENT_ANNOATAION_TRAJECTORIES.update([json_frame], self.label_color)
         print("saved frame annotation")
 
     def trajectory_length_lineEdit_changed(self):
         try:
             text = self.trajectory_length_lineEdit.text()
-            self.CURRENT_ANNOATAION_TRAJECTORIES['length'] = int(
+            self.CURRENT_ANNOATAION_TRAJECTORIES.length = int(
                 text) if text != '' else 1
             self.main_video_frames_slider_changed()
         except:
@@ -4393,7 +4715,7 @@ class MainWindow(QtWidgets.QMainWindow):
 
         self.track_dropdown = QtWidgets.QComboBox()
         self.track_dropdown.addItems(
-            [f"Track for selected frames", "Track Only assigned objects", "Track Full Video"])
+            [f"Track for selected frames", "Track Only assigned objects", "Track Full Video", "Re-track from Cached Detections", "Propagate with SAM"])
         self.track_dropdown.setCurrentIndex(0)
         self.track_dropdown.currentIndexChanged.connect(
             self.track_dropdown_changed)
@@ -4470,7 +4792,7 @@ class MainWindow(QtWidgets.QMainWindow):
         self.traj_checkBox.setChecked(False)
         self.traj_checkBox.stateChanged.connect(self.traj_checkBox_changed)
 
-        # make qlineedit to alter the  self.CURRENT_ANNOATAION_TRAJECTORIES['length']  value
+        # make qlineedit to alter the  self.CURRENT_ANNOATAION_TRAJECTORIES.length  value
         self.trajectory_length_lineEdit = QtWidgets.QLineEdit()
         self.trajectory_length_lineEdit.setText(str(30))
         self.trajectory_length_lineEdit.setMaximumWidth(50)
@@ -4724,6 +5046,22 @@ class MainWindow(QtWidgets.QMainWindow):
             self.sam_reset_button_clicked)
         self.sam_toolbar.addWidget(self.sam_close_button)
 
+        # add a button for segmenting everything in the image with SAM
+        self.sam_segment_everything_button = QtWidgets.QPushButton()
+        self.sam_segment_everything_button.setStyleSheet(
+            "QPushButton { font-size: 10pt; font-weight: bold; }")
+        self.sam_segment_everything_button.setText("Everything")
+        # add icon to button
+        self.sam_segment_everything_button.setIcon(
+            QtGui.QIcon("labelme/icons/SAM.png"))
+        # make the icon bigger
+        self.sam_segment_everything_button.setIconSize(QtCore.QSize(24, 24))
+        self.sam_segment_everything_button.setToolTip(
+            'Segment Everything in the Image with SAM')
+        self.sam_segment_everything_button.clicked.connect(
+            self.sam_segment_everything_button_clicked)
+        self.sam_toolbar.addWidget(self.sam_segment_everything_button)
+
         # add a point of replace with SAM
         self.sam_enhance_annotation_button = QtWidgets.QPushButton()
         self.sam_enhance_annotation_button.setAccessibleName(
@@ -4765,23 +5103,26 @@ class MainWindow(QtWidgets.QMainWindow):
             return
         try:
             same_image = self.sam_predictor.check_image(
-                self.CURRENT_FRAME_IMAGE)
+                self.CURRENT_FRAME_IMAGE, self.CURRENT_FRAME_TOKEN)
         except:
             return
 
-        toBeEnhanced = self.canvas.selectedShapes if len(
-            self.canvas.selectedShapes) > 0 else self.canvas.shapes
+        toBeEnhanced = list(self.canvas.selectedShapes if len(
+            self.canvas.selectedShapes) > 0 else self.canvas.shapes)
 
+        shapesX = []
         for shape in toBeEnhanced:
             try:
                 self.canvas.shapes.remove(shape)
                 self.remLabels([shape])
             except:
                 return
-            shapeX = mathOps.convert_qt_shapes_to_shapes([shape])[0]
-            x1, y1, x2, y2 = shapeX["bbox"]
-            cur_bbox, cur_segment = self.sam_enhanced_bbox_segment(
-                self.CURRENT_FRAME_IMAGE, [x1, y1, x2, y2], 1.2, max_itr=5, forSHAPE=True)
+            shapesX.append(mathOps.convert_qt_shapes_to_shapes([shape])[0])
+
+        # all the shapes are enhanced together
+        results = self.sam_enhanced_bboxes_segments(
+            self.CURRENT_FRAME_IMAGE, [list(shapeX["bbox"]) for shapeX in shapesX], 1.2, max_itr=5, forSHAPE=True)
+        for shapeX, (cur_bbox, cur_segment) in zip(shapesX, results):
             shapeX["points"] = cur_segment
             shapeX = mathOps.convert_shapes_to_qt_shapes([shapeX])[0]
             self.canvas.shapes.append(shapeX)
@@ -4795,6 +5136,45 @@ class MainWindow(QtWidgets.QMainWindow):
 
         self.sam_buttons_colors("X")
 
+    def sam_segment_everything_button_clicked(self):
+        if self.sam_model_comboBox.currentText() == "Select Model (SAM disabled)":
+            MsgBox.OKmsgBox("SAM is disabled",
+                            "SAM is disabled.\nPlease enable SAM.")
+            return
+        if self.current_annotation_mode == "video":
+            MsgBox.OKmsgBox("Segment Everything",
+                            "Segment everything is only available for images.", "warning")
+            return
+        if self.CURRENT_FRAME_IMAGE is None:
+            return
+
+        # the settings of the automatic mask generator (tile_size: tiled mode for large images)
+        config = self._config["sam"]
+        self.waitWindow(
+            visible=True, text=f'Please Wait.\nSAM is segmenting everything...')
+        try:
+            shapes = self.sam_predictor.get_all_shapes(
+                self.CURRENT_FRAME_IMAGE,
+                iou_threshold=config["everything_iou_threshold"],
+                points_per_side=config["everything_points_per_side"],
+                points_per_batch=config["everything_points_per_batch"],
+                crop_n_layers=config["everything_crop_n_layers"],
+                tile_size=config["everything_tile_size"],
+                tile_overlap=config["everything_tile_overlap"],
+                nms_thresh=config["everything_nms_thresh"])
+        except Exception as e:
+            self.waitWindow()
+            MsgBox.OKmsgBox("Error", f"Error: {e}", "critical")
+            return
+        self.waitWindow()
+
+        for shape in mathOps.convert_shapes_to_qt_shapes(shapes):
+            self.canvas.shapes.append(shape)
+            self.addLabel(shape)
+        self.sam_clear_annotation_button_clicked()
+        self.refresh_image_MODE()
+        self.sam_buttons_colors("X")
+
     def sam_models(self):
         cwd = os.getcwd()
         with open(cwd + '/models_menu/sam_models.json') as f:
@@ -4814,6 +5194,8 @@ class MainWindow(QtWidgets.QMainWindow):
         self.sam_buttons_colors("X")
         if self.sam_model_comboBox.currentText() == "Select Model (SAM disabled)":
             self.set_sam_toolbar_enable(False)
+            self.imagePrefetcher.sam_predictor = None
+            self.samPrecomputer.set_predictor(None)
             return
         model_type = self.sam_model_comboBox.currentText()
         self.waitWindow(
@@ -4824,11 +5206,32 @@ class MainWindow(QtWidgets.QMainWindow):
         for model in data:
             if model['name'] == model_type:
                 checkpoint_path = model['checkpoint']
+                # the registry key of the model if it is not its name
+                registry_type = model.get('model_type', model_type)
         if checkpoint_path != "":
-            self.sam_predictor = Sam_Predictor(
-                model_type, checkpoint_path, device)
+            try:
+                self.sam_predictor = Sam_Predictor(
+                    registry_type, checkpoint_path, device, cache=self.samEmbeddingCache,
+                    encoder_backend=self._config["sam"]["encoder_backend"],
+                    decoder_backend=self._config["sam"]["decoder_backend"],
+                    num_threads=self._config["sam"]["num_threads"])
+            except Exception as e:
+                # a missing optional package (mobile_sam, onnxruntime) or a bad checkpoint
+                self.waitWindow()
+                MsgBox.OKmsgBox("Error", f"Could not load {model_type}:\n{e}", "critical")
+                self.sam_model_comboBox.blockSignals(True)
+                self.sam_model_comboBox.setCurrentIndex(0)
+                self.sam_model_comboBox.blockSignals(False)
+                self.set_sam_toolbar_enable(False)
+                self.imagePrefetcher.sam_predictor = None
+                self.samPrecomputer.set_predictor(None)
+                return
+            if self._config["prefetch"]["sam_embedding"]:
+                self.imagePrefetcher.sam_predictor = self.sam_predictor
+            if self._config["sam"]["precompute"]:
+                self.samPrecomputer.set_predictor(self.sam_predictor)
         try:
-            self.sam_predictor.set_new_image(self.CURRENT_FRAME_IMAGE)
+            self.sam_predictor.set_new_image(self.CURRENT_FRAME_IMAGE, self.CURRENT_FRAME_TOKEN)
         except:
             print("please open an image first")
             self.waitWindow()
@@ -4862,6 +5265,7 @@ class MainWindow(QtWidgets.QMainWindow):
         self.sam_select_rect_button.setEnabled(setEnabled)
         self.sam_clear_annotation_button.setEnabled(setEnabled)
         self.sam_finish_annotation_button.setEnabled(setEnabled)
+        self.sam_segment_everything_button.setEnabled(setEnabled)
 
     def set_sam_toolbar_colors(self, mode):
         red, green, blue, trans = "#2D7CFA;", "#2D7CFA;", "#2D7CFA;", "#4B515A;"
@@ -4893,6 +5297,8 @@ class MainWindow(QtWidgets.QMainWindow):
             style_sheet_const + finish_style + ";}" + hover_const + finish_hover + ";}" + disabled_const)
         self.sam_enhance_annotation_button.setStyleSheet(
             style_sheet_const + replace_style + ";}" + hover_const + replace_hover + ";}" + disabled_const)
+        self.sam_segment_everything_button.setStyleSheet(
+            style_sheet_const + trans + ";}" + hover_const + blue + ";}" + disabled_const)
 
     def sam_add_point_button_clicked(self):
         self.canvas.cancelManualDrawing()
@@ -4900,7 +5306,7 @@ class MainWindow(QtWidgets.QMainWindow):
         self.sam_buttons_colors("add")
         try:
             same_image = self.sam_predictor.check_image(
-                self.CURRENT_FRAME_IMAGE)
+                self.CURRENT_FRAME_IMAGE, self.CURRENT_FRAME_TOKEN)
         except:
             self.sam_buttons_colors("x")
             return
@@ -4915,7 +5321,7 @@ class MainWindow(QtWidgets.QMainWindow):
         self.sam_buttons_colors("remove")
         try:
             same_image = self.sam_predictor.check_image(
-                self.CURRENT_FRAME_IMAGE)
+                self.CURRENT_FRAME_IMAGE, self.CURRENT_FRAME_TOKEN)
         except:
             self.sam_buttons_colors("x")
             return
@@ -4931,7 +5337,7 @@ class MainWindow(QtWidgets.QMainWindow):
         self.sam_buttons_colors("rect")
         try:
             same_image = self.sam_predictor.check_image(
-                self.CURRENT_FRAME_IMAGE)
+                self.CURRENT_FRAME_IMAGE, self.CURRENT_FRAME_TOKEN)
         except:
             self.sam_buttons_colors("x")
             return
@@ -5033,7 +5439,7 @@ class MainWindow(QtWidgets.QMainWindow):
 
         try:
             same_image = self.sam_predictor.check_image(
-                self.CURRENT_FRAME_IMAGE)
+                self.CURRENT_FRAME_IMAGE, self.CURRENT_FRAME_TOKEN)
         except:
             self.sam_buttons_colors("x")
             return
@@ -5085,36 +5491,31 @@ class MainWindow(QtWidgets.QMainWindow):
         self.canvas.SAM_current = None
 
     def sam_enhanced_bbox_segment(self, frameIMAGE, cur_bbox, thresh, max_itr=5, forSHAPE=False):
-        oldAREA = abs(cur_bbox[2] - cur_bbox[0]) * \
-            abs(cur_bbox[3] - cur_bbox[1])
-        [x1, y1, x2, y2] = [cur_bbox[0], cur_bbox[1],
-                            cur_bbox[2], cur_bbox[3]]
-        listPOINTS = [min(x1, x2), min(y1, y2),
-                      max(x1, x2), max(y1, y2)]
-        listPOINTS = [int(round(x)) for x in listPOINTS]
-        input_boxes = [listPOINTS]
-        mask, score = self.sam_predictor.predict(point_coords=None,
-                                                 point_labels=None,
-                                                 box=input_boxes,
-                                                 image=frameIMAGE)
-        points = mathOps.mask_to_polygons(mask)
-        SAMshape = mathOps.polygon_to_shape(points, score)
-        cur_segment = SAMshape['points']
-        cur_segment = [[int(cur_segment[i]), int(cur_segment[i + 1])]
-                       for i in range(0, len(cur_segment), 2)]
-        cur_bbox = [min(np.array(cur_segment)[:, 0]), min(np.array(cur_segment)[:, 1]),
-                    max(np.array(cur_segment)[:, 0]), max(np.array(cur_segment)[:, 1])]
-        cur_bbox = [int(round(x)) for x in cur_bbox]
-        newAREA = abs(cur_bbox[2] - cur_bbox[0]) * \
-            abs(cur_bbox[3] - cur_bbox[1])
-        bigger, smaller = max(oldAREA, newAREA), min(oldAREA, newAREA)
-        if bigger/smaller < thresh or max_itr == 1:
+        return self.sam_enhanced_bboxes_segments(frameIMAGE, [cur_bbox], thresh, max_itr, forSHAPE)[0]
+
+    def sam_enhanced_bboxes_segments(self, frameIMAGE, bboxes, thresh, max_itr=5, forSHAPE=False):
+        """
+        Summary:
+            Refine the boxes of the current SAM image with SAM (see `Sam_Predictor.refine_boxes`),
+            the boxes are sent to SAM together.
+
+        Args:
+            frameIMAGE (np.ndarray): the image (already set with `check_image`)
+            bboxes (list): the boxes [x1, y1, x2, y2]
+            thresh (float): area ratio under which a box is not refined again
+            max_itr (int): maximum number of refinements
+            forSHAPE (bool): return the segments as flat lists of points (shapes) instead of [x, y] pairs
+
+        Returns:
+            results (list): (bbox, segment) of each box
+        """
+        results = []
+        for cur_bbox, polygon, score in self.sam_predictor.refine_boxes(bboxes, thresh, max_itr):
             if forSHAPE:
-                return cur_bbox, SAMshape['points']
+                results.append((cur_bbox, mathOps.polygon_to_shape(polygon, score)['points']))
             else:
-                return cur_bbox, cur_segment
-        else:
-            return self.sam_enhanced_bbox_segment(frameIMAGE, cur_bbox, thresh, max_itr-1, forSHAPE)
+                results.append((cur_bbox, [[int(x), int(y)] for x, y in polygon]))
+        return results
 
     def load_objects_from_json__json(self):
         if self.global_listObj != []:
@@ -10,7 +10,7 @@ except ModuleNotFoundError:
     from inferencing import models_inference
 from labelme.label_file import LabelFile
 from labelme import PY2
-from PyQt6.QtCore import QThread
+from PyQt6.QtCore import Qt, QThread, QEventLoop
 from PyQt6.QtCore import pyqtSignal as pyqtSignal
 from PyQt6 import QtGui
 from PyQt6 import QtWidgets
@@ -25,6 +25,9 @@ warnings.filterwarnings("ignore")
 
 from .widgets.MsgBox import OKmsgBox
 from .utils.helpers import mathOps
+from .utils import onnx_backend
+from .utils import quantization
+from .utils import read_image_size
 
 
 coco_classes = ['person', 'bicycle', 'car', 'motorcycle', 'airplane', 'bus', 'train', 'truck', 'boat', 'traffic light',
@@ -81,6 +84,25 @@ class IntelligenceWorker(QThread):
             self.sinOut.emit(index, total)
 
 
+class QuantizationWorker(QThread):
+    """
+    Calibrate and quantize a detector to INT8 off the GUI thread (see quantization.quantize_detector),
+    the error if any is kept in `error`.
+    """
+
+    def __init__(self, parent, selected_model_name, config, checkpoint, images, num_threads=0):
+        super(QuantizationWorker, self).__init__(parent)
+        self.args = (selected_model_name, config, checkpoint, images)
+        self.num_threads = num_threads
+        self.error = None
+
+    def run(self):
+        try:
+            quantization.quantize_detector(*self.args, num_threads=self.num_threads)
+        except Exception as e:
+            self.error = e
+
+
 
 class Intelligence():
     def __init__(self, parent):
@@ -124,6 +146,9 @@ class Intelligence():
 
 
         torch.cuda.empty_cache()
+        model = self.make_onnx_model(selected_model_name, config, checkpoint)
+        if model is not None:
+            return selected_model_name, model
         if "YOLOv8" in selected_model_name:
             model = YOLO(checkpoint)
             model.fuse()
@@ -150,6 +175,9 @@ class Intelligence():
         torch.cuda.empty_cache()
         print(
             f"Selected model is {selected_model_name}\n and config is {config}\n and checkpoint is {checkpoint}")
+        model = self.make_onnx_model(selected_model_name, config, checkpoint)
+        if model is not None:
+            return selected_model_name, model
 
         # if YOLOv8
         if "YOLOv8" in selected_model_name:
@@ -173,6 +201,73 @@ class Intelligence():
                 return
             return selected_model_name, model
 
+    def make_onnx_model(self, selected_model_name, config, checkpoint):
+        """
+        Summary:
+            Load the model with the onnxruntime CPU backend if it is selected in the config
+            (inference: backend: onnxruntime), the model is exported to onnx next to its checkpoint the first time.
+            Models listed in inference: int8_models run INT8, they are quantized the first time
+            with calibration on the images of the opened folder (the FP32 onnx model is used if it fails).
+
+        Args:
+            selected_model_name (str): name of the model
+            config (str): path to the config file
+            checkpoint (str): path to the checkpoint file
+
+        Returns:
+            model: the onnx model, or None if the pytorch backend should be used
+        """
+        inference_config = self.config.get("inference", {})
+        num_threads = inference_config.get("num_threads", 0)
+        int8 = selected_model_name in (inference_config.get("int8_models") or [])
+        if inference_config.get("backend", "pytorch") != "onnxruntime" and not int8:
+            return None
+        try:
+            if int8 and not os.path.exists(onnx_backend.int8_file_for(checkpoint)):
+                try:
+                    self.quantize_model(selected_model_name, config, checkpoint, num_threads)
+                except Exception as e:
+                    # no calibration images (e.g. in video mode) or a failed calibration
+                    print(f"Error in quantizing the model, using the FP32 onnx model instead\n{e}")
+                    int8 = False
+            return onnx_backend.load_model(selected_model_name, config, checkpoint,
+                                           num_threads=num_threads, int8=int8)
+        except Exception as e:
+            print(f"Error in loading the onnxruntime model, using pytorch instead\n{e}")
+            return None
+
+    def quantize_model(self, selected_model_name, config, checkpoint, num_threads=0):
+        """
+        Summary:
+            Quantize a model to INT8 with calibration on the images of the opened folder,
+            in a worker thread behind a progress dialog so the GUI stays responsive.
+
+        Args:
+            selected_model_name (str): name of the model
+            config (str): path to the config file
+            checkpoint (str): path to the checkpoint file
+            num_threads (int): number of intra-op threads of the calibration session
+
+        Raises:
+            ValueError: if there are no images to calibrate on
+        """
+        images = getattr(self.parent, "imageList", [])
+        if len(quantization.list_images(images)) == 0:
+            raise ValueError("No calibration images found")
+        worker = QuantizationWorker(self.parent, selected_model_name, config, checkpoint, images, num_threads)
+        pd = QtWidgets.QProgressDialog(f"Calibrating {selected_model_name} to INT8...", None, 0, 0, self.parent)
+        pd.setWindowModality(Qt.WindowModality.WindowModal)
+        pd.setMinimumDuration(0)
+        loop = QEventLoop()
+        worker.finished.connect(loop.quit)
+        worker.start()
+        pd.show()
+        if worker.isRunning():
+            loop.exec()
+        pd.close()
+        if worker.error is not None:
+            raise worker.error
+
     def get_shapes_of_one(self, image, img_array_flag=False, multi_model_flag=False):
         # print(f"Threshold is {self.conf_threshold}")
         # results = self.reader.decode_file(img_path = filename, threshold = self.conf_threshold , selected_model_name = self.current_model_name)["results"]
@@ -302,8 +397,21 @@ class Intelligence():
     def clear_annotating_models(self):
         self.reader.annotating_models.clear()
 
-    def saveLabelFile(self, filename, detectedShapes):
+    def saveLabelFile(self, filename, detectedShapes, store_data=None):
+        """
+        Summary:
+            Save the shapes detected in an image to its label file.
+            Unless batch_store_data is set in the config, the label file only references the image
+            (no base64 image data) and the image size is read from the image header without decoding it.
+
+        Args:
+            filename (str): path of the image
+            detectedShapes (list): the detected shapes (qt shapes)
+            store_data (bool): embed the image data in the label file (None: batch_store_data of the config)
+        """
         lf = LabelFile()
+        if store_data is None:
+            store_data = self.config.get("batch_store_data", False)
 
         def format_shape(s):
             data = s.other_data.copy()
@@ -322,8 +430,13 @@ class Intelligence():
 
         shapes = [format_shape(item) for item in detectedShapes]
 
-        imageData = LabelFile.load_image_file(filename)
-        image = QtGui.QImage.fromData(imageData)
+        if store_data:
+            imageData = LabelFile.load_image_file(filename)
+            image = QtGui.QImage.fromData(imageData)
+            imageHeight, imageWidth = image.height(), image.width()
+        else:
+            imageData = None
+            imageHeight, imageWidth = read_image_size(filename)
         if osp.dirname(filename) and not osp.exists(osp.dirname(filename)):
             os.makedirs(osp.dirname(filename))
         json_name = osp.splitext(filename)[0] + ".json"
@@ -333,8 +446,8 @@ class Intelligence():
             shapes=shapes,
             imagePath=imagePath,
             imageData=imageData,
-            imageHeight=image.height(),
-            imageWidth=image.width(),
+            imageHeight=imageHeight,
+            imageWidth=imageWidth,
             otherData={},
             flags={},
         )
@@ -11,6 +11,7 @@ from labelme.logger import logger
 from labelme import PY2
 from labelme import QT4
 from labelme import utils
+from labelme.utils import compact_format
 
 
 PIL.Image.MAX_IMAGE_PIXELS = None
@@ -36,38 +37,90 @@ class LabelFile(object):
 
     suffix = ".json"
 
-    def __init__(self, filename=None):
+    def __init__(self, filename=None, lazy=False):
         self.shapes = []
         self.imagePath = None
-        self.imageData = None
+        self.imageHeight = None
+        self.imageWidth = None
+        self._imageData = None
+        self._image = None
+        # ("data", base64 string) or ("file", path) of an image not decoded yet
+        self._imageSource = None
         if filename is not None:
-            self.load(filename)
+            self.load(filename, lazy=lazy)
         self.filename = filename
 
+    @property
+    def image(self):
+        if self._image is None and self._imageSource is not None:
+            self._load_image()
+        return self._image
+
+    @image.setter
+    def image(self, image):
+        self._image = image
+        self._imageSource = None
+
+    @property
+    def imageData(self):
+        if self._imageData is None and self._imageSource is not None:
+            self._load_image()
+        return self._imageData
+
+    @imageData.setter
+    def imageData(self, imageData):
+        self._imageData = imageData
+        self._imageSource = None
+
+    def _load_image(self):
+        try:
+            image, imageData = self._decode_image(self._imageSource)
+        except Exception as e:
+            raise LabelFileError(e)
+        self._check_image_size(
+            image.height, image.width, self.imageHeight, self.imageWidth
+        )
+        self.imageHeight, self.imageWidth = image.height, image.width
+        self._image = image
+        self._imageData = imageData
+        self._imageSource = None
+
     @staticmethod
-    def load_image_file(filename):
+    def _decode_image(source):
+        kind, value = source
+        if kind == "data":
+            imageData = base64.b64decode(value)
+            if PY2 and QT4:
+                imageData = utils.img_data_to_png_data(imageData)
+            image = utils.DecodedImage.from_data(imageData)
+        else:
+            image = utils.DecodedImage.from_file(value)
+            imageData = image.data()
+        return image, imageData
+
+    @staticmethod
+    def load_decoded_image(filename):
+        # the orientation is applied according to exif
         try:
-            image_pil = PIL.Image.open(filename)
+            return utils.DecodedImage.from_file(filename)
         except IOError:
             logger.error("Failed opening image file: {}".format(filename))
             return
 
-        # apply orientation to image according to exif
-        image_pil = utils.apply_exif_orientation(image_pil)
+    @staticmethod
+    def load_image_file(filename):
+        image = LabelFile.load_decoded_image(filename)
+        if image is None:
+            return
+        return image.data()
 
-        with io.BytesIO() as f:
-            ext = osp.splitext(filename)[1].lower()
-            if PY2 and QT4:
-                format = "PNG"
-            elif ext in [".jpg", ".jpeg"]:
-                format = "JPEG"
-            else:
-                format = "PNG"
-            image_pil.save(f, format=format)
-            f.seek(0)
-            return f.read()
+    def load(self, filename, lazy=False):
+        """Load a label file.
 
-    def load(self, filename):
+        With ``lazy``, only the shapes and the image size stored in the file
+        are read, the image is decoded when ``image`` or ``imageData`` is
+        first accessed.
+        """
         keys = [
             "version",
             "imageData",
@@ -87,8 +140,7 @@ class LabelFile(object):
             "content"
         ]
         try:
-            with open(filename, "r") as f:
-                data = json.load(f)
+            data = compact_format.read_label_data(filename)
             version = data.get("version")
             if version is None:
                 logger.warn(
@@ -106,25 +158,37 @@ class LabelFile(object):
                 )
 
             if data["imageData"] is not None:
-                imageData = base64.b64decode(data["imageData"])
-                if PY2 and QT4:
-                    imageData = utils.img_data_to_png_data(imageData)
+                imageSource = ("data", data["imageData"])
             else:
                 # relative path from label file to relative path from cwd
-                imagePath = osp.join(osp.dirname(filename), data["imagePath"])
-                imageData = self.load_image_file(imagePath)
+                imageSource = (
+                    "file",
+                    osp.join(osp.dirname(filename), data["imagePath"]),
+                )
+            imageHeight = data.get("imageHeight")
+            imageWidth = data.get("imageWidth")
+            if lazy:
+                image = imageData = None
+                if imageSource[0] == "file" and (
+                    imageHeight is None or imageWidth is None
+                ):
+                    imageHeight, imageWidth = utils.read_image_size(
+                        imageSource[1]
+                    )
+            else:
+                image, imageData = self._decode_image(imageSource)
+                self._check_image_size(
+                    image.height, image.width, imageHeight, imageWidth
+                )
+                imageHeight, imageWidth = image.height, image.width
+                imageSource = None
             flags = data.get("flags") or {}
             imagePath = data["imagePath"]
-            self._check_image_height_and_width(
-                base64.b64encode(imageData).decode("utf-8"),
-                data.get("imageHeight"),
-                data.get("imageWidth"),
-            )
             shapes = [
                 dict(
                     label=s["label"],
                     points=s["points"],
-                    bbox = s["bbox"],
+                    bbox = s.get("bbox"),
                     shape_type=s.get("shape_type", "polygon"),
                     flags=s.get("flags", {}),
                     content=s.get("content"),
@@ -147,25 +211,35 @@ class LabelFile(object):
         self.flags = flags
         self.shapes = shapes
         self.imagePath = imagePath
-        self.imageData = imageData
+        self.imageHeight = imageHeight
+        self.imageWidth = imageWidth
+        self._imageData = imageData
+        self._image = image
+        self._imageSource = imageSource
         self.filename = filename
         self.otherData = otherData
 
     @staticmethod
     def _check_image_height_and_width(imageData, imageHeight, imageWidth):
         img_arr = utils.img_b64_to_arr(imageData)
-        if imageHeight is not None and img_arr.shape[0] != imageHeight:
+        return LabelFile._check_image_size(
+            img_arr.shape[0], img_arr.shape[1], imageHeight, imageWidth
+        )
+
+    @staticmethod
+    def _check_image_size(height, width, imageHeight, imageWidth):
+        if imageHeight is not None and height != imageHeight:
             logger.error(
                 "imageHeight does not match with imageData or imagePath, "
                 "so getting imageHeight from actual image."
             )
-            imageHeight = img_arr.shape[0]
-        if imageWidth is not None and img_arr.shape[1] != imageWidth:
+            imageHeight = height
+        if imageWidth is not None and width != imageWidth:
             logger.error(
                 "imageWidth does not match with imageData or imagePath, "
                 "so getting imageWidth from actual image."
             )
-            imageWidth = img_arr.shape[1]
+            imageWidth = width
         return imageHeight, imageWidth
 
     def save(
@@ -201,12 +275,19 @@ class LabelFile(object):
             assert key not in data
             data[key] = value
         try:
-            with open(filename, "w") as f:
-                json.dump(data, f, ensure_ascii=False, indent=2)
+            if compact_format.is_compact(filename):
+                compact_format.save_label_data(filename, data)
+            else:
+                with open(filename, "w") as f:
+                    json.dump(data, f, ensure_ascii=False, indent=2)
             self.filename = filename
         except Exception as e:
             raise LabelFileError(e)
 
     @staticmethod
     def is_label_file(filename):
-        return osp.splitext(filename)[1].lower() == LabelFile.suffix
+        ext = osp.splitext(filename)[1].lower()
+        if ext == compact_format.SUFFIX:
+            # not the other numpy archives (trajectories, detection cache, ...)
+            return compact_format.is_kind(filename, compact_format.LABEL_FILE)
+        return ext == LabelFile.suffix
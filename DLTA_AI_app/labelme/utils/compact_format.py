@@ -0,0 +1,361 @@
+import argparse
+import base64
+import itertools
+import json
+import os
+import os.path as osp
+
+import numpy as np
+import orjson
+
+
+# Compact binary format for label files and video tracking results.
+#
+# A compact file is an uncompressed .npz with the same name as the JSON file it
+# replaces (`image.json` -> `image.npz`, `video_tracking_results.json` ->
+# `video_tracking_results.npz`). The polygon vertices of all the shapes/objects
+# are stored in one numpy buffer with the smallest dtype representing them
+# exactly (int16/int32 for integer coordinates, float32/float64 otherwise),
+# everything else is stored as JSON bytes with the points replaced by their
+# layout ("flat" [x1, y1, x2, y2, ...] or "nested" [[x1, y1], [x2, y2], ...]),
+# so converting back gives the same JSON data.
+
+SUFFIX = ".npz"
+VERSION = 1
+LABEL_FILE = "label_file"
+TRACKING_RESULTS = "tracking_results"
+
+
+def sidecar_path(json_path):
+    return osp.splitext(json_path)[0] + SUFFIX
+
+
+def json_path(compact_path):
+    return osp.splitext(compact_path)[0] + ".json"
+
+
+def is_compact(filename):
+    return filename.lower().endswith(SUFFIX)
+
+
+def resolve(json_file_name):
+    """
+    Summary:
+        Get the file to read for a JSON file name: its compact sidecar if it exists, is a compact file
+        and is newer than the JSON file (or the JSON file does not exist), otherwise the JSON file.
+
+    Args:
+        json_file_name (str): path of the JSON file
+
+    Returns:
+        path (str): path of the file to read
+    """
+    sidecar = sidecar_path(json_file_name)
+    if not osp.exists(sidecar) or not is_kind(sidecar):
+        return json_file_name
+    if not osp.exists(json_file_name) or os.stat(sidecar).st_mtime_ns >= os.stat(json_file_name).st_mtime_ns:
+        return sidecar
+    return json_file_name
+
+
+def _layout(points):
+    if len(points) and isinstance(points[0], (list, tuple)):
+        return "nested"
+    return "flat"
+
+
+def _compact_dtype(values):
+    if values.dtype.kind in "biu":
+        for dtype in [np.int16, np.int32]:
+            if len(values) == 0 or (values.min() >= np.iinfo(dtype).min and values.max() <= np.iinfo(dtype).max):
+                return dtype
+        return np.int64
+    if np.array_equal(values.astype(np.float32), values, equal_nan=True):
+        return np.float32
+    return np.float64
+
+
+def pack_points(polygons, layouts):
+    """
+    Summary:
+        Pack polygons into one vertex buffer.
+
+    Args:
+        polygons (list): the points of each polygon, flat or nested
+        layouts (list): the layout of each polygon ("flat" or "nested")
+
+    Returns:
+        offsets (np.ndarray): start of each polygon in `values` (and the end of the last one)
+        values (np.ndarray): the flat coordinates of all the polygons
+    """
+    flat = [polygon if layout == "flat" else itertools.chain.from_iterable(polygon)
+            for polygon, layout in zip(polygons, layouts)]
+    lengths = [len(polygon) * (2 if layout == "nested" else 1) for polygon, layout in zip(polygons, layouts)]
+    offsets = np.zeros(len(polygons) + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum(lengths)
+    # int64 if all the coordinates are integers, float64 otherwise
+    values = np.array(list(itertools.chain.from_iterable(flat)))
+    if values.size == 0:
+        values = np.zeros(0, dtype=np.int64)
+    return offsets, values.astype(_compact_dtype(values))
+
+
+def unpack_points(offsets, values, layouts):
+    """
+    Summary:
+        Unpack the polygons of a vertex buffer made by `pack_points`.
+
+    Args:
+        offsets (np.ndarray): start of each polygon in `values`
+        values (np.ndarray): the flat coordinates of all the polygons
+        layouts (list): the layout of each polygon ("flat" or "nested")
+
+    Returns:
+        polygons (list): the points of each polygon as python lists
+    """
+    offsets = offsets.tolist()
+    if all(layout == "nested" for layout in layouts):
+        pairs = values.reshape(-1, 2).tolist()
+        return [pairs[offsets[i] // 2:offsets[i + 1] // 2] for i in range(len(layouts))]
+    values = values.tolist()
+    polygons = []
+    for i, layout in enumerate(layouts):
+        polygon = values[offsets[i]:offsets[i + 1]]
+        if layout == "nested":
+            polygon = [polygon[j:j + 2] for j in range(0, len(polygon), 2)]
+        polygons.append(polygon)
+    return polygons
+
+
+def _bytes_array(data):
+    return np.frombuffer(data, dtype=np.uint8)
+
+
+def _save(filename, kind, **arrays):
+    # written to a temporary file first so a failed save does not corrupt the file
+    tmp_file = filename + ".tmp"
+    with open(tmp_file, "wb") as f:
+        np.savez(f, kind=np.array(kind), version=np.array(VERSION), **arrays)
+    os.replace(tmp_file, filename)
+
+
+def _load(filename, kind):
+    with np.load(filename) as npz:
+        if "kind" not in npz.files or str(npz["kind"]) != kind:
+            raise ValueError(f"{filename} is not a compact {kind.replace('_', ' ')} file")
+        return {key: npz[key] for key in npz.files}
+
+
+def file_kind(filename):
+    with np.load(filename) as npz:
+        return str(npz["kind"]) if "kind" in npz.files else None
+
+
+def is_kind(filename, kind=None):
+    """
+    Summary:
+        Check that a file is a compact file (of a kind), and not another numpy archive
+        such as the trajectories or the detection cache of a video.
+
+    Args:
+        filename (str): path of the file
+        kind (str): LABEL_FILE or TRACKING_RESULTS (None: any kind)
+
+    Returns:
+        is_kind (bool): True if the file is a compact file of the kind
+    """
+    try:
+        found = file_kind(filename)
+    except Exception:
+        return False
+    return found is not None and (kind is None or found == kind)
+
+
+def save_label_data(filename, data):
+    """
+    Summary:
+        Save label file data (the dictionary saved as JSON by LabelFile) in the compact format,
+        the base64 image data is stored as raw bytes.
+
+    Args:
+        filename (str): path of the compact file
+        data (dict): the label file data
+    """
+    data = dict(data)
+    imageData = data.get("imageData")
+    if imageData is not None:
+        data["imageData"] = None
+    shapes, polygons, layouts = [], [], []
+    for shape in data["shapes"]:
+        shape = dict(shape)
+        polygons.append(shape["points"])
+        layouts.append(_layout(shape["points"]))
+        shape["points"] = layouts[-1]
+        shapes.append(shape)
+    data["shapes"] = shapes
+    offsets, values = pack_points(polygons, layouts)
+    arrays = dict(meta=_bytes_array(orjson.dumps(data)), offsets=offsets, values=values)
+    if imageData is not None:
+        arrays["image_data"] = _bytes_array(base64.b64decode(imageData))
+    _save(filename, LABEL_FILE, **arrays)
+
+
+def load_label_data(filename):
+    """
+    Summary:
+        Load label file data saved by `save_label_data`.
+
+    Args:
+        filename (str): path of the compact file
+
+    Returns:
+        data (dict): the label file data, the same as loading its JSON file
+    """
+    arrays = _load(filename, LABEL_FILE)
+    data = orjson.loads(arrays["meta"].tobytes())
+    layouts = [shape["points"] for shape in data["shapes"]]
+    for shape, points in zip(data["shapes"], unpack_points(arrays["offsets"], arrays["values"], layouts)):
+        shape["points"] = points
+    if "image_data" in arrays:
+        data["imageData"] = base64.b64encode(arrays["image_data"].tobytes()).decode("utf-8")
+    return data
+
+
+def read_label_data(filename):
+    """
+    Summary:
+        Read a label file in the JSON or the compact format.
+
+    Args:
+        filename (str): path of the label file
+
+    Returns:
+        data (dict): the label file data
+    """
+    if is_compact(filename):
+        return load_label_data(filename)
+    with open(filename, "rb") as f:
+        return orjson.loads(f.read())
+
+
+def save_tracking_results(filename, frames):
+    """
+    Summary:
+        Save video tracking results in the compact format.
+
+    Args:
+        filename (str): path of the compact file
+        frames (iterable): the frames (each frame is a dictionary with keys (frame_idx, frame_data))
+    """
+    meta, polygons, layouts, frame_polygons = [], [], [], [0]
+    for frame in frames:
+        frame = dict(frame)
+        objects = []
+        for object in frame["frame_data"]:
+            object = dict(object)
+            if isinstance(object.get("segment"), list):
+                polygons.append(object["segment"])
+                layouts.append(_layout(object["segment"]))
+                object["segment"] = layouts[-1]
+            objects.append(object)
+        frame["frame_data"] = objects
+        meta.append(orjson.dumps(frame))
+        frame_polygons.append(len(polygons))
+    meta_offsets = np.zeros(len(meta) + 1, dtype=np.int64)
+    meta_offsets[1:] = np.cumsum([len(m) for m in meta])
+    offsets, values = pack_points(polygons, layouts)
+    _save(filename, TRACKING_RESULTS,
+          meta=_bytes_array(b"".join(meta)), meta_offsets=meta_offsets,
+          frame_polygons=np.array(frame_polygons, dtype=np.int64), offsets=offsets, values=values)
+
+
+def iter_tracking_results(filename):
+    """
+    Summary:
+        Iterate over the frames of video tracking results saved by `save_tracking_results`,
+        each frame is decoded when it is reached.
+
+    Args:
+        filename (str): path of the compact file
+
+    Returns:
+        frames: a generator of the frames (each frame is a dictionary with keys (frame_idx, frame_data))
+    """
+    arrays = _load(filename, TRACKING_RESULTS)
+    meta = arrays["meta"].tobytes()
+    meta_offsets = arrays["meta_offsets"].tolist()
+    frame_polygons = arrays["frame_polygons"].tolist()
+    offsets, values = arrays["offsets"], arrays["values"]
+    for i in range(len(meta_offsets) - 1):
+        frame = orjson.loads(meta[meta_offsets[i]:meta_offsets[i + 1]])
+        objects = [object for object in frame["frame_data"] if isinstance(object.get("segment"), str)]
+        start, end = frame_polygons[i], frame_polygons[i + 1]
+        segments = unpack_points(offsets[start:end + 1] - offsets[start], values[offsets[start]:offsets[end]],
+                                 [object["segment"] for object in objects])
+        for object, segment in zip(objects, segments):
+            object["segment"] = segment
+        yield frame
+
+
+def load_tracking_results(filename):
+    return list(iter_tracking_results(filename))
+
+
+def to_compact(json_file_name, compact_file_name=None):
+    """
+    Summary:
+        Convert a label file or tracking results JSON file to the compact format.
+
+    Args:
+        json_file_name (str): path of the JSON file
+        compact_file_name (str): path of the compact file (default: the sidecar of the JSON file)
+
+    Returns:
+        compact_file_name (str): path of the compact file
+    """
+    compact_file_name = compact_file_name or sidecar_path(json_file_name)
+    with open(json_file_name, "rb") as f:
+        data = orjson.loads(f.read())
+    if isinstance(data, list):
+        save_tracking_results(compact_file_name, data)
+    else:
+        save_label_data(compact_file_name, data)
+    return compact_file_name
+
+
+def to_json(compact_file_name, json_file_name=None):
+    """
+    Summary:
+        Convert a compact file back to JSON, written the same way as the app writes it.
+
+    Args:
+        compact_file_name (str): path of the compact file
+        json_file_name (str): path of the JSON file (default: the JSON file of the sidecar)
+
+    Returns:
+        json_file_name (str): path of the JSON file
+    """
+    json_file_name = json_file_name or json_path(compact_file_name)
+    if file_kind(compact_file_name) == TRACKING_RESULTS:
+        with open(json_file_name, "wb") as f:
+            f.write(orjson.dumps(load_tracking_results(compact_file_name), option=orjson.OPT_INDENT_2))
+    else:
+        with open(json_file_name, "w", encoding="utf-8") as f:
+            json.dump(load_label_data(compact_file_name), f, ensure_ascii=False, indent=2)
+    return json_file_name
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Convert label files and tracking results between JSON and the compact format")
+    parser.add_argument("files", nargs="+", help="JSON files (converted to compact) or .npz files (converted to JSON)")
+    args = parser.parse_args()
+    for filename in args.files:
+        if is_compact(filename):
+            print(f"{filename} -> {to_json(filename)}")
+        else:
+            print(f"{filename} -> {to_compact(filename)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,174 @@
+import os
+
+import numpy as np
+
+
+class DetectionCache:
+    """
+    A compact per-frame cache of the detector output of a video.
+
+    Detections of each frame are kept as flat numpy arrays (boxes, scores,
+    label indices and one vertex buffer for all the polygons) and persisted
+    to a single `.npz` file next to the video, so tracking can be re-run
+    with another tracker or tracker configuration without running the
+    segmentation models again.
+
+    The cache is tied to a signature of the detection settings (models,
+    thresholds, classes, tracking area); changing them invalidates it.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.signature = ""
+        self.label_names = []
+        self._label_index = {}
+        self.frames = {}
+        self.dirty = False
+        if os.path.exists(path):
+            try:
+                self._load()
+            except Exception as e:
+                print(f"Error loading detection cache {path}: {e}")
+                self.frames = {}
+
+    def __contains__(self, frame_idx):
+        return frame_idx in self.frames
+
+    def __len__(self):
+        return len(self.frames)
+
+    def set_signature(self, signature):
+        """
+        Summary:
+            Set the detection settings the cached detections belong to.
+            If they differ from the cached ones, the cache is cleared.
+
+        Args:
+            signature (str): a string describing the detection settings
+        """
+        if signature != self.signature:
+            if self.frames:
+                print("Detection settings changed, clearing the detection cache")
+            self.clear()
+            self.signature = signature
+
+    def clear(self):
+        self.frames = {}
+        self.label_names = []
+        self._label_index = {}
+        self.dirty = True
+
+    def put(self, frame_idx, shapes):
+        """
+        Summary:
+            Store the detections of a frame.
+
+        Args:
+            frame_idx (int): index of the frame (1 based, as INDEX_OF_CURRENT_FRAME)
+            shapes (list): shapes as returned by `MainWindow.annotate_one`
+        """
+        n = len(shapes)
+        boxes = np.zeros((n, 4), dtype=np.float32)
+        scores = np.full(n, np.nan, dtype=np.float32)
+        labels = np.zeros(n, dtype=np.int32)
+        polygons = []
+        for i, shape in enumerate(shapes):
+            polygon = np.asarray(shape["points"], dtype=np.float32).reshape(-1, 2)
+            polygons.append(polygon)
+            if shape.get("bbox") is not None:
+                boxes[i] = shape["bbox"][:4]
+            elif len(polygon):
+                boxes[i] = [*polygon.min(axis=0), *polygon.max(axis=0)]
+            if shape["content"] is not None:
+                scores[i] = float(shape["content"])
+            labels[i] = self._label_id(shape["label"])
+        offsets = np.zeros(n + 1, dtype=np.int64)
+        offsets[1:] = np.cumsum([len(p) for p in polygons])
+        points = np.concatenate(polygons) if n else np.zeros((0, 2), dtype=np.float32)
+        self.frames[int(frame_idx)] = (boxes, scores, labels, offsets, points)
+        self.dirty = True
+
+    def get(self, frame_idx):
+        """
+        Summary:
+            Get the cached detections of a frame.
+
+        Args:
+            frame_idx (int): index of the frame
+
+        Returns:
+            shapes (list): shapes in the same format as `MainWindow.annotate_one`, or None if the frame is not cached
+        """
+        if int(frame_idx) not in self.frames:
+            return None
+        boxes, scores, labels, offsets, points = self.frames[int(frame_idx)]
+        shapes = []
+        for i in range(len(boxes)):
+            shapes.append({
+                "label": self.label_names[labels[i]],
+                "content": None if np.isnan(scores[i]) else float(scores[i]),
+                "group_id": None,
+                "shape_type": "polygon",
+                "bbox": boxes[i].tolist(),
+                "flags": {},
+                "other_data": {},
+                "points": points[offsets[i]:offsets[i + 1]].flatten().tolist(),
+            })
+        return shapes
+
+    def _label_id(self, label):
+        if label not in self._label_index:
+            self._label_index[label] = len(self.label_names)
+            self.label_names.append(label)
+        return self._label_index[label]
+
+    def save(self):
+        """Write the cache to its `.npz` file (only if it changed)."""
+        if not self.dirty:
+            return
+        frame_ids = sorted(self.frames.keys())
+        entries = [self.frames[f] for f in frame_ids]
+        det_offsets = np.zeros(len(entries) + 1, dtype=np.int64)
+        det_offsets[1:] = np.cumsum([len(e[0]) for e in entries])
+        # point offsets are made global over the concatenated vertex buffer
+        point_offsets, start = [np.zeros(1, dtype=np.int64)], 0
+        for e in entries:
+            point_offsets.append(e[3][1:] + start)
+            start += len(e[4])
+
+        def concat(i, shape, dtype):
+            arrays = [e[i] for e in entries]
+            return np.concatenate(arrays) if arrays else np.zeros(shape, dtype=dtype)
+
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            np.savez(
+                f,
+                signature=np.array(self.signature),
+                label_names=np.array(self.label_names, dtype=str),
+                frames=np.array(frame_ids, dtype=np.int64),
+                det_offsets=det_offsets,
+                boxes=concat(0, (0, 4), np.float32),
+                scores=concat(1, (0,), np.float32),
+                labels=concat(2, (0,), np.int32),
+                point_offsets=np.concatenate(point_offsets),
+                points=concat(4, (0, 2), np.float32),
+            )
+        os.replace(tmp_path, self.path)
+        self.dirty = False
+
+    def _load(self):
+        with np.load(self.path) as data:
+            self.signature = str(data["signature"])
+            self.label_names = data["label_names"].tolist()
+            frames = data["frames"]
+            det_offsets = data["det_offsets"]
+            boxes, scores, labels = data["boxes"], data["scores"], data["labels"]
+            point_offsets, points = data["point_offsets"], data["points"]
+        self._label_index = {label: i for i, label in enumerate(self.label_names)}
+        for i, frame_idx in enumerate(frames):
+            d0, d1 = det_offsets[i], det_offsets[i + 1]
+            p0, p1 = point_offsets[d0], point_offsets[d1]
+            self.frames[int(frame_idx)] = (boxes[d0:d1], scores[d0:d1], labels[d0:d1],
+                                           point_offsets[d0:d1 + 1] - p0, points[p0:p1])
+        self.dirty = False
@@ -0,0 +1,173 @@
+import hashlib
+import os
+import os.path as osp
+
+import orjson
+from PyQt6.QtCore import QThread
+from PyQt6.QtCore import pyqtSignal
+
+from . import compact_format
+
+
+class DirectoryIndex(object):
+    """
+    Persistent index of the images of a directory tree and of the label files
+    next to them, so opening a directory again only lists the directories that
+    changed since the last scan.
+
+    Each directory is stored with its modification time, its images, its
+    sub directories and the names of its label files. A directory is listed
+    again (with `os.scandir`) only if its modification time changed, which
+    happens when files are added, removed or renamed in it, so the label status
+    of the images stays valid without checking every label file.
+
+    Parameters
+    ----------
+    root : str
+        the directory opened in the app
+    extensions : list
+        the image extensions (lower case, with the dot)
+    """
+
+    VERSION = 1
+
+    def __init__(self, root, extensions):
+        # the image paths start with the folder as it was given (like os.walk)
+        self.folder = root
+        self.root = osp.abspath(root)
+        self.extensions = tuple(sorted(extensions))
+        self.dirs = {}
+        self.dirty = False
+        key = hashlib.sha1(self.root.encode("utf-8")).hexdigest()
+        self.path = osp.join(osp.expanduser("~"), ".dlta_ai", "dir_index", f"{key}.json")
+        try:
+            with open(self.path, "rb") as f:
+                data = orjson.loads(f.read())
+            if data["version"] == self.VERSION and tuple(data["extensions"]) == self.extensions:
+                self.dirs = data["dirs"]
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            print(f"Error loading the directory index {self.path}: {e}")
+
+    def _entry(self, path):
+        try:
+            mtime = os.stat(path).st_mtime_ns
+        except OSError:
+            self.dirs.pop(path, None)
+            return None
+        entry = self.dirs.get(path)
+        if entry is not None and entry["mtime"] == mtime:
+            return entry
+        images, subdirs, labels = [], [], []
+        try:
+            it = os.scandir(path)
+        except OSError:
+            # like os.walk, directories which cannot be listed are skipped
+            return None
+        with it:
+            for e in it:
+                name = e.name
+                try:
+                    if e.is_dir():
+                        # like os.walk, symlinks to directories are not followed
+                        if not e.is_symlink():
+                            subdirs.append(name)
+                        continue
+                except OSError:
+                    continue
+                lower = name.lower()
+                if lower.endswith(self.extensions):
+                    images.append(name)
+                elif lower.endswith((".json", compact_format.SUFFIX)):
+                    labels.append(osp.splitext(name)[0])
+        entry = {"mtime": mtime, "images": images, "subdirs": subdirs, "labels": labels}
+        self.dirs[path] = entry
+        self.dirty = True
+        return entry
+
+    def scan(self, output_dir=None, interrupted=None, batch_size=1000):
+        """
+        Summary:
+            Walk the directory tree, listing only the directories that changed.
+
+        Args:
+            output_dir (str): directory of the label files (None: next to the images)
+            interrupted (callable): returns True to stop the scan
+            batch_size (int): number of images per batch
+
+        Returns:
+            batches: a generator of lists of (image path, has a label file), the images
+                are sorted by their lower case path (as `MainWindow.scanAllImages` did)
+        """
+        output_labels = None
+        output_key = osp.abspath(output_dir) if output_dir else None
+        if output_dir:
+            entry = self._entry(output_key)
+            output_labels = set(entry["labels"]) if entry is not None else set()
+
+        visited = set()
+        batch = []
+        # depth first, a directory sorts as its name followed by the separator so the
+        # order is the same as sorting the full paths
+        stack = [(False, self.folder)]
+        while stack:
+            if interrupted is not None and interrupted():
+                return
+            is_image, value = stack.pop()
+            if is_image:
+                batch.append(value)
+                if len(batch) >= batch_size:
+                    yield batch
+                    batch = []
+                continue
+            key = osp.abspath(value)
+            visited.add(key)
+            entry = self._entry(key)
+            if entry is None:
+                continue
+            labels = output_labels if output_labels is not None else set(entry["labels"])
+            children = [(name.lower(), True, (osp.join(value, name), osp.splitext(name)[0] in labels))
+                        for name in entry["images"]]
+            children += [(name.lower() + "/", False, osp.join(value, name)) for name in entry["subdirs"]]
+            children.sort(key=lambda child: child[0], reverse=True)
+            stack.extend(child[1:] for child in children)
+        if batch:
+            yield batch
+
+        # forget the directories which do not exist anymore
+        for key in list(self.dirs):
+            if key not in visited and key != output_key:
+                del self.dirs[key]
+                self.dirty = True
+
+    def save(self):
+        if not self.dirty:
+            return
+        os.makedirs(osp.dirname(self.path), exist_ok=True)
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(orjson.dumps({"version": self.VERSION, "root": self.root,
+                                  "extensions": self.extensions, "dirs": self.dirs}))
+        os.replace(tmp_path, self.path)
+        self.dirty = False
+
+
+class DirScanWorker(QThread):
+    """Scan a `DirectoryIndex` in the background, the images are emitted in batches."""
+
+    batch = pyqtSignal(list)
+
+    def __init__(self, parent, index, output_dir=None):
+        super(DirScanWorker, self).__init__(parent)
+        self.index = index
+        self.output_dir = output_dir
+
+    def run(self):
+        try:
+            for images in self.index.scan(self.output_dir, self.isInterruptionRequested):
+                self.batch.emit(images)
+            if not self.isInterruptionRequested():
+                self.index.save()
+        except Exception as e:
+            print(f"Error scanning {self.index.root}: {e}")
@@ -1,11 +1,19 @@
 import datetime
 import glob
 import json
+import multiprocessing
 import os
+import os.path as osp
 import csv
+import shutil
+import tempfile
 import numpy as np
+import orjson
 from PyQt6.QtWidgets import QFileDialog
 
+from . import compact_format
+from .helpers.mathOps import iter_objects_from_json
+
 coco_classes = ["person", "bicycle", "car", "motorcycle", "airplane", "bus", "train", "truck", "boat", "traffic light", "fire hydrant", "stop sign", "parking meter", "bench", "bird", "cat", "dog", "horse", "sheep", "cow", "elephant", "bear", "zebra", "giraffe", "backpack", "umbrella", "handbag", "tie", "suitcase", "frisbee", "skis", "snowboard", "sports ball", "kite", "baseball bat", "baseball glove", "skateboard", "surfboard", "tennis racket", "bottle", "wine glass", "cup", "fork", "knife", "spoon", "bowl", "banana", "apple", "sandwich", "orange", "broccoli", "carrot", "hot dog", "pizza", "donut", "cake", "chair", "couch", "potted plant", "bed", "dining table", "toilet", "tv", "laptop", "mouse", "remote", "keyboard", "cell phone", "microwave", "oven", "toaster", "sink", "refrigerator", "book", "clock", "vase", "scissors", "teddy bear", "hair drier", "toothbrush"]
 
 def center_of_polygon(polygon):
@@ -122,10 +130,14 @@ def parse_img_export(target_directory, save_path):
         else:
             image_mode = False
 
-        # Get all the JSON files in the specified directory
-        json_paths = glob.glob(f"{target_directory}/*.json")
         if image_mode:
-            json_paths = [save_path]
+            json_paths = [compact_format.resolve(save_path)]
+        else:
+            # Get all the JSON files in the specified directory (or their compact sidecars if newer)
+            json_paths = glob.glob(f"{target_directory}/*.json")
+            json_paths += [compact_format.json_path(path) for path in glob.glob(f"{target_directory}/*{compact_format.SUFFIX}")
+                           if compact_format.file_kind(path) == compact_format.LABEL_FILE]
+            json_paths = [compact_format.resolve(path) for path in sorted(set(json_paths))]
         # Raise an error if no JSON files are found in the directory
         if len(json_paths) == 0:
             raise ValueError("No json files found in the directory")
@@ -135,27 +147,86 @@ def parse_img_export(target_directory, save_path):
     
     return json_paths
 
-def exportCOCO(json_paths, annotation_path):
+def _parse_label_file(job):
+    """
+    Parse one label file into its COCO image and annotations (runs in the export worker processes).
+
+    Args:
+        job (tuple): (image id, path to the label file)
+
+    Returns:
+        tuple: (image, [(label, annotation), ...], error message or None)
+    """
+    # imported here, labelme.label_file imports labelme.utils
+    from labelme.label_file import LabelFile
+
+    i, json_path = job
+    try:
+        # only the shapes and the image size, the image is not decoded
+        label_file = LabelFile(json_path, lazy=True)
+        image = {
+            "id": i,
+            "width": label_file.imageWidth,
+            "height": label_file.imageHeight,
+            "file_name": osp.splitext(json_path.split("/")[-1])[0] + ".jpg",
+        }
+        shapes = []
+        for shape in label_file.shapes:
+            # Skip shapes with no points
+            if len(shape["points"]) == 0:
+                continue
+            annotation = {"bbox": get_bbox(shape["points"]), "iscrowd": 0}
+            # Try to add segmentation and area data to the annotation
+            try:
+                annotation["segmentation"] = [shape["points"]]
+                annotation["area"] = float(get_area_from_polygon(
+                    annotation["segmentation"][0], mode="segmentation"))
+            except:
+                annotation["area"] = float(get_area_from_polygon(
+                    annotation["bbox"], mode="bbox"))
+            # Try to add score data to the annotation
+            try:
+                annotation["score"] = float(shape["content"])
+            except:
+                pass
+            shapes.append((shape["label"].lower(), annotation))
+        return image, shapes, None
+    except Exception as e:
+        return None, None, f"Error with {json_path}\n{e}"
+
+
+def _parse_label_files(json_paths, workers=None):
+    """
+    Parse the label files in order, in a process pool for large directories.
+    """
+    jobs = enumerate(json_paths)
+    if workers == 1 or len(json_paths) < 1000:
+        for job in jobs:
+            yield _parse_label_file(job)
+        return
+    with multiprocessing.Pool(workers) as pool:
+        for result in pool.imap(_parse_label_file, jobs, chunksize=64):
+            yield result
+
+
+def exportCOCO(json_paths, annotation_path, workers=None):
     """
     Export annotations in COCO format from a directory of JSON files for image and dir modes
 
+    The label files are parsed in a process pool and the images and annotations are
+    streamed to the output file, so large directories are not held in memory.
+
     Args:
-        target_directory (str): The directory containing the JSON files (dir)
-        save_path (str): The path to save the output file (image mode)
+        json_paths (list): The paths of the JSON files.
         annotation_path (str): The path to the output file.
+        workers (int): Number of parsing processes (None: number of CPUs, 1: no pool).
 
     Returns:
         str: The path to the output file.
 
-    Raises:
-        ValueError: If no JSON files are found in the directory.
-
     """
-    # Create a dictionary to store the file info
-    file = {}
-
     # Write the info header
-    file["info"] = {
+    info = {
         "description": "Exported from DLTA-AI",
         # "url": "n/a",
         # "version": "n/a",
@@ -164,92 +235,87 @@ def exportCOCO(json_paths, annotation_path):
         "date_created": datetime.date.today().strftime("%Y/%m/%d")
     }
 
-    # Create an empty set to store the used classes
+    # category ids are 1-based indices in coco_classes, followed by the non COCO classes
+    class_names = list(coco_classes)
+    category_ids = {name: i + 1 for i, name in enumerate(class_names)}
     used_classes = set()
-
-    # Create empty lists to store annotations and images
-    annotations = []
-    images = []
-
-    # Loop through each JSON file
-    for i in range(len(json_paths)):
-        try:
-            with open(json_paths[i]) as f:
-                # Load the JSON data
-                data = json.load(f)
-
-                # Add image data to the images list
-                images.append({
-                    "id": i,
-                    "width": data["imageWidth"],
-                    "height": data["imageHeight"],
-                    "file_name": json_paths[i].split("/")[-1].replace(".json", ".jpg"),
-                })
-
-                # Loop through each shape in the JSON data
-                for j in range(len(data["shapes"])):
-                    # Skip shapes with no points
-                    if len(data["shapes"][j]["points"],) == 0:
-                        continue
-
-                    # Add the class to the used_classes set if it hasn't been added yet
-                    if data["shapes"][j]["label"].lower() not in coco_classes:
-                        print(f"{data['shapes'][j]['label']} is not a valid COCO class.. Adding it to the list.")
-                        coco_classes.append((data["shapes"][j]["label"].lower()))
-
-                    # Add annotation data to the annotations list
-                    annotations.append({
-                        "id": len(annotations),
-                        "image_id": i,
-                        "category_id": coco_classes.index(data["shapes"][j]["label"].lower()) + 1,
-                        "bbox": get_bbox(data["shapes"][j]["points"]),
-                        "iscrowd": 0
-                    })
-
-                    # Try to add segmentation and area data to the annotation
-                    try:
-                        annotations[-1]["segmentation"] = [data["shapes"][j]["points"]]
-                        annotations[-1]["area"] = get_area_from_polygon(
-                            annotations[-1]["segmentation"][0], mode="segmentation")
-                    except:
-                        annotations[-1]["area"] = get_area_from_polygon(
-                            annotations[-1]["bbox"], mode="bbox")
-
-                    # Try to add score data to the annotation
-                    try:
-                        annotations[-1]["score"] = float(data["shapes"][j]["content"])
-                    except:
-                        pass
-
-                    # Add the class to the used_classes set
-                    used_classes.add(coco_classes.index(data["shapes"][j]["label"].lower()) + 1)
-
-        # If there's an error with the JSON file, print the error and continue to the next file
-        except Exception as e:
-            print(f"Error with {json_paths[i]}")
-            print(e)
-            continue
-
-    # Sort the used_classes set and add the categories to the file dictionary
-    used_classes = sorted(used_classes)
-    file["categories"] = [{"id": i, "name": coco_classes[i - 1]} for i in used_classes]
-
-    # Add the images and annotations to the file dictionary
-    file["images"] = images
-    file["annotations"] = annotations
-
-    # Write the file dictionary to the output file in JSON format
-    with open(annotation_path, 'w') as outfile:
-        json.dump(file, outfile, indent=4)
+    num_images = 0
+    num_annotations = 0
+
+    # the annotations are streamed to a temporary file and appended after the images
+    with open(annotation_path, "wb") as outfile, tempfile.TemporaryFile() as annotations_file:
+        outfile.write(b'{"info": ' + orjson.dumps(info) + b', "images": [')
+        for image, shapes, error in _parse_label_files(json_paths, workers):
+            # If there's an error with the JSON file, print the error and continue to the next file
+            if error is not None:
+                print(error)
+                continue
+            outfile.write((b", " if num_images else b"") + orjson.dumps(image))
+            num_images += 1
+
+            for label, annotation in shapes:
+                if label not in category_ids:
+                    print(f"{label} is not a valid COCO class.. Adding it to the list.")
+                    class_names.append(label)
+                    category_ids[label] = len(class_names)
+                category_id = category_ids[label]
+                used_classes.add(category_id)
+                annotation = {"id": num_annotations, "image_id": image["id"],
+                              "category_id": category_id, **annotation}
+                annotations_file.write((b", " if num_annotations else b"") + orjson.dumps(annotation))
+                num_annotations += 1
+
+        outfile.write(b'], "annotations": [')
+        annotations_file.seek(0)
+        shutil.copyfileobj(annotations_file, outfile)
+        categories = [{"id": i, "name": class_names[i - 1]} for i in sorted(used_classes)]
+        outfile.write(b'], "categories": ' + orjson.dumps(categories) + b'}')
 
     # Return the path to the output file
     return annotation_path
 
 
+def _segments_bbox_and_area(segments):
+    """
+    Calculates the bounding boxes and areas of the segments of a frame at once.
+
+    Args:
+        segments (list): The segments of the objects of a frame, each a list of [x, y] points.
+
+    Returns:
+        tuple: (Nx4 array of [x_min, y_min, width, height] bounding boxes, N areas), NaN for empty segments.
+    """
+    lengths = np.array([len(segment) for segment in segments], dtype=np.int64)
+    bboxes = np.full((len(segments), 4), np.nan)
+    areas = np.full(len(segments), np.nan)
+    valid = lengths > 0
+    if not valid.any():
+        return bboxes, areas
+
+    # all the points of the frame in one array, with the start of each segment
+    points = np.array([point for segment in segments for point in segment], dtype=np.float64).reshape(-1, 2)
+    starts = np.concatenate([[0], np.cumsum(lengths)[:-1]])[valid]
+    lengths = lengths[valid]
+
+    mins = np.minimum.reduceat(points, starts, axis=0)
+    maxs = np.maximum.reduceat(points, starts, axis=0)
+    bboxes[valid] = np.hstack([mins, maxs - mins])
+
+    # shoelace formula, the previous point of the first point of a segment is its last point
+    previous = np.roll(points, 1, axis=0)
+    previous[starts] = points[starts + lengths - 1]
+    cross = points[:, 0] * previous[:, 1] - points[:, 1] * previous[:, 0]
+    areas[valid] = 0.5 * np.abs(np.add.reduceat(cross, starts))
+    return bboxes, areas
+
+
 def exportCOCOvid(results_file, vid_width, vid_height, annotation_path):
     """
     Export object detection results in COCO format for a video.
 
+    The frames are read from the results file one at a time and the images and annotations
+    are written as they are read, so large results files are exported in constant memory.
+
     Args:
         results_file (str): Path to the JSON file containing the object detection results.
         vid_width (int): Width of the video frames.
@@ -259,12 +325,8 @@ def exportCOCOvid(results_file, vid_width, vid_height, annotation_path):
     Returns:
         str: Path to the output COCO annotation file.
 
-    Raises:
-        ValueError: If no object detection results are found in the JSON file.
-
     """
-    file = {}
-    file["info"] = {
+    info = {
         "description": "Exported from DLTA-AI",
         # "url": "n/a",
         # "version": "n/a",
@@ -273,78 +335,77 @@ def exportCOCOvid(results_file, vid_width, vid_height, annotation_path):
         "date_created": datetime.date.today().strftime("%Y/%m/%d")
     }
 
-    annotations = []
-    images = []
-
-    # Create an empty set to store the used classes
+    # category ids are class_id + 1, classes not in coco_classes are added after them
+    class_names = list(coco_classes)
+    custom_category_ids = {}
     used_classes = set()
+    num_images = 0
+    num_annotations = 0
 
-    # Open the results file and load the JSON data
-    with open(results_file) as f:
-        data = json.load(f)
+    # the annotations are streamed to a temporary file and appended after the images
+    with open(annotation_path, "wb") as outfile, tempfile.TemporaryFile() as annotations_file:
+        outfile.write(b'{"info": ' + orjson.dumps(info) + b', "images": [')
 
-        # Loop through each frame in the JSON data
-        for frame in data:
+        # Loop through each frame of the results file
+        for frame in iter_objects_from_json(results_file):
             # Skip frames with no object detection results
             if len(frame["frame_data"]) == 0:
                 continue
 
-            # Add image data to the images list
-            images.append({
+            image = {
                 "id": frame["frame_idx"],
                 "width": vid_width,
                 "height": vid_height,
                 "file_name": f"frame {frame['frame_idx']}",
-            })
-
-            # Loop through each object in the frame
-            for object in frame["frame_data"]:
-                # Add annotation data to the annotations list
-                annotations.append({
-                    "id": len(annotations),
+            }
+            outfile.write((b", " if num_images else b"") + orjson.dumps(image))
+            num_images += 1
+
+            segments = [object.get("segment") or [] for object in frame["frame_data"]]
+            bboxes, areas = _segments_bbox_and_area(segments)
+
+            chunk = []
+            for object, segment, bbox, area in zip(frame["frame_data"], segments, bboxes.tolist(), areas.tolist()):
+                category_id = object["class_id"] + 1
+                # If the class is not a COCO class, give it the next category id after the known classes
+                if category_id == 0:
+                    class_name = object["class_name"].lower()
+                    if class_name not in custom_category_ids:
+                        class_names.append(class_name)
+                        custom_category_ids[class_name] = len(class_names)
+                    category_id = custom_category_ids[class_name]
+
+                annotation = {
+                    "id": num_annotations,
                     "image_id": frame["frame_idx"],
-                    "category_id": object["class_id"] + 1,
+                    "category_id": category_id,
                     "iscrowd": 0
-                })
-
-                # If the category ID is 0, add the class to the coco_classes list and update the category ID
-                if annotations[-1]["category_id"] == 0:
-                    coco_classes.append(object["class_name"].lower())
-                    annotations[-1]["category_id"] = coco_classes.index(object["class_name"].lower()) + 1
-
-                # Try to add the object's segmentation data to the annotation
-                try:
-                    annotations[-1]["bbox"] = get_bbox(object["segment"])
-                    annotations[-1]["segmentation"] = [
-                        [val for sublist in object["segment"] for val in sublist]]
-                    annotations[-1]["area"] = get_area_from_polygon(
-                        annotations[-1]["segmentation"][0], mode="segmentation")
-                except:
+                }
+                if len(segment):
+                    annotation["bbox"] = bbox
+                    annotation["segmentation"] = [[val for point in segment for val in point]]
+                    annotation["area"] = area
+                else:
                     # If the segmentation data is not available, use the object's bounding box data instead
-                    annotations[-1]["bbox"] = object["bbox"]
-                    annotations[-1]["area"] = get_area_from_polygon(
-                        annotations[-1]["bbox"], mode="bbox")
+                    annotation["bbox"] = object["bbox"]
+                    annotation["area"] = get_area_from_polygon(annotation["bbox"], mode="bbox")
 
                 # Try to add the object's confidence score to the annotation
                 try:
-                    annotations[-1]["score"] = float(object["confidence"])
+                    annotation["score"] = float(object["confidence"])
                 except:
                     pass
 
-                # Add the category ID to the used_classes set
-                used_classes.add(annotations[-1]["category_id"])
+                used_classes.add(category_id)
+                chunk.append((b", " if num_annotations else b"") + orjson.dumps(annotation))
+                num_annotations += 1
+            annotations_file.write(b"".join(chunk))
 
-    # Sort the used_classes set and add the categories to the file dictionary
-    used_classes = sorted(list(used_classes))
-    file["categories"] = [{"id": i, "name": coco_classes[i - 1]} for i in used_classes]
-
-    # Add the images and annotations to the file dictionary
-    file["images"] = images
-    file["annotations"] = annotations
-
-    # Write the file dictionary to the output file in JSON format
-    with open(annotation_path, 'w') as outfile:
-        json.dump(file, outfile, indent=4)
+        outfile.write(b'], "annotations": [')
+        annotations_file.seek(0)
+        shutil.copyfileobj(annotations_file, outfile)
+        categories = [{"id": i, "name": class_names[i - 1]} for i in sorted(used_classes)]
+        outfile.write(b'], "categories": ' + orjson.dumps(categories) + b'}')
 
     # Return the path to the output file
     return annotation_path
@@ -354,6 +415,8 @@ def exportMOT(results_file, annotation_path):
     """
     Export object tracking results in MOT format.
 
+    The frames are read from the results file and written one at a time.
+
     Args:
         results_file (str): Path to the JSON file containing the object tracking results.
         annotation_path (str): Path to the output MOT annotation file.
@@ -363,13 +426,13 @@ def exportMOT(results_file, annotation_path):
 
     """
 
-    # Open the results file and load the JSON data
-    with open(results_file) as f, open(annotation_path, 'w') as outfile:
-        # Loop through each frame in the JSON data
-        for frame in json.load(f):
-            for object in frame["frame_data"]:
-                # Write the object tracking data to the output file
-                outfile.write(f'{frame["frame_idx"]}, {object["tracker_id"]},  {object["bbox"][0]},  {object["bbox"][1]},  {object["bbox"][2]},  {object["bbox"][3]},  {object["confidence"]}, {object["class_id"] + 1}, 1\n')
+    with open(annotation_path, 'w') as outfile:
+        # Loop through each frame of the results file
+        for frame in iter_objects_from_json(results_file):
+            # Write the object tracking data of the frame to the output file
+            outfile.write("".join(
+                f'{frame["frame_idx"]}, {object["tracker_id"]},  {object["bbox"][0]},  {object["bbox"][1]},  {object["bbox"][2]},  {object["bbox"][3]},  {object["confidence"]}, {object["class_id"] + 1}, 1\n'
+                for object in frame["frame_data"]))
 
     # Return the path to the output file
     return annotation_path
@@ -0,0 +1,208 @@
+import argparse
+import json
+import os
+import re
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2
+
+
+# Frame extraction engine used by the "Open Video as Frames" dialog and by the
+# command line (python -m labelme.utils.frame_extraction VIDEO ...).
+# Skipped frames are only grabbed (not decoded) or seeked over when the gap is
+# large, the images are encoded on a thread pool and frames already extracted
+# by a previous (stopped) run are kept, so an extraction can be resumed.
+
+FORMATS = ["jpg", "png", "webp"]
+
+# the encoding settings of the frames of a directory, frames are only resumed with the same settings
+SETTINGS_FILE = ".frame_extraction.json"
+
+
+def get_time_string(seconds, separator=":"):
+    # Convert seconds to hh:mm:ss format
+    m, s = divmod(seconds, 60)
+    h, m = divmod(m, 60)
+    return f"{int(h):02d}{separator}{int(m):02d}{separator}{int(s):02d}"
+
+
+def frames_path_for(vid_path):
+    return "".join([vid_path.split(".")[0], "_frames"])
+
+
+def frame_file_name(count, n_frames, fps, image_format="jpg"):
+    # the time in the video corresponding to the frame is in the file name
+    time_str = get_time_string(count / fps, separator="_")
+    indented_count = str(count).zfill(len(str(n_frames)))
+    return f"frame_{indented_count}_time_{time_str}.{image_format}"
+
+
+def encode_params(image_format, quality):
+    if image_format == "jpg":
+        return [cv2.IMWRITE_JPEG_QUALITY, int(quality)]
+    if image_format == "webp":
+        return [cv2.IMWRITE_WEBP_QUALITY, int(quality)]
+    # png is lossless, use a fast compression
+    return [cv2.IMWRITE_PNG_COMPRESSION, 1]
+
+
+def encode_settings(image_format, quality):
+    # png is lossless, its frames do not depend on the quality
+    return {"format": image_format, "quality": None if image_format == "png" else int(quality)}
+
+
+def read_settings(frames_path):
+    try:
+        with open(os.path.join(frames_path, SETTINGS_FILE), "r") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def write_settings(frames_path, settings):
+    with open(os.path.join(frames_path, SETTINGS_FILE), "w") as f:
+        json.dump(settings, f)
+
+
+def _write(path, image, image_format, params):
+    success, buffer = cv2.imencode(f".{image_format}", image, params)
+    if not success:
+        raise IOError(f"Failed encoding {path}")
+    # written under a temporary name, so a file with the frame name is always complete
+    tmp_path = os.path.join(os.path.dirname(path), f".{os.path.basename(path)}.tmp")
+    with open(tmp_path, "wb") as f:
+        f.write(buffer.tobytes())
+    os.replace(tmp_path, path)
+
+
+def extract_frames(vid_path, sampling_rate=1, start_frame=0, end_frame=None, frames_path=None,
+                   image_format="jpg", quality=95, workers=None, resume=True, seek_threshold=250,
+                   progress=None, stop=None):
+    """
+    Summary:
+        Extract the frames of a video whose index is a multiple of `sampling_rate` to images.
+
+    Args:
+        vid_path (str): path to the video file
+        sampling_rate (int): how often to save a frame (2: every other frame)
+        start_frame (int): first frame
+        end_frame (int): frame after the last one (None: end of the video)
+        frames_path (str): output directory (None: `<video>_frames` next to the video)
+        image_format (str): "jpg", "png" or "webp"
+        quality (int): JPEG/WebP quality (0-100)
+        workers (int): number of encoding threads (None: number of CPUs)
+        resume (bool): keep the frames already extracted with the same format and quality,
+            otherwise they are extracted again
+        seek_threshold (int): seek instead of grabbing the skipped frames when more than this many are skipped
+        progress (callable): called with (number of frames done, number of frames to extract)
+        stop (callable): returns True to stop the extraction
+
+    Returns:
+        frames_path (str): the output directory
+    """
+    if not os.path.exists(vid_path):
+        raise ValueError("Video path does not exist")
+    if image_format not in FORMATS:
+        raise ValueError(f"Image format must be one of {FORMATS}")
+
+    vidcap = cv2.VideoCapture(vid_path)
+    if not vidcap.isOpened():
+        raise ValueError("Video file cannot be opened")
+    fps = vidcap.get(cv2.CAP_PROP_FPS)
+    n_frames = int(vidcap.get(cv2.CAP_PROP_FRAME_COUNT))
+    end_frame = n_frames if end_frame is None else min(end_frame, n_frames)
+    print(f"Total number of frames: {n_frames}")
+
+    # Create a directory to store the frames
+    frames_path = frames_path or frames_path_for(vid_path)
+    os.makedirs(frames_path, exist_ok=True)
+
+    sampling_rate = max(int(sampling_rate), 1)
+    first = -(-start_frame // sampling_rate) * sampling_rate
+    names = {count: frame_file_name(count, n_frames, fps, image_format)
+             for count in range(first, end_frame, sampling_rate)}
+
+    # frames of a previous extraction with other settings are removed, the others are kept
+    # (only frame images are removed, not the label files of the frames), frames without
+    # the settings they were encoded with are extracted again
+    settings = encode_settings(image_format, quality)
+    resume = resume and read_settings(frames_path) == settings
+    wanted = set(names.values())
+    pattern = re.compile(r"^\.?frame_\d+_time_\d+_\d+_\d+\.(%s)(\.tmp)?$" % "|".join(FORMATS))
+    existing = set()
+    for file in os.listdir(frames_path):
+        if not pattern.match(file):
+            continue
+        if file in wanted and resume:
+            existing.add(file)
+        else:
+            os.remove(os.path.join(frames_path, file))
+    todo = [count for count in names if names[count] not in existing]
+    write_settings(frames_path, settings)
+
+    total = len(names)
+    done = total - len(todo)
+    if progress is not None:
+        progress(done, total)
+
+    params = encode_params(image_format, quality)
+    workers = workers or os.cpu_count() or 1
+    pending = []
+    position = None
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        try:
+            for count in todo:
+                if stop is not None and stop():
+                    break
+                # skipped frames are grabbed (not decoded), or seeked over if there are many
+                if position is None or count < position or count - position > seek_threshold:
+                    vidcap.set(cv2.CAP_PROP_POS_FRAMES, count)
+                else:
+                    for _ in range(count - position):
+                        vidcap.grab()
+                position = count + 1
+                success, image = vidcap.read()
+                if not success:
+                    break
+                pending.append(executor.submit(
+                    _write, os.path.join(frames_path, names[count]), image, image_format, params))
+
+                # bound the number of decoded frames waiting to be encoded
+                while len(pending) > 2 * workers or (pending and pending[0].done()):
+                    pending.pop(0).result()
+                    done += 1
+                    if progress is not None:
+                        progress(done, total)
+        finally:
+            for future in pending:
+                future.result()
+                done += 1
+                if progress is not None:
+                    progress(done, total)
+            vidcap.release()
+    return frames_path
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Extract the frames of a video to images")
+    parser.add_argument("video", help="path to the video file")
+    parser.add_argument("--output", default=None, help="output directory (default: <video>_frames)")
+    parser.add_argument("--sampling-rate", type=int, default=1, help="save every n-th frame")
+    parser.add_argument("--start", type=int, default=0, help="first frame")
+    parser.add_argument("--end", type=int, default=None, help="frame after the last one (default: end of the video)")
+    parser.add_argument("--format", choices=FORMATS, default="jpg", help="image format")
+    parser.add_argument("--quality", type=int, default=95, help="JPEG/WebP quality (0-100)")
+    parser.add_argument("--workers", type=int, default=None, help="number of encoding threads (default: number of CPUs)")
+    parser.add_argument("--no-resume", action="store_true", help="extract again the frames already extracted")
+    args = parser.parse_args()
+
+    def progress(done, total):
+        print(f"\r{done}/{total} frames", end="", flush=True)
+
+    frames_path = extract_frames(args.video, args.sampling_rate, args.start, args.end, args.output,
+                                 args.format, args.quality, args.workers, not args.no_resume, progress=progress)
+    print(f"\nFrames saved to {frames_path}")
+
+
+if __name__ == "__main__":
+    main()
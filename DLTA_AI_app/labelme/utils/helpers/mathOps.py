@@ -11,6 +11,7 @@ import copy
 from shapely.geometry import Polygon
 import skimage
 from labelme.shape import Shape
+from .. import compact_format
 
 coco_classes = ['person', 'bicycle', 'car', 'motorcycle', 'airplane', 'bus', 'train', 'truck', 'boat', 'traffic light',
                 'fire hydrant', 'stop sign', 'parking meter', 'bench', 'bird', 'cat', 'dog', 'horse', 'sheep', 'cow',
@@ -92,6 +93,9 @@ def addPoints(shape, n):
     """
     Summary:
         Add points to a polygon.
+        The points are added along the polygon (from its first to its last point) at even arc-length steps:
+        each edge gets a number of points proportional to its length, evenly spaced on it,
+        and the points of the polygon are kept.
         
     Args:
         shape: a list of points
@@ -101,38 +105,31 @@ def addPoints(shape, n):
         res: a list of points
     """
     
-    # calculate number of points to add between each pair of points
-    sub = 1.0 * n / (len(shape) - 1) 
-    
-    # if sub == 0, then n == 0, no need to add points    
-    if sub == 0:
+    # if n == 0, no need to add points
+    if n <= 0 or len(shape) == 0:
         return shape
-    
-    # if sub < 1, then we a point between every pair of points then we handle the points again
-    if sub < 1:
-        res = []
-        res.append(shape[0])
-        for i in range(len(shape) - 1):
-            newPoint = [(shape[i][0] + shape[i + 1][0]) / 2, (shape[i][1] + shape[i + 1][1]) / 2]
-            res.append(newPoint)
-            res.append(shape[i + 1])
-        return handlePoints(res, n + len(shape))
-    
-    # if sub > 1, then we add 'toBeAdded' points between every pair of points
-    else:
-        toBeAdded = int(sub) + 1
-        res = []
-        res.append(shape[0])
-        for i in range(len(shape) - 1):
-            dif = [shape[i + 1][0] - shape[i][0],
-                    shape[i + 1][1] - shape[i][1]]
-            for j in range(1, toBeAdded):
-                newPoint = [shape[i][0] + dif[0] * j /
-                            toBeAdded, shape[i][1] + dif[1] * j / toBeAdded]
-                res.append(newPoint)
-            res.append(shape[i + 1])
-        # recursive call to check if there are any points to add
-        return addPoints(res, n + len(shape) - len(res))
+    points = np.asarray(shape, dtype=float).reshape(-1, 2)
+    if len(points) == 1:
+        return np.repeat(points, n + 1, axis=0).tolist()
+    
+    # number of points added on each edge, proportional to its length (largest remainders first)
+    lengths = np.hypot(*np.diff(points, axis=0).T)
+    total = lengths.sum()
+    shares = n * lengths / total if total > 0 else np.full(len(lengths), n / len(lengths))
+    counts = np.floor(shares).astype(int)
+    remainder = n - counts.sum()
+    if remainder > 0:
+        counts[np.argsort(counts - shares, kind='stable')[:remainder]] += 1
+    
+    # every edge is followed by its added points: the point of edge i at j / (counts[i] + 1) of it
+    edges = np.repeat(np.arange(len(lengths)), counts)
+    steps = np.arange(len(edges)) - np.repeat(np.cumsum(counts) - counts, counts) + 1
+    fractions = (steps / (counts[edges] + 1))[:, None]
+    added = points[edges] + fractions * (points[edges + 1] - points[edges])
+    
+    # the added points are inserted after the first point of their edge
+    res = np.insert(points, np.repeat(np.arange(1, len(points)), counts), added, axis=0)
+    return res.tolist()
 
 def reducePoints(polygon, n):
     
@@ -151,53 +148,40 @@ def reducePoints(polygon, n):
     if n >= len(polygon):
         return polygon
     
-    # calculate the distance between each point and: 
-    # 1- its previous point
-    # 2- its next point
-    # 3- the middle point between its previous and next points
-    # taking the minimum of these distances as the distance of the point
-    distances = polygon.copy()
-    for i in range(len(polygon)):
-        x1,y1,x2,y2 = polygon[i-1][0], polygon[i-1][1], polygon[(i+1)%len(polygon)][0], polygon[(i+1)%len(polygon)][1]
-        x,y = polygon[i][0], polygon[i][1]
+    points = np.asarray(polygon)
+    keep = np.arange(len(points))
+    while len(keep) > n:
+        p = points[keep].astype(float)
+        prev, next = np.roll(p, 1, axis=0), np.roll(p, -1, axis=0)
         
-        if x1 == x2:
-            dist_perp = abs(x - x1)
-        elif y1 == y2:
-            dist_perp = abs(y - y1)
-        else:
-            m = (y2 - y1) / (x2 - x1)
-            c = y1 - m * x1
-            dist_perp = abs(m * x - y + c) / np.sqrt(m * m + 1)
+        # the distance between each point and: 
+        # 1- its previous point
+        # 2- its next point
+        # 3- the line between its previous and next points
+        # taking the minimum of these distances as the distance of the point
+        dist_left = np.hypot(*(prev - p).T)
+        dist_right = np.hypot(*(next - p).T)
+        chord = next - prev
+        chord_length = np.hypot(*chord.T)
+        cross = np.abs(chord[:, 0] * (p[:, 1] - prev[:, 1]) - chord[:, 1] * (p[:, 0] - prev[:, 0]))
+        dist_perp = np.divide(cross, chord_length, out=np.full(len(p), np.inf), where=chord_length > 0)
+        distances = np.minimum(np.minimum(dist_perp, dist_left), dist_right)
         
-        dif_right = np.array(
-            polygon[(i + 1) % len(polygon)]) - np.array(polygon[i])
-        dist_right = np.sqrt(
-            dif_right[0] * dif_right[0] + dif_right[1] * dif_right[1])
-
-        dif_left = np.array(polygon[i - 1]) - np.array(polygon[i])
-        dist_left = np.sqrt(
-            dif_left[0] * dif_left[0] + dif_left[1] * dif_left[1])
-
-        distances[i] = min(dist_perp, dist_right, dist_left)
-    
-    # adding small random values to distances to avoid duplicate minimum distances
-    # it will not affect the result
-    distances = [distances[i] + random.random()
-                    for i in range(len(distances))]
-    ratio = 1.0 * n / len(polygon)
-    threshold = np.percentile(distances, 100 - ratio * 100)
-
-    i = 0
-    while i < len(polygon):
-        if distances[i] < threshold:
-            polygon[i] = None
-            i += 1
-        i += 1
-    res = [x for x in polygon if x is not None]
-    
-    # recursive call to check if there are any points to remove
-    return reducePoints(res, n)
+        # the points with the smallest distances are removed, but not two neighbours at once
+        # (every other point of a run of neighbours), the distances are calculated again for the rest
+        remove = np.zeros(len(p), dtype=bool)
+        remove[np.argsort(distances, kind='stable')[:len(keep) - n]] = True
+        run_start = np.flatnonzero(remove & ~np.roll(remove, 1))
+        if len(run_start) == 0:
+            # all the points are to be removed (n == 0)
+            return []
+        # (the position of each point in its run, a run can wrap around the end of the polygon)
+        index = np.arange(len(p))
+        run_position = (index - run_start[np.searchsorted(run_start, index, side='right') - 1]) % len(p)
+        remove &= run_position % 2 == 0
+        keep = keep[~remove]
+    
+    return points[keep].tolist()
 
 def handlePoints(polygon, n):
     
@@ -251,33 +235,49 @@ def allign(shape1, shape2):
     
     """
     Summary:
-        Allign the points of two polygons according to their slopes.
+        Allign the points of two polygons: both polygons are oriented the same way (by decreasing slopes
+        around their centers), the first one starts at its point of largest slope and the second one
+        at the point giving the closest match of the two polygons, found for all the starting points at once
+        with a circular cross-correlation (FFT) of the polygons around their centers.
         
     Args:
         shape1: a list of points
-        shape2: a list of points
+        shape2: a list of points (with the same number of points)
         
     Returns:
         shape1_alligned: a list of points
         shape2_alligned: a list of points
     """
     
-    shape1_center = centerOFmass(shape1)
-    shape1_org = [[shape1[i][0] - shape1_center[0], shape1[i]
-                    [1] - shape1_center[1]] for i in range(len(shape1))]
-    shape2_center = centerOFmass(shape2)
-    shape2_org = [[shape2[i][0] - shape2_center[0], shape2[i]
-                    [1] - shape2_center[1]] for i in range(len(shape2))]
+    shape1 = np.asarray(shape1)
+    shape2 = np.asarray(shape2)
+    if len(shape1) < 3 or len(shape1) != len(shape2):
+        return (shape1.tolist(), shape2.tolist())
+    
+    shape1_org = shape1 - centerOFmass(shape1)
+    shape2_org = shape2 - centerOFmass(shape2)
+    
+    # orienting the polygons by decreasing slopes (negative signed area)
+    def orient(shape, shape_org):
+        area = np.sum(shape_org[:, 0] * np.roll(shape_org[:, 1], -1) - np.roll(shape_org[:, 0], -1) * shape_org[:, 1])
+        return (shape[::-1], shape_org[::-1]) if area > 0 else (shape, shape_org)
     
-    # sorting the points according to their slopes
-    sorted_shape1 = sorted(shape1_org, key=lambda x: np.arctan2(x[1], x[0]), reverse=True)
-    sorted_shape2 = sorted(shape2_org, key=lambda x: np.arctan2(x[1], x[0]), reverse=True)
-    shape1_alligned = [[sorted_shape1[i][0] + shape1_center[0], sorted_shape1[i]
-                        [1] + shape1_center[1]] for i in range(len(sorted_shape1))]
-    shape2_alligned = [[sorted_shape2[i][0] + shape2_center[0], sorted_shape2[i]
-                        [1] + shape2_center[1]] for i in range(len(sorted_shape2))]
+    shape1, shape1_org = orient(shape1, shape1_org)
+    shape2, shape2_org = orient(shape2, shape2_org)
     
-    return (shape1_alligned, shape2_alligned)
+    # the first polygon starts at its point of largest slope
+    start1 = int(np.argmax(np.arctan2(shape1_org[:, 1], shape1_org[:, 0])))
+    shape1, shape1_org = np.roll(shape1, -start1, axis=0), np.roll(shape1_org, -start1, axis=0)
+    
+    # the shift of the second polygon with the smallest sum of squared distances to the first one
+    # is the one with the largest correlation of the points (as complex numbers) around their centers
+    z1 = shape1_org[:, 0] + 1j * shape1_org[:, 1]
+    z2 = shape2_org[:, 0] + 1j * shape2_org[:, 1]
+    correlation = np.fft.ifft(np.fft.fft(z2) * np.conj(np.fft.fft(z1))).real
+    start2 = int(np.argmax(correlation))
+    shape2 = np.roll(shape2, -start2, axis=0)
+    
+    return (shape1.tolist(), shape2.tolist())
 
 def centerOFmass(points):
     
@@ -673,6 +673,10 @@ def load_objects_from_json__json(json_file_name, nTotalFrames):
         listObj: a list of objects (each object is a dictionary of a frame with keys (frame_idx, frame_data))
     """
     
+    # compact tracking results are read if they are newer than the json file
+    results_file = compact_format.resolve(json_file_name)
+    if compact_format.is_compact(results_file):
+        return compact_format.load_tracking_results(results_file)
     listObj = [{'frame_idx': i + 1, 'frame_data': []}
                 for i in range(nTotalFrames)]
     if not os.path.exists(json_file_name):
@@ -720,6 +724,10 @@ def load_objects_from_json__orjson(json_file_name, nTotalFrames):
         listObj: a list of objects (each object is a dictionary of a frame with keys (frame_idx, frame_data))
     """
     
+    # compact tracking results are read if they are newer than the json file
+    results_file = compact_format.resolve(json_file_name)
+    if compact_format.is_compact(results_file):
+        return compact_format.load_tracking_results(results_file)
     listObj = [{'frame_idx': i + 1, 'frame_data': []}
                 for i in range(nTotalFrames)]
     if not os.path.exists(json_file_name):
@@ -749,6 +757,52 @@ def load_objects_to_json__orjson(json_file_name, listObj):
         jf.write(orjson.dumps(listObj, option=orjson.OPT_INDENT_2))
     jf.close()
 
+def iter_objects_from_json(json_file_name, chunk_size=1 << 20):
+    
+    """
+    Summary:
+        Iterate over the frames of a json file one at a time without loading the whole file,
+        the file is read in chunks and only the frame being parsed is kept in memory.
+        Compact tracking results are read instead if they are newer than the json file.
+        
+    Args:
+        json_file_name: the name of the json file
+        chunk_size: the number of characters read at once
+        
+    Returns:
+        frames: a generator of the frames (each frame is a dictionary with keys (frame_idx, frame_data))
+    """
+    
+    results_file = compact_format.resolve(json_file_name)
+    if compact_format.is_compact(results_file):
+        yield from compact_format.iter_tracking_results(results_file)
+        return
+    decoder = json.JSONDecoder()
+    with open(json_file_name, 'r') as jf:
+        buffer, pos, eof, opened = "", 0, False, False
+        while True:
+            # skip the whitespace, the opening bracket of the list and the separators between frames
+            while pos < len(buffer) and (buffer[pos] in " \t\r\n," or (buffer[pos] == "[" and not opened)):
+                opened = opened or buffer[pos] == "["
+                pos += 1
+            if pos < len(buffer) and buffer[pos] == "]":
+                return
+            if pos < len(buffer):
+                try:
+                    frame, end = decoder.raw_decode(buffer, pos)
+                    yield frame
+                    pos = end
+                    continue
+                except json.JSONDecodeError:
+                    # the frame is not complete in the buffer, read more
+                    if eof:
+                        raise
+            elif eof:
+                return
+            # read at least as much as the buffer holds so a frame larger than a chunk is parsed in linear time
+            chunk = jf.read(max(chunk_size, len(buffer) - pos))
+            buffer, pos, eof = buffer[pos:] + chunk, 0, not chunk
+
 def scaleQTshape(self, originalshape, center, ratioX, ratioY):
     
     """
@@ -874,6 +928,50 @@ def getInterpolated(baseObject, baseObjectFrame, nextObject, nextObjectFrame, cu
     
     return cur
 
+def getInterpolatedGap(baseObject, baseObjectFrame, nextObject, nextObjectFrame):
+    
+    """
+    Summary:
+        Interpolate a shape for all the frames between two frames using linear interpolation
+        (as getInterpolated does for one frame), the two segments are matched once
+        and the shapes of all the frames are calculated together.
+        
+    Args:
+        baseObject: the base object
+        baseObjectFrame: the base object frame
+        nextObject: the next object
+        nextObjectFrame: the next object frame
+        
+    Returns:
+        objects: the interpolated shapes of the frames from baseObjectFrame + 1 to nextObjectFrame - 1
+    """
+    
+    frames = np.arange(baseObjectFrame + 1, nextObjectFrame)
+    if len(frames) == 0:
+        return []
+    
+    # the ratios of all the frames as a column, broadcast over the bbox and segment coordinates
+    prvR = ((nextObjectFrame - frames) / (nextObjectFrame - baseObjectFrame))[:, None]
+    nxtR = ((frames - baseObjectFrame) / (nextObjectFrame - baseObjectFrame))[:, None]
+    
+    cur_bboxes = prvR * np.array(baseObject['bbox'], dtype=float) + nxtR * np.array(nextObject['bbox'], dtype=float)
+    cur_bboxes = cur_bboxes.astype(int).tolist()
+    
+    (base_segment, next_segment) = handleTwoSegments(baseObject['segment'], nextObject['segment'])
+    
+    cur_segments = prvR[:, :, None] * np.array(base_segment, dtype=float)[None, :, :] + \
+        nxtR[:, :, None] * np.array(next_segment, dtype=float)[None, :, :]
+    cur_segments = cur_segments.astype(int).tolist()
+    
+    objects = []
+    for cur_bbox, cur_segment in zip(cur_bboxes, cur_segments):
+        cur = {key: value for key, value in baseObject.items() if key not in ('bbox', 'segment')}
+        cur['bbox'] = cur_bbox
+        cur['segment'] = cur_segment
+        objects.append(cur)
+    
+    return objects
+
 def update_saved_models_json(cwd):
     
     """
@@ -918,8 +1016,7 @@ def delete_id_from_rec_and_traj(id, id_frames_rec, trajectories, frames):
     id_frames_rec['id_' + str(id)] = id_frames_rec['id_' + str(id)] - set(frames)
     
     # remove frames from trajectories for this id
-    for frame in frames:
-        trajectories['id_' + str(id)][frame - 1] = (-1, -1)
+    trajectories.remove(id, frames)
         
     return id_frames_rec, trajectories
     
@@ -1048,15 +1145,16 @@ def OURnms_confidenceBased(shapes, iou_threshold=0.5):
     return shapesFinal, boxesFinal, confidencesFinal, class_idsFinal, segmentsFinal
 
 
-def OURnms_areaBased_fromSAM(self, sam_result, iou_threshold=0.5):
+def OURnms_areaBased_fromSAM(sam_result, iou_threshold=0.5):
         
     iou_threshold = float(iou_threshold)
 
     # Sort shapes by their areas
     sortedResult = sorted(sam_result, key=lambda x: x['area'], reverse=True)
-    masks = [ mask['segmentation'] for mask in sortedResult]
     scores = [mask['stability_score'] for mask in sortedResult]
-    polygons = [mask_to_polygons(mask) for mask in masks]
+    # the results may already be polygons (instead of boolean masks)
+    polygons = [mask['polygon'] if 'polygon' in mask else mask_to_polygons(mask['segmentation'])
+                for mask in sortedResult]
     
     toBeRemoved = []
 
@@ -1077,7 +1175,7 @@ def OURnms_areaBased_fromSAM(self, sam_result, iou_threshold=0.5):
     for i in range(len(polygons)):
         if i in toBeRemoved:
             continue
-        shapes.append(self.polygon_to_shape(polygons[i], scores[i], f'X{i}'))
+        shapes.append(polygon_to_shape(polygons[i], scores[i], f'X{i}'))
 
     return shapes
 
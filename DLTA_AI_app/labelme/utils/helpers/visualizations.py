@@ -118,21 +118,18 @@ def draw_trajectories(trajectories, CurrentFrameIndex, flags, img, shapes):
         img: a cv2 image
     """
     
-    x = trajectories['length']
     for shape in shapes:
         id = shape["group_id"]
-        pts_traj = trajectories['id_' + str(id)][max(
-            CurrentFrameIndex - x, 0): CurrentFrameIndex]
+        pts_traj = trajectories.points(id, CurrentFrameIndex)
         pts_poly = np.array([[x, y] for x, y in zip(
             shape["points"][0::2], shape["points"][1::2])])
-        color_poly = trajectories['id_color_' + str(
-            id)]
+        color_poly = trajectories.color(id)
 
         if flags['mask']:
             original_img = img.copy()
             if pts_poly is not None:
                 cv2.fillPoly(img, pts=[pts_poly], color=color_poly)
-            alpha = trajectories['alpha']
+            alpha = trajectories.alpha
             img = cv2.addWeighted(original_img, alpha, img, 1 - alpha, 0)
         for i in range(len(pts_traj) - 1, 0, - 1):
 
@@ -141,9 +138,8 @@ def draw_trajectories(trajectories, CurrentFrameIndex, flags, img, shapes):
             # max_thickness = 6
             # thickness = max(1, round(i / len(pts_traj) * max_thickness))
 
+            # the trajectory stops at the first frame without the object
             if pts_traj[i - 1] is None or pts_traj[i] is None:
-                continue
-            if pts_traj[i] == (-1, - 1) or pts_traj[i - 1] == (-1, - 1):
                 break
 
             # color_traj = tuple(int(0.95 * x) for x in color_poly)
@@ -199,33 +195,7 @@ def draw_bb_on_image(trajectories, CurrentFrameIndex, flags, nTotalFrames, image
         img = draw_bb_id(flags, img, x, y, w, h, id, conf,
                                 label, color, thickness=1)
         center = (int((x1 + x2) / 2), int((y1 + y2) / 2))
-        try:
-            centers_rec = trajectories['id_' + str(id)]
-            try:
-                (xp, yp) = centers_rec[CurrentFrameIndex - 2]
-                (xn, yn) = center
-                if (xp == -1 or xn == -1):
-                    c = 5 / 0
-                r = 0.5
-                x = r * xn + (1 - r) * xp
-                y = r * yn + (1 - r) * yp
-                center = (int(x), int(y))
-            except:
-                pass
-            centers_rec[CurrentFrameIndex - 1] = center
-            trajectories['id_' +
-                                                    str(id)] = centers_rec
-            trajectories['id_color_' +
-                                                    str(id)] = color
-        except:
-            centers_rec = [(-1, - 1)] * int(nTotalFrames)
-            centers_rec[CurrentFrameIndex - 1] = center
-            trajectories['id_' +
-                                                    str(id)] = centers_rec
-            trajectories['id_color_' +
-                                                    str(id)] = color
-
-    # print(sys.getsizeof(trajectories))
+        trajectories.add(id, CurrentFrameIndex, center, color)
 
     img = draw_trajectories(trajectories, CurrentFrameIndex, flags, img, shapes)
 
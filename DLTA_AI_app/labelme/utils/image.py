@@ -5,6 +5,7 @@ import numpy as np
 import PIL.ExifTags
 import PIL.Image
 import PIL.ImageOps
+from PyQt6 import QtGui
 
 
 def img_data_to_pil(img_data):
@@ -99,3 +100,102 @@ def apply_exif_orientation(image):
         return image.transpose(PIL.Image.ROTATE_90)
     else:
         return image
+
+
+def read_image_size(filename):
+    """Return the (height, width) of an image file with its EXIF orientation
+    applied, reading only the header of the file."""
+    with PIL.Image.open(filename) as image_pil:
+        width, height = image_pil.size
+        try:
+            orientation = image_pil.getexif().get(0x0112)
+        except Exception:
+            orientation = None
+    if orientation in [5, 6, 7, 8]:
+        # rotated by 90 or 270 degrees
+        return width, height
+    return height, width
+
+
+def to_rgb(image_pil):
+    """Convert a PIL image to RGB for display and inference: transparent
+    images are composited onto white and 16-bit or float images are scaled
+    to their range instead of being clipped to 8 bits."""
+    if image_pil.mode == "RGB":
+        return image_pil
+    if image_pil.mode in ["I", "F"] or image_pil.mode.startswith("I;16"):
+        array = np.asarray(image_pil, dtype=np.float32)
+        low, high = float(array.min()), float(array.max())
+        array = (array - low) * (255.0 / max(high - low, 1e-6))
+        return PIL.Image.fromarray(np.round(array).astype(np.uint8)).convert("RGB")
+    if image_pil.mode in ["RGBA", "LA", "PA", "RGBa", "La"] or "transparency" in image_pil.info:
+        rgba = image_pil.convert("RGBA")
+        background = PIL.Image.new("RGBA", rgba.size, (255, 255, 255, 255))
+        return PIL.Image.alpha_composite(background, rgba).convert("RGB")
+    return image_pil.convert("RGB")
+
+
+class DecodedImage(object):
+    """An image decoded once, with its EXIF orientation applied.
+
+    ``rgb`` is the (H, W, 3) uint8 pixel buffer shared by the canvas, SAM and
+    inference: ``qimage()`` wraps it without copying, ``bgr()`` and ``pil()``
+    are converted from it without decoding again, and ``data()`` gives the
+    encoded bytes stored in label files (the original file bytes when the
+    orientation did not change them, otherwise encoded on first use).
+    """
+
+    def __init__(self, rgb, data=None, format="PNG"):
+        self.rgb = np.ascontiguousarray(rgb, dtype=np.uint8)
+        self.format = format
+        self._data = data
+        self._bgr = None
+        self._qimage = None
+
+    @classmethod
+    def from_file(cls, filename):
+        with open(filename, "rb") as f:
+            data = f.read()
+        ext = filename.rsplit(".", 1)[-1].lower()
+        return cls.from_data(data, "JPEG" if ext in ["jpg", "jpeg"] else "PNG")
+
+    @classmethod
+    def from_data(cls, data, format="PNG"):
+        image_pil = PIL.Image.open(io.BytesIO(data))
+        oriented = apply_exif_orientation(image_pil)
+        if oriented is not image_pil or image_pil.format not in ["JPEG", "PNG"]:
+            # the bytes do not match the pixels, encode again when needed
+            data = None
+        return cls(np.asarray(to_rgb(oriented)), data, format)
+
+    @property
+    def height(self):
+        return self.rgb.shape[0]
+
+    @property
+    def width(self):
+        return self.rgb.shape[1]
+
+    def qimage(self):
+        if self._qimage is None:
+            self._qimage = QtGui.QImage(
+                self.rgb.data, self.width, self.height,
+                self.rgb.strides[0], QtGui.QImage.Format.Format_RGB888)
+            # the QImage shares the buffer, keep it alive as long as the QImage
+            self._qimage.buffer = self.rgb
+        return self._qimage
+
+    def bgr(self):
+        if self._bgr is None:
+            self._bgr = np.ascontiguousarray(self.rgb[..., ::-1])
+        return self._bgr
+
+    def pil(self):
+        return PIL.Image.fromarray(self.rgb)
+
+    def data(self):
+        if self._data is None:
+            with io.BytesIO() as f:
+                self.pil().save(f, format=self.format)
+                self._data = f.getvalue()
+        return self._data
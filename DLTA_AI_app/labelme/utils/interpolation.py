@@ -0,0 +1,103 @@
+import argparse
+import os
+
+from .helpers import mathOps
+
+
+# Linear interpolation of several ids of video tracking results at once, used by
+# the "Interpolate" menu and by the command line
+# (python -m labelme.utils.interpolation VIDEO_tracking_results.json ...).
+# The tracking results are gone through once for all the ids, each gap of an id
+# is interpolated at once (see mathOps.getInterpolatedGap) and the results are
+# written once.
+
+
+def interpolate_ids(listObj, ids=None, key_frames=None, stop=None):
+    """
+    Summary:
+        Linearly interpolate the objects of several ids in all the gaps between their frames.
+
+    Args:
+        listObj (list): the tracking results frames (dictionaries with keys (frame_idx, frame_data)), modified in place
+        ids (list): the ids to interpolate (None: all the ids)
+        key_frames (dict): keyframe-only mode, id -> frames of the id to interpolate between, the objects of
+            the id in its other frames between its first and last key frames are replaced by interpolated ones
+            (None: interpolate between all the frames of each id)
+        stop (callable): returns True to stop (checked before each gap, the gaps already interpolated are kept
+            and the others are left as they were)
+
+    Returns:
+        added (dict): id -> frames where an interpolated object of the id was added
+    """
+    ids = None if ids is None else set(ids)
+    if key_frames is not None:
+        key_frames = {id: set(frames) for id, frames in key_frames.items()
+                      if len(frames) > 1 and (ids is None or id in ids)}
+        ids = set(key_frames)
+        key_ranges = {id: (min(frames), max(frames)) for id, frames in key_frames.items()}
+
+    # the frames of each id used for the interpolation, in one pass over the frames, and in the
+    # keyframe-only mode the objects to replace (removed only when their gap is interpolated)
+    records = {}
+    replaced = {}
+    for frame in listObj:
+        frame_idx = frame['frame_idx']
+        for object_ in frame['frame_data']:
+            id = object_['tracker_id']
+            if ids is not None and id not in ids:
+                continue
+            if key_frames is None or frame_idx in key_frames[id]:
+                records.setdefault(id, {})[frame_idx] = object_
+            elif key_ranges[id][0] < frame_idx < key_ranges[id][1]:
+                replaced.setdefault(id, {})[frame_idx] = object_
+
+    added = {}
+    for id, frames in records.items():
+        recordFrames = sorted(frames)
+        for baseObjectFrame, nextObjectFrame in zip(recordFrames[:-1], recordFrames[1:]):
+            if stop is not None and stop():
+                return added
+            objects = mathOps.getInterpolatedGap(baseObject=frames[baseObjectFrame],
+                                                 baseObjectFrame=baseObjectFrame,
+                                                 nextObject=frames[nextObjectFrame],
+                                                 nextObjectFrame=nextObjectFrame)
+            for frame_idx, cur in zip(range(baseObjectFrame + 1, nextObjectFrame), objects):
+                frame_data = listObj[frame_idx - 1]['frame_data']
+                old = replaced.get(id, {}).get(frame_idx)
+                if old is not None:
+                    frame_data[:] = [object_ for object_ in frame_data if object_ is not old]
+                frame_data.append(cur)
+            if len(objects) > 0:
+                added.setdefault(id, []).extend(range(baseObjectFrame + 1, nextObjectFrame))
+    return added
+
+
+def parse_key_frames(values):
+    # "ID:F1,F2,..." -> {ID: {F1, F2, ...}}
+    key_frames = {}
+    for value in values:
+        id, frames = value.split(":")
+        key_frames.setdefault(int(id), set()).update(int(frame) for frame in frames.split(","))
+    return key_frames
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Linearly interpolate ids of video tracking results")
+    parser.add_argument("results", help="path to the tracking results file (<video>_tracking_results.json)")
+    parser.add_argument("--ids", type=int, nargs="*", default=None, help="ids to interpolate (default: all)")
+    parser.add_argument("--key-frames", action="append", default=None, metavar="ID:F1,F2,...",
+                        help="interpolate an id only between these frames (repeat for several ids)")
+    parser.add_argument("--output", default=None, help="output file (default: overwrite the tracking results)")
+    args = parser.parse_args()
+
+    if not os.path.exists(args.results):
+        parser.error(f"{args.results} does not exist")
+    listObj = mathOps.load_objects_from_json__orjson(args.results, 0)
+    key_frames = parse_key_frames(args.key_frames) if args.key_frames else None
+    added = interpolate_ids(listObj, args.ids, key_frames)
+    mathOps.load_objects_to_json__orjson(args.output or args.results, listObj)
+    print(f"Interpolated {sum(len(frames) for frames in added.values())} objects of {len(added)} ids")
+
+
+if __name__ == "__main__":
+    main()
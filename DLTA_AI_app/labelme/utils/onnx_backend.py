@@ -0,0 +1,281 @@
+import json
+import os
+import os.path as osp
+from functools import partial
+
+import cv2
+import mmcv
+import numpy as np
+import torch
+import torchvision
+from mmcv.parallel import collate
+from mmdet.core.export.model_wrappers import DeployBaseDetector, ONNXRuntimeDetector
+from mmdet.datasets import replace_ImageToTensor
+from mmdet.datasets.pipelines import Compose
+
+
+# ONNX Runtime CPU backend for the segmentation models of saved_models.json
+# the model is exported once to an .onnx file next to its checkpoint and then
+# run with onnxruntime (full graph optimization, configurable threads)
+
+
+def onnx_file_for(checkpoint):
+    return osp.splitext(checkpoint)[0] + ".onnx"
+
+
+def int8_file_for(checkpoint):
+    return osp.splitext(checkpoint)[0] + ".int8.onnx"
+
+
+def make_session(onnx_file, num_threads=0):
+    """
+    Summary:
+        Create a CPU onnxruntime session with all graph optimizations enabled.
+
+    Args:
+        onnx_file (str): path to the onnx model
+        num_threads (int): number of intra-op threads (0 lets onnxruntime decide)
+
+    Returns:
+        session (onnxruntime.InferenceSession): the session
+    """
+    import onnxruntime as ort
+
+    options = ort.SessionOptions()
+    options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+    options.execution_mode = ort.ExecutionMode.ORT_SEQUENTIAL
+    options.intra_op_num_threads = int(num_threads)
+    options.inter_op_num_threads = 1
+    # mmdet models may use custom ops (e.g. RoIAlign / NMS) from mmcv
+    try:
+        from mmcv.ops import get_onnxruntime_op_path
+        ort_custom_op_path = get_onnxruntime_op_path()
+        if osp.exists(ort_custom_op_path):
+            options.register_custom_ops_library(ort_custom_op_path)
+    except (ImportError, ModuleNotFoundError):
+        pass
+    return ort.InferenceSession(onnx_file, options, providers=["CPUExecutionProvider"])
+
+
+def load_model(selected_model_name, config, checkpoint, num_threads=0, int8=False):
+    """
+    Summary:
+        Load a model of saved_models.json with the onnxruntime backend,
+        exporting it to onnx first if it was not exported before.
+
+    Args:
+        selected_model_name (str): name of the model in saved_models.json
+        config (str): path to the mmdet config file
+        checkpoint (str): path to the checkpoint file
+        num_threads (int): number of intra-op threads (0 lets onnxruntime decide)
+        int8 (bool): load the INT8 model made by `quantization.quantize_detector` instead of the FP32 one
+
+    Returns:
+        model (YOLOOnnxModel or MMDetOnnxModel): model that can be passed to `models_inference.decode_file`
+    """
+    onnx_file = onnx_file_for(checkpoint)
+    if not osp.exists(onnx_file):
+        if "YOLOv8" in selected_model_name:
+            export_yolo(checkpoint, onnx_file)
+        else:
+            export_mmdet(config, checkpoint, onnx_file)
+    if int8:
+        onnx_file = int8_file_for(checkpoint)
+        if not osp.exists(onnx_file):
+            raise FileNotFoundError(f"{onnx_file} does not exist, the model has to be quantized first")
+
+    if "YOLOv8" in selected_model_name:
+        return YOLOOnnxModel(onnx_file, num_threads)
+    return MMDetOnnxModel(onnx_file, config, num_threads)
+
+
+def export_yolo(checkpoint, onnx_file, imgsz=640):
+    from ultralytics import YOLO
+
+    print(f"Exporting {checkpoint} to onnx, this is done only once")
+    exported = YOLO(checkpoint).export(format="onnx", imgsz=imgsz, dynamic=False)
+    if osp.abspath(exported) != osp.abspath(onnx_file):
+        os.replace(exported, onnx_file)
+    return onnx_file
+
+
+def export_mmdet(config, checkpoint, onnx_file, input_shape=(800, 1216), opset_version=11):
+    """
+    Summary:
+        Export a mmdetection model to onnx (with its post processing) the same way
+        as mmdetection/tools/deployment/pytorch2onnx.py with dynamic axes,
+        the class names of the model are stored in the onnx metadata.
+
+    Args:
+        config (str): path to the mmdet config file
+        checkpoint (str): path to the checkpoint file
+        onnx_file (str): path of the exported onnx file
+        input_shape (tuple): (height, width) of the example input
+        opset_version (int): onnx opset version (mmdet only supports 11)
+    """
+    import onnx
+    from mmcv.onnx.symbolic import register_extra_symbolics
+    from mmdet.core.export import build_model_from_cfg, preprocess_example_input
+
+    print(f"Exporting {checkpoint} to onnx, this is done only once")
+    cfg = mmcv.Config.fromfile(config)
+    model = build_model_from_cfg(config, checkpoint)
+    register_extra_symbolics(opset_version)
+
+    # a random image, so the post processing is traced with some detections
+    example_img = np.random.randint(0, 256, (*input_shape, 3), dtype=np.uint8)
+    one_img, one_meta = preprocess_example_input({
+        'input_shape': (1, 3, *input_shape),
+        'input_path': example_img,
+        'normalize_cfg': parse_normalize_cfg(cfg.data.test.pipeline)})
+    model.forward = partial(
+        model.forward, img_metas=[[one_meta]], return_loss=False, rescale=False)
+
+    output_names = ['dets', 'labels']
+    dynamic_axes = {
+        'input': {0: 'batch', 2: 'height', 3: 'width'},
+        'dets': {0: 'batch', 1: 'num_dets'},
+        'labels': {0: 'batch', 1: 'num_dets'},
+    }
+    if model.with_mask:
+        output_names.append('masks')
+        dynamic_axes['masks'] = {0: 'batch', 1: 'num_dets'}
+
+    tmp_file = onnx_file + ".tmp"
+    torch.onnx.export(
+        model,
+        [one_img],
+        tmp_file,
+        input_names=['input'],
+        output_names=output_names,
+        export_params=True,
+        keep_initializers_as_inputs=True,
+        do_constant_folding=True,
+        opset_version=opset_version,
+        dynamic_axes=dynamic_axes)
+
+    onnx_model = onnx.load(tmp_file)
+    meta = onnx_model.metadata_props.add()
+    meta.key, meta.value = "classes", json.dumps(list(model.CLASSES))
+    onnx.save(onnx_model, tmp_file)
+    os.replace(tmp_file, onnx_file)
+    return onnx_file
+
+
+def parse_normalize_cfg(test_pipeline):
+    transforms = None
+    for pipeline in test_pipeline:
+        if 'transforms' in pipeline:
+            transforms = pipeline['transforms']
+            break
+    assert transforms is not None, 'Failed to find `transforms`'
+    norm_config_li = [_ for _ in transforms if _['type'] == 'Normalize']
+    assert len(norm_config_li) == 1, '`norm_config` should only have one'
+    return norm_config_li[0]
+
+
+class YOLOOnnxModel():
+    """
+    YOLOv8 segmentation model exported to onnx, called like the ultralytics model
+    but returning (boxes, confidences, class_ids, masks) in the input image coordinates.
+    """
+
+    def __init__(self, onnx_file, num_threads=0):
+        self.session = make_session(onnx_file, num_threads)
+        self.input_name = self.session.get_inputs()[0].name
+
+    @staticmethod
+    def preprocess(img):
+        # BGR HWC uint8 -> RGB NCHW float in [0, 1]
+        return np.ascontiguousarray(img[..., ::-1].transpose(2, 0, 1))[None].astype(np.float32) / 255.0
+
+    def __call__(self, img, conf=0.25, iou=0.45, max_det=300):
+        """
+        Args:
+            img (np.ndarray): BGR image already resized to the model input size
+            conf (float): confidence threshold
+            iou (float): NMS iou threshold
+            max_det (int): maximum number of detections
+
+        Returns:
+            boxes (np.ndarray): Nx4 xyxy boxes
+            confidences (np.ndarray): N confidences
+            class_ids (np.ndarray): N class ids
+            masks (np.ndarray): NxHxW boolean masks
+        """
+        h, w = img.shape[:2]
+        preds, protos = self.session.run(None, {self.input_name: self.preprocess(img)})
+        preds, protos = preds[0].T, protos[0]
+        nm = protos.shape[0]
+        nc = preds.shape[1] - 4 - nm
+
+        scores = preds[:, 4:4 + nc]
+        class_ids = scores.argmax(axis=1)
+        confidences = scores[np.arange(len(scores)), class_ids]
+        keep = confidences > conf
+        preds, class_ids, confidences = preds[keep], class_ids[keep], confidences[keep]
+
+        boxes = np.empty((len(preds), 4), dtype=np.float32)
+        boxes[:, :2] = preds[:, :2] - preds[:, 2:4] / 2
+        boxes[:, 2:] = preds[:, :2] + preds[:, 2:4] / 2
+        keep = torchvision.ops.batched_nms(
+            torch.from_numpy(boxes), torch.from_numpy(confidences),
+            torch.from_numpy(class_ids), iou).numpy()[:max_det]
+        boxes, confidences, class_ids = boxes[keep], confidences[keep], class_ids[keep]
+        coefficients = preds[keep, 4 + nc:]
+
+        # masks from the prototypes, cropped to their boxes and upsampled to the input size
+        mh, mw = protos.shape[1:]
+        masks = 1 / (1 + np.exp(-(coefficients @ protos.reshape(nm, -1))))
+        masks = masks.reshape(-1, mh, mw)
+        out = np.zeros((len(masks), h, w), dtype=bool)
+        for i, mask in enumerate(masks):
+            x1, y1, x2, y2 = boxes[i] * np.array([mw / w, mh / h, mw / w, mh / h])
+            crop = np.zeros_like(mask)
+            crop[max(int(y1), 0):max(int(np.ceil(y2)), 0), max(int(x1), 0):max(int(np.ceil(x2)), 0)] = 1
+            out[i] = cv2.resize(mask * crop, (w, h), interpolation=cv2.INTER_LINEAR) > 0.5
+        return boxes, confidences, class_ids.astype(int), out
+
+
+class MMDetOnnxModel(ONNXRuntimeDetector):
+    """
+    MMDetection model exported to onnx, `inference` returns the same
+    (bbox_results, segm_results) as `mmdet.apis.inference_detector`.
+    """
+
+    is_onnx = True
+
+    def __init__(self, onnx_file, config, num_threads=0):
+        # same as ONNXRuntimeDetector but with our session options and CPU only
+        session = make_session(onnx_file, num_threads)
+        classes = json.loads(session.get_modelmeta().custom_metadata_map["classes"])
+        DeployBaseDetector.__init__(self, classes, 0)
+        self.sess = session
+        self.io_binding = session.io_binding()
+        self.output_names = [_.name for _ in session.get_outputs()]
+        self.is_cuda_available = False
+
+        cfg = mmcv.Config.fromfile(config)
+        cfg.data.test.pipeline[0].type = 'LoadImageFromWebcam'
+        cfg.data.test.pipeline = replace_ImageToTensor(cfg.data.test.pipeline)
+        self.test_pipeline = Compose(cfg.data.test.pipeline)
+
+    def preprocess(self, img):
+        data = collate([self.test_pipeline(dict(img=img))], samples_per_gpu=1)
+        data['img_metas'] = [img_metas.data[0] for img_metas in data['img_metas']]
+        data['img'] = [img.data[0] for img in data['img']]
+        return data
+
+    @torch.no_grad()
+    def inference(self, img):
+        """
+        Summary:
+            Run the model on one image, same as `inference_detector` for a pytorch model.
+
+        Args:
+            img (np.ndarray): the image
+
+        Returns:
+            results (tuple): (bbox_results, segm_results) per class
+        """
+        return self(return_loss=False, rescale=True, **self.preprocess(img))[0]
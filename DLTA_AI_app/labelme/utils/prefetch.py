@@ -0,0 +1,162 @@
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from labelme.label_file import LabelFile
+from labelme.label_file import LabelFileError
+from labelme.utils.sam_cache import file_token
+from labelme.utils.sam_cache import token_key
+
+
+class ImagePrefetcher(object):
+    """
+    Decode the neighbouring images of the image list (and their label files)
+    on worker threads into an LRU cache bounded by a memory budget, so
+    navigating a directory does not wait for the decoding.
+
+    If a SAM predictor is set, the image embedding of the next image is also
+    computed in the background.
+
+    Parameters
+    ----------
+    count : int
+        number of images prefetched after (and before) the current one
+    memory_mb : int
+        memory budget of the cache in MB
+    workers : int
+        number of decoding threads
+    """
+
+    def __init__(self, count=2, memory_mb=1024, workers=2):
+        self.count = count
+        self.budget = memory_mb * 1024 * 1024
+        self.executor = ThreadPoolExecutor(max_workers=workers)
+        # reentrant: the done callback runs in the submitting thread if the job already finished
+        self.lock = threading.RLock()
+        self.cache = OrderedDict()
+        self.pending = {}
+        self.sam_predictor = None
+
+    @staticmethod
+    def _stamp(path):
+        try:
+            return os.stat(path).st_mtime_ns
+        except OSError:
+            return None
+
+    def _load(self, filename, label_file, sam):
+        stamp = (self._stamp(filename), self._stamp(label_file))
+        entry = {"stamp": stamp, "label_file": None, "image": None, "sam": None, "size": 0}
+        try:
+            if stamp[1] is not None and LabelFile.is_label_file(label_file):
+                entry["label_file"] = LabelFile(label_file)
+                entry["image"] = entry["label_file"].image
+            else:
+                entry["image"] = LabelFile.load_decoded_image(filename)
+        except LabelFileError:
+            # reported when the file is opened
+            return None
+        if entry["image"] is None:
+            return None
+        entry["size"] = entry["image"].rgb.nbytes + len(entry["image"].data())
+        predictor = self.sam_predictor
+        if sam and predictor is not None:
+            embedding = predictor.get_embedding(entry["image"].bgr(), token_key(file_token(filename)))
+            entry["sam"] = (predictor, embedding)
+            entry["size"] += embedding["features"].numel() * embedding["features"].element_size()
+        return entry
+
+    def _done(self, filename, future):
+        with self.lock:
+            if self.pending.get(filename) is not future:
+                return
+            del self.pending[filename]
+            if future.cancelled() or future.exception() is not None:
+                return
+            entry = future.result()
+            if entry is None:
+                return
+            self.cache[filename] = entry
+            self.cache.move_to_end(filename)
+            self._evict()
+
+    def _evict(self):
+        size = sum(entry["size"] for entry in self.cache.values())
+        while size > self.budget and len(self.cache) > 1:
+            _, entry = self.cache.popitem(last=False)
+            size -= entry["size"]
+
+    def get(self, filename, label_file):
+        """
+        Summary:
+            Take a prefetched image out of the cache (waiting for it if it is being decoded).
+
+        Args:
+            filename (str): image path
+            label_file (str): path of its label file
+
+        Returns:
+            entry (dict): with keys label_file (LabelFile or None), image (DecodedImage) and sam
+                (predictor, embedding) or None, None if the image was not prefetched or changed on disk
+        """
+        with self.lock:
+            # a pending result is taken directly, the done callback may not have run yet
+            future = self.pending.pop(filename, None)
+            entry = self.cache.pop(filename, None)
+        if future is not None and not future.cancel():
+            try:
+                entry = future.result()
+            except Exception as e:
+                print(f"Error prefetching {filename}: {e}")
+                entry = None
+        if entry is None or entry["stamp"] != (self._stamp(filename), self._stamp(label_file)):
+            return None
+        return entry
+
+    def prefetch(self, imageList, index, label_file_for):
+        """
+        Summary:
+            Prefetch the neighbours of the image at `index`, the next ones first.
+
+        Args:
+            imageList (list): image paths
+            index (int): index of the current image
+            label_file_for (callable): image path -> label file path
+        """
+        neighbours = []
+        for offset in range(1, self.count + 1):
+            for i in [index + offset, index - offset]:
+                if 0 <= i < len(imageList):
+                    neighbours.append(imageList[i])
+        with self.lock:
+            # drop the requests of images which are not neighbours anymore
+            for filename in list(self.pending):
+                if filename not in neighbours and self.pending[filename].cancel():
+                    del self.pending[filename]
+            for filename in neighbours:
+                # the embedding is only computed for the next image
+                sam = self.sam_predictor is not None and filename == neighbours[0] and index + 1 < len(imageList)
+                entry = self.cache.get(filename)
+                if filename in self.pending:
+                    continue
+                if entry is not None and (not sam or (entry["sam"] is not None and entry["sam"][0] is self.sam_predictor)):
+                    continue
+                future = self.executor.submit(self._load, filename, label_file_for(filename), sam)
+                self.pending[filename] = future
+                future.add_done_callback(lambda f, filename=filename: self._done(filename, f))
+
+    def discard(self, filename):
+        with self.lock:
+            self.cache.pop(filename, None)
+
+    def clear(self):
+        with self.lock:
+            for future in self.pending.values():
+                future.cancel()
+            self.pending.clear()
+            self.cache.clear()
+
+    def shutdown(self):
+        self.clear()
+        self.executor.shutdown(wait=False)
@@ -0,0 +1,348 @@
+import argparse
+import json
+import os
+import os.path as osp
+import random
+import time
+from pathlib import Path
+
+import cv2
+import numpy as np
+import torch
+
+from . import onnx_backend
+
+
+# INT8 inference for CPU only nodes
+# detectors: onnxruntime static (QDQ) quantization of the exported onnx model, calibrated on project images
+# ReID models: onnxruntime dynamic quantization of the ReID onnx export
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp', '.tif', '.tiff', '.webp')
+
+
+def list_images(images):
+    """
+    Summary:
+        Get the image paths from a directory or a list of paths.
+
+    Args:
+        images (str or list): directory of images or list of image paths
+
+    Returns:
+        paths (list): sorted list of image paths
+    """
+    if isinstance(images, (str, Path)) and osp.isdir(images):
+        return sorted(osp.join(images, f) for f in os.listdir(images)
+                      if f.lower().endswith(IMAGE_EXTENSIONS))
+    return [str(f) for f in images if str(f).lower().endswith(IMAGE_EXTENSIONS)]
+
+
+def sample_images(images, num_images, seed=0):
+    paths = list_images(images)
+    if len(paths) > num_images:
+        paths = sorted(random.Random(seed).sample(paths, num_images))
+    return paths
+
+
+class CalibrationReader():
+    """
+    onnxruntime CalibrationDataReader feeding project images preprocessed
+    exactly as the fp32 model does at inference time.
+    """
+
+    def __init__(self, model, paths):
+        self.model = model
+        self.paths = paths
+        self.input_name = model.sess.get_inputs()[0].name if hasattr(
+            model, 'sess') else model.input_name
+        self.rewind()
+
+    def get_next(self):
+        for path in self._iter:
+            img = cv2.imread(path)
+            if img is None:
+                continue
+            if isinstance(self.model, onnx_backend.YOLOOnnxModel):
+                x = self.model.preprocess(cv2.resize(img, (640, 640)))
+            else:
+                x = self.model.preprocess(img)['img'][0].numpy()
+            return {self.input_name: x}
+        return None
+
+    def rewind(self):
+        self._iter = iter(self.paths)
+
+
+def quantize_detector(selected_model_name, config, checkpoint, images, num_images=32, num_threads=0):
+    """
+    Summary:
+        Quantize a detector of saved_models.json to INT8 with onnxruntime static quantization,
+        the activation ranges are calibrated on a sample of the project images.
+        The INT8 model is saved next to the checkpoint (<checkpoint>.int8.onnx).
+
+    Args:
+        selected_model_name (str): name of the model in saved_models.json
+        config (str): path to the mmdet config file
+        checkpoint (str): path to the checkpoint file
+        images (str or list): directory of images or list of image paths to calibrate on
+        num_images (int): number of calibration images
+        num_threads (int): number of intra-op threads of the calibration session
+
+    Returns:
+        int8_file (str): path to the INT8 onnx model
+    """
+    import onnx
+    from onnxruntime.quantization import CalibrationMethod, QuantFormat, QuantType, quantize_static
+
+    paths = sample_images(images, num_images)
+    if len(paths) == 0:
+        raise ValueError("No calibration images found")
+
+    model = onnx_backend.load_model(selected_model_name, config, checkpoint, num_threads)
+    fp32_file = onnx_backend.onnx_file_for(checkpoint)
+    int8_file = onnx_backend.int8_file_for(checkpoint)
+    print(f"Calibrating {selected_model_name} on {len(paths)} images")
+
+    tmp_file = int8_file + ".tmp"
+    quantize_static(
+        fp32_file,
+        tmp_file,
+        CalibrationReader(model, paths),
+        quant_format=QuantFormat.QDQ,
+        # only the heavy ops, the post processing (NMS, masks) stays in fp32
+        op_types_to_quantize=['Conv', 'MatMul', 'Gemm'],
+        per_channel=True,
+        activation_type=QuantType.QUInt8,
+        weight_type=QuantType.QInt8,
+        calibrate_method=CalibrationMethod.MinMax)
+
+    # keep the metadata (class names) of the fp32 model
+    fp32_model, int8_model = onnx.load(fp32_file), onnx.load(tmp_file)
+    del int8_model.metadata_props[:]
+    int8_model.metadata_props.extend(fp32_model.metadata_props)
+    onnx.save(int8_model, tmp_file)
+    os.replace(tmp_file, int8_file)
+    return int8_file
+
+
+def quantize_reid(weights):
+    """
+    Summary:
+        Export a ReID model of trackers/strongsort/deep to onnx and quantize it to INT8
+        with onnxruntime dynamic quantization (no calibration needed).
+
+    Args:
+        weights (Path): path to the .pt ReID weights
+
+    Returns:
+        int8_weights (Path): path to the INT8 onnx weights, usable as `reid_weights` of `create_tracker`
+    """
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+    from trackers.reid_export import export_onnx
+    from trackers.strongsort.reid_multibackend import ReIDDetectMultiBackend
+
+    weights = Path(weights)
+    int8_weights = weights.with_name(weights.stem + '_int8.onnx')
+    if int8_weights.exists():
+        return int8_weights
+
+    backend = ReIDDetectMultiBackend(weights=weights, device=torch.device('cpu'))
+    im = torch.zeros(1, 3, *backend.image_size)
+    fp32_weights = export_onnx(backend.model.eval(), im, weights, 12, True, False, False)
+    if fp32_weights is None:
+        raise RuntimeError(f"Exporting {weights} to onnx failed")
+    # ConvInteger of onnxruntime CPU only supports uint8 weights
+    quantize_dynamic(str(fp32_weights), str(int8_weights), weight_type=QuantType.QUInt8)
+    return int8_weights
+
+
+def predict(reader, model, img, classdict, threshold):
+    """Run a model like `Intelligence.get_shapes_of_one` and return [(class, confidence, polygon), ...]."""
+    results = reader.decode_file(img=img, model=model, classdict=classdict,
+                                 threshold=threshold, img_array_flag=True)
+    if isinstance(results, tuple):
+        results = reader.polegonise(results[0], results[1], classdict=classdict, threshold=threshold)
+    return [(r["class"], float(r["confidence"]), np.array(r["seg"], dtype=np.int32))
+            for r in results["results"]]
+
+
+def load_reference(image_path):
+    """Get the polygons of the label file of an image (if there is one) as [(class, polygon), ...]."""
+    json_path = osp.splitext(image_path)[0] + ".json"
+    if not osp.exists(json_path):
+        return None
+    with open(json_path) as f:
+        data = json.load(f)
+    return [(s["label"], np.array(s["points"], dtype=np.int32).reshape(-1, 2))
+            for s in data["shapes"] if s.get("shape_type", "polygon") == "polygon" and len(s["points"]) >= 3]
+
+
+def polygon_mask(polygon, shape):
+    mask = np.zeros(shape, dtype=np.uint8)
+    cv2.fillPoly(mask, [polygon.reshape(-1, 1, 2)], 1)
+    return mask.astype(bool)
+
+
+def mask_iou(masks1, masks2):
+    if len(masks1) == 0 or len(masks2) == 0:
+        return np.zeros((len(masks1), len(masks2)))
+    a = np.stack(masks1).reshape(len(masks1), -1).astype(np.float32)
+    b = np.stack(masks2).reshape(len(masks2), -1).astype(np.float32)
+    inter = a @ b.T
+    union = a.sum(1)[:, None] + b.sum(1)[None, :] - inter
+    return inter / np.maximum(union, 1)
+
+
+def mask_ap(predictions, references, shapes, iou_thresholds=np.arange(0.5, 0.96, 0.05)):
+    """
+    Summary:
+        COCO style mask AP (101 point interpolation, averaged over classes and iou thresholds).
+
+    Args:
+        predictions (list): per image list of (class, confidence, polygon)
+        references (list): per image list of (class, polygon)
+        shapes (list): per image (height, width)
+        iou_thresholds (np.ndarray): iou thresholds
+
+    Returns:
+        ap (np.ndarray): AP at each iou threshold
+    """
+    classes = sorted({c for ref in references for c, _ in ref})
+    aps = np.zeros((len(classes), len(iou_thresholds)))
+    for ci, cls in enumerate(classes):
+        scores, matches, num_gt = [], [], 0
+        for preds, refs, shape in zip(predictions, references, shapes):
+            p = sorted([x for x in preds if x[0] == cls], key=lambda x: -x[1])
+            g = [polygon_mask(poly, shape) for c, poly in refs if c == cls]
+            num_gt += len(g)
+            ious = mask_iou([polygon_mask(x[2], shape) for x in p], g)
+            for k in range(len(p)):
+                scores.append(p[k][1])
+            # greedy matching in confidence order, per iou threshold
+            image_matches = np.zeros((len(p), len(iou_thresholds)), dtype=bool)
+            for ti, t in enumerate(iou_thresholds):
+                taken = np.zeros(len(g), dtype=bool)
+                for k in range(len(p)):
+                    if len(g) == 0:
+                        break
+                    candidates = np.where(~taken, ious[k], -1)
+                    best = int(np.argmax(candidates))
+                    if candidates[best] >= t:
+                        taken[best] = True
+                        image_matches[k, ti] = True
+            matches.append(image_matches)
+        if num_gt == 0:
+            continue
+        order = np.argsort(-np.array(scores), kind='stable')
+        matches = np.concatenate(matches)[order] if len(order) else np.zeros((0, len(iou_thresholds)), dtype=bool)
+        for ti in range(len(iou_thresholds)):
+            tp = np.cumsum(matches[:, ti])
+            fp = np.cumsum(~matches[:, ti])
+            recall = tp / num_gt
+            precision = tp / np.maximum(tp + fp, 1e-9)
+            precision = np.maximum.accumulate(precision[::-1])[::-1] if len(precision) else precision
+            recall_points = np.linspace(0, 1, 101)
+            idx = np.searchsorted(recall, recall_points, side='left')
+            aps[ci, ti] = np.mean([precision[i] if i < len(precision) else 0 for i in idx])
+    return aps.mean(axis=0) if len(classes) else np.zeros(len(iou_thresholds))
+
+
+def compare(selected_model_name, config, checkpoint, images, classdict, threshold=0.3, num_images=50, num_threads=0):
+    """
+    Summary:
+        Compare the latency and mask AP of the INT8 model against the FP32 model.
+        The label files of the images are used as ground truth when they exist,
+        otherwise the FP32 predictions are (so the INT8 AP measures the agreement with FP32).
+
+    Args:
+        selected_model_name (str): name of the model in saved_models.json
+        config (str): path to the mmdet config file
+        checkpoint (str): path to the checkpoint file
+        images (str or list): directory of images or list of image paths
+        classdict (dict): class index -> class name
+        threshold (float): confidence threshold
+        num_images (int): number of images to evaluate on
+        num_threads (int): number of intra-op threads
+
+    Returns:
+        report (dict): latency and mask AP of each precision
+    """
+    from inferencing import models_inference
+
+    reader = models_inference()
+    paths = sample_images(images, num_images, seed=1)
+    models = {
+        "fp32": onnx_backend.load_model(selected_model_name, config, checkpoint, num_threads),
+        "int8": onnx_backend.load_model(selected_model_name, config, checkpoint, num_threads, int8=True),
+    }
+    predictions = {name: [] for name in models}
+    latencies = {name: [] for name in models}
+    references, shapes = [], []
+    for path in paths:
+        img = cv2.imread(path)
+        if img is None:
+            continue
+        for name, model in models.items():
+            t0 = time.time()
+            predictions[name].append(predict(reader, model, img, classdict, threshold))
+            latencies[name].append(time.time() - t0)
+        shapes.append(img.shape[:2])
+        references.append(load_reference(path))
+
+    labelled = all(ref is not None for ref in references)
+    if not labelled:
+        references = [[(c, poly) for c, _, poly in preds] for preds in predictions["fp32"]]
+    report = {"model": selected_model_name, "images": len(shapes),
+              "reference": "labels" if labelled else "fp32 predictions"}
+    for name in models:
+        ap = mask_ap(predictions[name], references, shapes)
+        report[name] = {
+            # the first image includes the session warm up
+            "latency_ms": float(np.mean(latencies[name][1:] or latencies[name]) * 1000),
+            "mask_AP": float(ap.mean()),
+            "mask_AP50": float(ap[0]),
+            "mask_AP75": float(ap[5]),
+        }
+    return report
+
+
+def print_report(report):
+    print(f"\nmodel: {report['model']}, images: {report['images']}, reference: {report['reference']}")
+    print(f"{'precision':<10}{'latency (ms)':>14}{'mask AP':>10}{'AP50':>8}{'AP75':>8}")
+    for name in ["fp32", "int8"]:
+        r = report[name]
+        print(f"{name:<10}{r['latency_ms']:>14.1f}{r['mask_AP']:>10.3f}{r['mask_AP50']:>8.3f}{r['mask_AP75']:>8.3f}")
+    print(f"speedup: {report['fp32']['latency_ms'] / max(report['int8']['latency_ms'], 1e-9):.2f}x")
+
+
+def parse_opt():
+    parser = argparse.ArgumentParser(
+        description='Quantize a model of saved_models.json to INT8 and compare it against FP32')
+    parser.add_argument('--model', type=str, required=True, help='model name in saved_models.json')
+    parser.add_argument('--images', type=str, required=True, help='directory of project images')
+    parser.add_argument('--calibration-images', type=int, default=32, help='number of calibration images')
+    parser.add_argument('--eval-images', type=int, default=50, help='number of evaluation images')
+    parser.add_argument('--conf-thres', type=float, default=0.3, help='confidence threshold')
+    parser.add_argument('--threads', type=int, default=0, help='onnxruntime intra-op threads (0: default)')
+    parser.add_argument('--reid-weights', type=Path, default=None, help='also quantize these ReID weights')
+    parser.add_argument('--save', type=str, default=None, help='save the report to this json file')
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    # run from DLTA_AI_app: python -m labelme.utils.quantization --model <name> --images <dir>
+    from labelme.intelligence import coco_classes
+
+    opt = parse_opt()
+    with open("saved_models.json") as f:
+        data = json.load(f)[opt.model]
+    quantize_detector(opt.model, data["config"], data["checkpoint"], opt.images,
+                      opt.calibration_images, opt.threads)
+    report = compare(opt.model, data["config"], data["checkpoint"], opt.images,
+                     dict(enumerate(coco_classes)), opt.conf_thres, opt.eval_images, opt.threads)
+    print_report(report)
+    if opt.reid_weights is not None:
+        print(f"INT8 ReID weights: {quantize_reid(opt.reid_weights)}")
+    if opt.save:
+        with open(opt.save, "w") as f:
+            json.dump(report, f, indent=4)
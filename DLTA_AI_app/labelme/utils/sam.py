@@ -1,32 +1,57 @@
-from segment_anything import sam_model_registry, SamPredictor, SamAutomaticMaskGenerator
+from segment_anything import SamPredictor, SamAutomaticMaskGenerator
+from segment_anything.utils.amg import rle_to_mask
+import cv2
 import numpy as np
 import torch
+import torchvision
 from .helpers import mathOps
+from .sam_cache import image_fingerprint, image_key, token_key
+from .sam_onnx import OnnxSamDecoder, OnnxSamEncoder, build_sam
 
 
 # create a sam predictor class with funcions to predict and visualize and results
 
 
 class Sam_Predictor():
-    def __init__(self, model_type, checkpoint_path, device):
+    def __init__(self, model_type, checkpoint_path, device, cache=None,
+                 encoder_backend="pytorch", decoder_backend="pytorch", num_threads=0):
         self.model_type = model_type
+        # SamEmbeddingCache shared by the predictors (None: no cache)
+        self.cache = cache
         self.checkpoint_path = checkpoint_path
         self.device = device
-        self.model = sam_model_registry[model_type](checkpoint=checkpoint_path)
+        self.model = build_sam(model_type, checkpoint_path)
+        # the image encoder and the prompt decoder can run with onnxruntime on the CPU ("onnxruntime")
+        self.encoder = OnnxSamEncoder(self.model, checkpoint_path, num_threads) if encoder_backend == "onnxruntime" else None
+        self.decoder = OnnxSamDecoder(self.model, checkpoint_path, num_threads) if decoder_backend == "onnxruntime" else None
         self.model.to(device = self.device)
         self.predictor = SamPredictor(self.model)
+        # automatic mask generator of `get_all_shapes`, built again only when its settings change
+        self._mask_generator = None
+        self._mask_generator_options = None
         self.image = None
+        # identity of the current image: its token if it has one, otherwise its sampled fingerprint
+        self.image_token = None
+        self.image_fingerprint = None
         self.mask_logit = None
         
 
-    def set_new_image(self, image):
-        self.image = image
-        self.predictor.set_image(image)
+    def set_new_image(self, image, token=None):
+        key = token_key(token) if token is not None else None
+        self.set_embedding(image, self.get_embedding(image, key), token)
     
     def clear_logit(self):
         self.mask_logit = None
 
 
+    def _predict(self, point_coords=None, point_labels=None, box=None, mask_input=None, multimask_output=True):
+        # SamPredictor.predict, or the same with the onnxruntime decoder
+        if self.decoder is not None:
+            return self.decoder.predict(self.predictor, point_coords=point_coords, point_labels=point_labels,
+                                        box=box, mask_input=mask_input, multimask_output=multimask_output)
+        return self.predictor.predict(point_coords=point_coords, point_labels=point_labels, box=box,
+                                      mask_input=mask_input, multimask_output=multimask_output)
+
     def predict(self, point_coords=None, point_labels=None, box=None, multimask_output=True, image=None):
         # print(point_coords , point_labels)
         # print(f'----------------------- into SAM predict')
@@ -34,24 +59,28 @@ class Sam_Predictor():
         if box is None:
             # print(f'----------------------- no boxes')
             if self.mask_logit is None:
-                masks, scores, logits = self.predictor.predict(point_coords=point_coords, 
-                                                               point_labels=point_labels, 
-                                                               multimask_output=multimask_output)
+                masks, scores, logits = self._predict(point_coords=point_coords, 
+                                                      point_labels=point_labels, 
+                                                      multimask_output=multimask_output)
             else:
-                masks, scores, logits = self.predictor.predict(point_coords=point_coords, 
-                                                               point_labels=point_labels,
-                                                               mask_input=self.mask_logit[None, :, :],
-                                                               multimask_output=multimask_output)
+                masks, scores, logits = self._predict(point_coords=point_coords, 
+                                                      point_labels=point_labels,
+                                                      mask_input=self.mask_logit[None, :, :],
+                                                      multimask_output=multimask_output)
         else:
             # print(f'----------------------- boxes')
             if len(box) == 1:
                 # print(f'----------------------- only one box')
                 input_box = np.array(box[0])
-                masks, scores, logits = self.predictor.predict(point_coords=point_coords, 
-                                                            point_labels=point_labels,
-                                                            box=input_box[None, :],
-                                                            multimask_output=multimask_output)
+                masks, scores, logits = self._predict(point_coords=point_coords, 
+                                                      point_labels=point_labels,
+                                                      box=input_box[None, :],
+                                                      multimask_output=multimask_output)
                 
+            elif self.decoder is not None:
+                # the onnxruntime decoder takes one box at a time
+                results = [self._predict(box=np.array(b)[None, :], multimask_output=False) for b in box]
+                masks, scores, logits = [np.concatenate(result) for result in zip(*results)]
             else:
                 # print(f'----------------------- multiple boxes')
                 input_box = np.array(box[0])
@@ -63,7 +92,7 @@ class Sam_Predictor():
                                                             multimask_output=False)
         
         if multimask_output:
-            if box is not None and len(box) != 1:
+            if box is not None and len(box) != 1 and self.decoder is None:
                 logits = torch.Tensor.cpu(logits).numpy().reshape(-1, logits.shape[-2], logits.shape[-1])
                 masks = torch.Tensor.cpu(masks).numpy().reshape(-1, masks.shape[-2], masks.shape[-1])
                 scores = torch.Tensor.cpu(scores).numpy().reshape(-1)
@@ -86,120 +115,243 @@ class Sam_Predictor():
     )
         return masks, scores
 
-        
-    def check_image(self , new_image):
-        if not np.array_equal(self.image, new_image):
-            # print("image changed_1")
-            self.mask_logit = None
-            self.image = new_image
-            self.predictor.set_image(new_image)
-            # print("image changed_2")
-            return False
-        return True
-
-    def get_all_shapes(self, image, iou_threshold):
-        
-        # self.mask_generator = SamAutomaticMaskGenerator(
-        #     model: Sam,
-        #     points_per_side: Optional[int] = 32,
-        #     points_per_batch: int = 64,
-        #     pred_iou_thresh: float = 0.88,
-        #     stability_score_thresh: float = 0.95,
-        #     stability_score_offset: float = 1.0,
-        #     box_nms_thresh: float = 0.7,
-        #     crop_n_layers: int = 0,
-        #     crop_nms_thresh: float = 0.7,
-        #     crop_overlap_ratio: float = 512 / 1500,
-        #     crop_n_points_downscale_factor: int = 1,
-        #     point_grids: Optional[List[np.ndarray]] = None,
-        #     min_mask_region_area: int = 0,
-        #     output_mode: str = "binary_mask",
-        # )
-        
-        
-        self.mask_generator = SamAutomaticMaskGenerator(
-            model = self.model,
-            # points_per_side = 32,
-            # points_per_batch = 64,
-            # pred_iou_thresh = 0.88,
-            # stability_score_thresh = 0.95,
-            # stability_score_offset = 1.0,
-            # box_nms_thresh = 0.3,
-            # crop_n_layers = 0,
-            # crop_nms_thresh = 0.7,
-            # crop_overlap_ratio = 512 / 1500,
-            # crop_n_points_downscale_factor = 1,
-            # point_grids = None,
-            # min_mask_region_area = image.shape[0] * image.shape[1] * 0.0005,
-            # output_mode = "binary_mask",
-        )
-        
-        # Arguments(
-        #   model (Sam): The SAM model to use for mask prediction.
-        
-        #   points_per_side (int or None): The number of points to be sampled
-        #     along one side of the image. The total number of points is
-        #     points_per_side**2. If None, 'point_grids' must provide explicit
-        #     point sampling.
-        
-        #   points_per_batch (int): Sets the number of points run simultaneously
-        #     by the model. Higher numbers may be faster but use more GPU memory.
-        
-        #   pred_iou_thresh (float): A filtering threshold in [0,1], using the
-        #     model's predicted mask quality.
-          
-        #   stability_score_thresh (float): A filtering threshold in [0,1], using
-        #     the stability of the mask under changes to the cutoff used to binarize
-        #     the model's mask predictions.
-          
-        #   stability_score_offset (float): The amount to shift the cutoff when
-        #     calculated the stability score.
-          
-        #   box_nms_thresh (float): The box IoU cutoff used by non-maximal
-        #     suppression to filter duplicate masks.
-          
-        #   crop_n_layers (int): If >0, mask prediction will be run again on
-        #     crops of the image. Sets the number of layers to run, where each
-        #     layer has 2**i_layer number of image crops.
-          
-        #   crop_nms_thresh (float): The box IoU cutoff used by non-maximal
-        #     suppression to filter duplicate masks between different crops.
-          
-        #   crop_overlap_ratio (float): Sets the degree to which crops overlap.
-        #     In the first crop layer, crops will overlap by this fraction of
-        #     the image length. Later layers with more crops scale down this overlap.
-          
-        #   crop_n_points_downscale_factor (int): The number of points-per-side
-        #     sampled in layer n is scaled down by crop_n_points_downscale_factor**n.
-          
-        #   point_grids (list(np.ndarray) or None): A list over explicit grids
-        #     of points used for sampling, normalized to [0,1]. The nth grid in the
-        #     list is used in the nth crop layer. Exclusive with points_per_side.
-          
-        #   min_mask_region_area (int): If >0, postprocessing will be applied
-        #     to remove disconnected regions and holes in masks with area smaller
-        #     than min_mask_region_area. Requires opencv.
-          
-        #   output_mode (str): The form masks are returned in. Can be 'binary_mask',
-        #     'uncompressed_rle', or 'coco_rle'. 'coco_rle' requires pycocotools.
-        #     For large resolutions, 'binary_mask' may consume large amounts of
-        #     memory.
-        # )
-        
-        
-        
-        # sam_result is a list of dictionaries
-        # each dictionary (mask) has the following keys:
-            # segmentation - [np.ndarray] - the mask with (W, H) shape, and bool type
-            # area - [int] - the area of the mask in pixels
-            # bbox - [List[int]] - the boundary box of the mask in xywh format
-            # predicted_iou - [float] - the model's own prediction for the quality of the mask
-            # point_coords - [List[List[float]]] - the sampled input point that generated this mask
-            # stability_score - [float] - an additional measure of mask quality
-            # crop_box - List[int] - the crop of the image used to generate this mask in xywh format
-            
-        sam_result = self.mask_generator.generate(image)
-        shapes = mathOps.OURnms_areaBased_fromSAM(sam_result, iou_threshold=iou_threshold) # with AREA not score
-        
+
+    @torch.no_grad()
+    def predict_boxes(self, boxes, batch_size=8, mask_inputs=None, return_logits=False):
+        """
+        Summary:
+            Predict the masks of several boxes of the current image, `batch_size` boxes per decoder pass.
+
+        Args:
+            boxes (list): the boxes [x1, y1, x2, y2]
+            batch_size (int): number of boxes per pass (the masks of a pass are at the image resolution)
+            mask_inputs (np.ndarray): low resolution mask logits (Nx256x256) of previous predictions of the boxes,
+                given with the boxes as prompts (one mask is predicted per box then)
+            return_logits (bool): also return the low resolution mask logits of the masks
+
+        Returns:
+            masks (list): the best mask of each box (np.ndarray of bool)
+            scores (list): the score of each mask
+            logits (list): the low resolution mask logits of each mask (only if `return_logits`)
+        """
+        masks, scores, logits = [], [], []
+        multimask_output = mask_inputs is None
+        if self.decoder is not None:
+            # the onnxruntime decoder runs a box at a time, each in milliseconds on the CPU
+            for i, box in enumerate(boxes):
+                box_masks, box_scores, box_logits = self._predict(
+                    box=np.asarray(box, dtype=float)[None, :],
+                    mask_input=mask_inputs[i][None, :, :] if mask_inputs is not None else None,
+                    multimask_output=multimask_output)
+                best = np.argmax(box_scores)
+                masks.append(box_masks[best])
+                scores.append(float(box_scores[best]))
+                logits.append(box_logits[best])
+            return (masks, scores, logits) if return_logits else (masks, scores)
+        for start in range(0, len(boxes), batch_size):
+            box_tensor = torch.as_tensor(boxes[start:start + batch_size], dtype=torch.float, device=self.predictor.device)
+            box_transformed = self.predictor.transform.apply_boxes_torch(box_tensor, self.predictor.original_size)
+            mask_input = None
+            if mask_inputs is not None:
+                mask_input = torch.as_tensor(np.asarray(mask_inputs[start:start + batch_size], dtype=np.float32),
+                                             device=self.predictor.device)[:, None, :, :]
+            batch_masks, batch_scores, batch_logits = self.predictor.predict_torch(point_coords=None,
+                                                                                   point_labels=None,
+                                                                                   boxes=box_transformed,
+                                                                                   mask_input=mask_input,
+                                                                                   multimask_output=multimask_output)
+            # the best of the masks of each box, like predict
+            best = torch.argmax(batch_scores, dim=1)
+            index = torch.arange(len(best), device=best.device)
+            masks.extend(batch_masks[index, best].cpu().numpy())
+            scores.extend(batch_scores[index, best].cpu().numpy().tolist())
+            if return_logits:
+                logits.extend(batch_logits[index, best].cpu().numpy())
+        return (masks, scores, logits) if return_logits else (masks, scores)
+
+    def refine_boxes(self, boxes, thresh=1.2, max_itr=5):
+        """
+        Summary:
+            Refine boxes of the current image with SAM, all the boxes at once: each box is replaced by the
+            bounding box of its SAM polygon, again for the boxes whose area changed by a ratio of at least
+            `thresh`, at most `max_itr` times.
+
+        Args:
+            boxes (list): the boxes [x1, y1, x2, y2]
+            thresh (float): area ratio under which a box is not refined again
+            max_itr (int): maximum number of refinements
+
+        Returns:
+            results (list): (box, polygon, score) of each box, the polygon is a (N, 2) array of [x, y] points
+        """
+        current = []
+        for x1, y1, x2, y2 in boxes:
+            current.append([int(round(x)) for x in [min(x1, x2), min(y1, y2), max(x1, x2), max(y1, y2)]])
+        results = [None] * len(current)
+        active = list(range(len(current)))
+        for _ in range(max_itr):
+            if len(active) == 0:
+                break
+            masks, scores = self.predict_boxes([current[i] for i in active])
+            not_converged = []
+            for i, mask, score in zip(active, masks, scores):
+                polygon = mathOps.mask_to_polygons(mask)
+                if len(polygon) == 0:
+                    # nothing segmented, the box is kept
+                    x1, y1, x2, y2 = current[i]
+                    results[i] = (current[i], np.array([[x1, y1], [x2, y1], [x2, y2], [x1, y2]]), score)
+                    continue
+                box = [int(polygon[:, 0].min()), int(polygon[:, 1].min()),
+                       int(polygon[:, 0].max()), int(polygon[:, 1].max())]
+                results[i] = (box, polygon, score)
+                old_area = abs(current[i][2] - current[i][0]) * abs(current[i][3] - current[i][1])
+                new_area = abs(box[2] - box[0]) * abs(box[3] - box[1])
+                bigger, smaller = max(old_area, new_area), min(old_area, new_area)
+                current[i] = box
+                if bigger != smaller and (smaller == 0 or bigger / smaller >= thresh):
+                    not_converged.append(i)
+            active = not_converged
+        return results
+
+    @torch.no_grad()
+    def compute_embedding(self, image):
+        """Image embedding of `image` (as `set_image` computes it), without changing the current image."""
+        predictor = self.predictor
+        input_image = predictor.transform.apply_image(image)
+        input_image_torch = torch.as_tensor(input_image, device=predictor.device)
+        input_image_torch = input_image_torch.permute(2, 0, 1).contiguous()[None, :, :, :]
+        input_image_torch = predictor.model.preprocess(input_image_torch)
+        if self.encoder is not None:
+            features = self.encoder(input_image_torch).to(predictor.device)
+        else:
+            features = predictor.model.image_encoder(input_image_torch)
+        return {"features": features,
+                "original_size": image.shape[:2],
+                "input_size": tuple(input_image_torch.shape[-2:])}
+
+    def get_embedding(self, image, key=None):
+        """Embedding of `image`, from the embedding cache if it is there (computed and cached otherwise)."""
+        if self.cache is None:
+            return self.compute_embedding(image)
+        key = key or image_key(image)
+        embedding = self.cache.get(self.model_type, key, self.predictor.device)
+        if embedding is None:
+            embedding = self.compute_embedding(image)
+            self.cache.put(self.model_type, key, embedding)
+        return embedding
+
+    def set_embedding(self, image, embedding, token=None):
+        """Set `image` (identified by `token` if given) as the current image using its precomputed embedding."""
+        self.mask_logit = None
+        self.image = image
+        self.image_token = token
+        self.image_fingerprint = image_fingerprint(image) if token is None else None
+        self.predictor.reset_image()
+        self.predictor.original_size = embedding["original_size"]
+        self.predictor.input_size = embedding["input_size"]
+        self.predictor.features = embedding["features"]
+        self.predictor.is_image_set = True
+
+    def check_image(self, new_image, token=None):
+        """
+        Summary:
+            Make `new_image` the current image if it is not already.
+
+        Args:
+            new_image (np.ndarray): the image
+            token (tuple): identifies the image (see `sam_cache.file_token` and `sam_cache.video_frame_token`),
+                without a token the image is compared with the sampled fingerprint of the current image
+
+        Returns:
+            same_image (bool): True if it already was the current image
+        """
+        if self.image is not None:
+            if token is not None:
+                if token == self.image_token:
+                    return True
+            elif new_image is self.image or (
+                    self.image_token is None and image_fingerprint(new_image) == self.image_fingerprint):
+                return True
+        self.set_new_image(new_image, token)
+        return False
+
+    def mask_generator(self, points_per_side=32, points_per_batch=64, crop_n_layers=0):
+        """The automatic mask generator with these settings, kept across calls (the masks are returned as RLE)."""
+        options = (points_per_side, points_per_batch, crop_n_layers)
+        if self._mask_generator is None or self._mask_generator_options != options:
+            self._mask_generator = SamAutomaticMaskGenerator(
+                model=self.model,
+                points_per_side=points_per_side,
+                points_per_batch=points_per_batch,
+                crop_n_layers=crop_n_layers,
+                output_mode="uncompressed_rle",
+            )
+            self._mask_generator_options = options
+        return self._mask_generator
+
+    def _generate_polygons(self, generator, image, scale=1.0, offset=(0, 0), inner_edges=(False, False, False, False)):
+        # masks are decoded from RLE one at a time at the size of `image` and turned into polygons
+        # in the coordinates of the full image, the masks cut by an inner tile edge are skipped
+        h, w = image.shape[:2]
+        left, top, right, bottom = inner_edges
+        for record in generator.generate(image):
+            x, y, bw, bh = record["bbox"]
+            if (left and x <= 0) or (top and y <= 0) or (right and x + bw >= w - 1) or (bottom and y + bh >= h - 1):
+                continue
+            polygon = mathOps.mask_to_polygons(rle_to_mask(record["segmentation"]))
+            if len(polygon) == 0:
+                continue
+            yield {"polygon": (polygon * scale + np.array(offset)).astype(int),
+                   "bbox": [x * scale + offset[0], y * scale + offset[1],
+                            (x + bw) * scale + offset[0], (y + bh) * scale + offset[1]],
+                   "area": record["area"] * scale * scale,
+                   "predicted_iou": record["predicted_iou"],
+                   "stability_score": record["stability_score"]}
+
+    @torch.no_grad()
+    def get_all_shapes(self, image, iou_threshold, points_per_side=32, points_per_batch=64, crop_n_layers=0,
+                       tile_size=None, tile_overlap=256, nms_thresh=0.7):
+        """
+        Summary:
+            Segment everything in an image.
+
+        Args:
+            image (np.ndarray): the image
+            iou_threshold (float): IOU threshold of the non-maximum suppression of the shapes
+            points_per_side (int): number of points sampled along a side of the image (or tile)
+            points_per_batch (int): number of points run by the model together (less uses less memory)
+            crop_n_layers (int): number of layers of crops the generator also runs on
+            tile_size (int): memory-bounded mode for large images (None: the whole image at once), the image is
+                segmented by tiles of this size at full resolution (for the small objects) and downscaled to this
+                size (for the large objects), so no mask is larger than a tile
+            tile_overlap (int): overlap of the tiles, objects cut by a tile edge are taken from another tile
+            nms_thresh (float): box IOU above which the masks found in several tiles are duplicates
+
+        Returns:
+            shapes (list): the shapes of the segmented objects
+        """
+        generator = self.mask_generator(points_per_side, points_per_batch, crop_n_layers)
+        h, w = image.shape[:2]
+        if tile_size is None or max(h, w) <= tile_size:
+            results = list(self._generate_polygons(generator, image))
+        else:
+            # the large objects on the image downscaled to one tile
+            scale = max(h, w) / tile_size
+            small = cv2.resize(image, (int(round(w / scale)), int(round(h / scale))), interpolation=cv2.INTER_AREA)
+            results = list(self._generate_polygons(generator, small, scale=scale))
+            # the small objects on full resolution tiles
+            step = tile_size - tile_overlap
+            for y in range(0, max(h - tile_overlap, 1), step):
+                for x in range(0, max(w - tile_overlap, 1), step):
+                    tile = image[y:y + tile_size, x:x + tile_size]
+                    inner_edges = (x > 0, y > 0, x + tile_size < w, y + tile_size < h)
+                    results.extend(self._generate_polygons(generator, tile, offset=(x, y), inner_edges=inner_edges))
+            # the objects found on several tiles (or on the downscaled image and a tile) are kept once
+            if len(results) > 0:
+                keep = torchvision.ops.nms(
+                    torch.tensor([result["bbox"] for result in results], dtype=torch.float),
+                    torch.tensor([result["predicted_iou"] for result in results], dtype=torch.float),
+                    nms_thresh)
+                results = [results[i] for i in keep.tolist()]
+        shapes = mathOps.OURnms_areaBased_fromSAM(results, iou_threshold=iou_threshold) # with AREA not score
         return shapes
-    
\ No newline at end of file
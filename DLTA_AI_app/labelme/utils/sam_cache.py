@@ -0,0 +1,216 @@
+import hashlib
+import json
+import os
+import os.path as osp
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import torch
+
+
+def image_key(image):
+    """
+    Summary:
+        Content hash of an image, used as the key of its SAM embedding.
+
+    Args:
+        image (np.ndarray): the image
+
+    Returns:
+        key (str): hex digest of the image shape and pixels
+    """
+    h = hashlib.blake2b(digest_size=16)
+    h.update(str((image.shape, image.dtype.str)).encode("utf-8"))
+    h.update(memoryview(np.ascontiguousarray(image)).cast("B"))
+    return h.hexdigest()
+
+
+def image_fingerprint(image, samples=256):
+    """
+    Summary:
+        Fingerprint of an image from a grid of about `samples` x `samples` of its pixels,
+        to tell images apart without going through all their pixels.
+
+    Args:
+        image (np.ndarray): the image
+        samples (int): number of sampled rows and columns
+
+    Returns:
+        fingerprint (str): hex digest of the image shape and sampled pixels
+    """
+    step_y = max(image.shape[0] // samples, 1)
+    step_x = max(image.shape[1] // samples, 1)
+    h = hashlib.blake2b(digest_size=16)
+    h.update(str((image.shape, image.dtype.str)).encode("utf-8"))
+    h.update(memoryview(np.ascontiguousarray(image[::step_y, ::step_x])).cast("B"))
+    return h.hexdigest()
+
+
+def _mtime(path):
+    try:
+        return os.stat(path).st_mtime_ns
+    except OSError:
+        return None
+
+
+def file_token(filename):
+    """Token identifying the image of a file (its path and modification time)."""
+    return ("file", osp.abspath(filename), _mtime(filename))
+
+
+def video_frame_token(video_file, frame_idx):
+    """Token identifying a frame of a video (the video path and modification time and the frame index)."""
+    return ("video", osp.abspath(video_file), _mtime(video_file), int(frame_idx))
+
+
+def token_key(token):
+    """Embedding cache key of an image token."""
+    return hashlib.sha1(repr(token).encode("utf-8")).hexdigest()
+
+
+class SamEmbeddingCache(object):
+    """
+    Cache of SAM image embeddings (`features`, `original_size` and `input_size`)
+    keyed by the SAM model type and an image key (a content hash or a video frame).
+
+    The embeddings are kept in an in-memory LRU bounded by a memory budget.
+    If a cache directory is given, they are also saved there (the features as
+    .npy files loaded memory-mapped, the sizes as .json files) so they are
+    reused across sessions, the least recently used files are removed above the
+    disk budget.
+
+    Parameters
+    ----------
+    memory_mb : int
+        memory budget of the in-memory tier in MB
+    cache_dir : str
+        directory of the on-disk tier (None: in memory only)
+    disk_mb : int
+        disk budget of the on-disk tier in MB
+    """
+
+    def __init__(self, memory_mb=1024, cache_dir=None, disk_mb=10240):
+        self.budget = memory_mb * 1024 * 1024
+        self.cache_dir = osp.expanduser(cache_dir) if cache_dir else None
+        self.disk_budget = disk_mb * 1024 * 1024
+        self.lock = threading.RLock()
+        self.cache = OrderedDict()
+        self.size = 0
+
+    @staticmethod
+    def _nbytes(embedding):
+        return embedding["features"].numel() * embedding["features"].element_size()
+
+    def _paths(self, model_type, key):
+        directory = osp.join(self.cache_dir, model_type)
+        return osp.join(directory, f"{key}.npy"), osp.join(directory, f"{key}.json")
+
+    def get(self, model_type, key, device=None):
+        """
+        Summary:
+            Get a cached embedding.
+
+        Args:
+            model_type (str): the SAM model type
+            key (str): the image key
+            device (torch.device): device of the returned features (None: CPU)
+
+        Returns:
+            embedding (dict): with keys features, original_size and input_size, None if it is not cached
+        """
+        with self.lock:
+            embedding = self.cache.get((model_type, key))
+            if embedding is not None:
+                self.cache.move_to_end((model_type, key))
+        if embedding is None and self.cache_dir is not None:
+            embedding = self._read(model_type, key)
+            if embedding is not None:
+                self._insert(model_type, key, embedding)
+        if embedding is None:
+            return None
+        return dict(embedding, features=embedding["features"].to(device) if device is not None else embedding["features"])
+
+    def contains(self, model_type, key):
+        with self.lock:
+            if (model_type, key) in self.cache:
+                return True
+        return self.cache_dir is not None and osp.exists(self._paths(model_type, key)[1])
+
+    def put(self, model_type, key, embedding):
+        # the in-memory tier is on the CPU, so it does not use GPU memory
+        embedding = dict(embedding, features=embedding["features"].detach().cpu())
+        self._insert(model_type, key, embedding)
+        if self.cache_dir is not None:
+            try:
+                self._write(model_type, key, embedding)
+            except OSError as e:
+                print(f"Error saving the SAM embedding to {self.cache_dir}: {e}")
+
+    def _insert(self, model_type, key, embedding):
+        with self.lock:
+            old = self.cache.pop((model_type, key), None)
+            if old is not None:
+                self.size -= self._nbytes(old)
+            self.cache[(model_type, key)] = embedding
+            self.size += self._nbytes(embedding)
+            while self.size > self.budget and len(self.cache) > 1:
+                _, old = self.cache.popitem(last=False)
+                self.size -= self._nbytes(old)
+
+    def _read(self, model_type, key):
+        features_path, meta_path = self._paths(model_type, key)
+        try:
+            with open(meta_path, "r") as f:
+                meta = json.load(f)
+            # copy-on-write memory map: the file is only read when the features are used
+            features = torch.from_numpy(np.load(features_path, mmap_mode="c"))
+            os.utime(meta_path)
+        except (OSError, ValueError):
+            return None
+        return {"features": features,
+                "original_size": tuple(meta["original_size"]),
+                "input_size": tuple(meta["input_size"])}
+
+    def _write(self, model_type, key, embedding):
+        features_path, meta_path = self._paths(model_type, key)
+        os.makedirs(osp.dirname(features_path), exist_ok=True)
+        # the sizes are written last, an embedding without them is not read
+        with open(features_path + ".tmp", "wb") as f:
+            np.save(f, embedding["features"].numpy())
+        os.replace(features_path + ".tmp", features_path)
+        with open(meta_path + ".tmp", "w") as f:
+            json.dump({"original_size": list(embedding["original_size"]),
+                       "input_size": list(embedding["input_size"])}, f)
+        os.replace(meta_path + ".tmp", meta_path)
+        self._evict_disk()
+
+    def _evict_disk(self):
+        files = []
+        for directory in os.scandir(self.cache_dir):
+            if not directory.is_dir():
+                continue
+            for e in os.scandir(directory.path):
+                if e.name.endswith(".json"):
+                    features_path = e.path[:-len(".json")] + ".npy"
+                    try:
+                        size = os.stat(features_path).st_size
+                    except OSError:
+                        size = 0
+                    files.append((e.stat().st_mtime_ns, size, e.path, features_path))
+        total = sum(file[1] for file in files)
+        # the least recently used first
+        for _, size, meta_path, features_path in sorted(files):
+            if total <= self.disk_budget:
+                break
+            for path in [meta_path, features_path]:
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+            total -= size
+
+    def clear(self):
+        with self.lock:
+            self.cache.clear()
+            self.size = 0
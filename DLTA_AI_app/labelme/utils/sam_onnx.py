@@ -0,0 +1,207 @@
+import os.path as osp
+
+import numpy as np
+import torch
+from segment_anything import sam_model_registry
+
+
+# SAM models and their ONNX Runtime (CPU) split: the image encoder and the
+# prompt decoder are exported once to .onnx files next to the checkpoint and
+# run with onnxruntime, so they can be chosen separately per deployment
+# (e.g. a light encoder in PyTorch and the decoder in onnxruntime, where a
+# click takes milliseconds).
+
+
+def build_sam(model_type, checkpoint_path):
+    """
+    Summary:
+        Build a SAM model: ViT-H/L/B from segment_anything, or a lighter SAM-compatible
+        model (MobileSAM "vit_t") if its package is installed.
+
+    Args:
+        model_type (str): the model type (key of the model registry)
+        checkpoint_path (str): path to the checkpoint
+
+    Returns:
+        model (Sam): the model, usable with `SamPredictor`
+    """
+    if model_type in sam_model_registry:
+        return sam_model_registry[model_type](checkpoint=checkpoint_path)
+    try:
+        from mobile_sam import sam_model_registry as mobile_sam_model_registry
+    except ImportError:
+        raise ImportError(f"SAM model type {model_type} needs the mobile_sam package "
+                          "(pip install git+https://github.com/ChaoningZhang/MobileSAM.git)")
+    return mobile_sam_model_registry[model_type](checkpoint=checkpoint_path)
+
+
+def encoder_file_for(checkpoint):
+    return osp.splitext(checkpoint)[0] + ".encoder.onnx"
+
+
+def decoder_file_for(checkpoint):
+    return osp.splitext(checkpoint)[0] + ".decoder.onnx"
+
+
+@torch.no_grad()
+def export_encoder(model, onnx_file, opset_version=17):
+    """
+    Summary:
+        Export the image encoder of a SAM model to onnx, its input is the preprocessed
+        (normalized and padded) 1x3xSxS image and its output the image embedding.
+
+    Args:
+        model (Sam): the model
+        onnx_file (str): path of the onnx file
+        opset_version (int): onnx opset
+    """
+    size = model.image_encoder.img_size
+    model = model.to("cpu").eval()
+    torch.onnx.export(model.image_encoder, torch.randn(1, 3, size, size, dtype=torch.float), onnx_file,
+                      export_params=True, opset_version=opset_version, do_constant_folding=True,
+                      input_names=["image"], output_names=["image_embeddings"])
+
+
+@torch.no_grad()
+def export_decoder(model, onnx_file, opset_version=17):
+    """
+    Summary:
+        Export the prompt encoder and mask decoder of a SAM model to onnx
+        (as segment_anything's scripts/export_onnx_model.py does, returning all the masks).
+
+    Args:
+        model (Sam): the model
+        onnx_file (str): path of the onnx file
+        opset_version (int): onnx opset
+    """
+    from segment_anything.utils.onnx import SamOnnxModel
+
+    onnx_model = SamOnnxModel(model=model.to("cpu").eval(), return_single_mask=False)
+    embed_dim = model.prompt_encoder.embed_dim
+    embed_size = model.prompt_encoder.image_embedding_size
+    mask_input_size = [4 * x for x in embed_size]
+    dummy_inputs = {
+        "image_embeddings": torch.randn(1, embed_dim, *embed_size, dtype=torch.float),
+        "point_coords": torch.randint(low=0, high=1024, size=(1, 5, 2), dtype=torch.float),
+        "point_labels": torch.randint(low=0, high=4, size=(1, 5), dtype=torch.float),
+        "mask_input": torch.randn(1, 1, *mask_input_size, dtype=torch.float),
+        "has_mask_input": torch.tensor([1], dtype=torch.float),
+        "orig_im_size": torch.tensor([1500, 2250], dtype=torch.float),
+    }
+    torch.onnx.export(onnx_model, tuple(dummy_inputs.values()), onnx_file,
+                      export_params=True, opset_version=opset_version, do_constant_folding=True,
+                      input_names=list(dummy_inputs.keys()),
+                      output_names=["masks", "iou_predictions", "low_res_masks"],
+                      dynamic_axes={"point_coords": {1: "num_points"}, "point_labels": {1: "num_points"}})
+
+
+class OnnxSamEncoder():
+    """
+    The image encoder of a SAM model run with onnxruntime, exported on first use.
+
+    Parameters
+    ----------
+    model : Sam
+        the model
+    checkpoint_path : str
+        path to the checkpoint (the onnx file is next to it)
+    num_threads : int
+        number of intra-op threads (0 lets onnxruntime decide)
+    """
+
+    def __init__(self, model, checkpoint_path, num_threads=0):
+        from .onnx_backend import make_session
+
+        onnx_file = encoder_file_for(checkpoint_path)
+        if not osp.exists(onnx_file):
+            export_encoder(model, onnx_file)
+        self.session = make_session(onnx_file, num_threads)
+
+    def __call__(self, input_image):
+        """Image embedding of the preprocessed image tensor (1x3xSxS)."""
+        features = self.session.run(None, {"image": input_image.detach().cpu().numpy().astype(np.float32)})[0]
+        return torch.from_numpy(features)
+
+
+class OnnxSamDecoder():
+    """
+    The prompt encoder and mask decoder of a SAM model run with onnxruntime, exported on first use.
+    `predict` takes the prompts of `SamPredictor.predict` for the image set in a `SamPredictor`.
+
+    Parameters
+    ----------
+    model : Sam
+        the model
+    checkpoint_path : str
+        path to the checkpoint (the onnx file is next to it)
+    num_threads : int
+        number of intra-op threads (0 lets onnxruntime decide)
+    """
+
+    def __init__(self, model, checkpoint_path, num_threads=0):
+        from .onnx_backend import make_session
+
+        onnx_file = decoder_file_for(checkpoint_path)
+        if not osp.exists(onnx_file):
+            export_decoder(model, onnx_file)
+        self.session = make_session(onnx_file, num_threads)
+        self.mask_input_size = [4 * x for x in model.prompt_encoder.image_embedding_size]
+        # the image embedding as a numpy array, converted once per image
+        self._features = None
+        self._embeddings = None
+
+    def _image_embeddings(self, predictor):
+        if self._features is not predictor.features:
+            self._features = predictor.features
+            self._embeddings = predictor.features.detach().cpu().numpy().astype(np.float32)
+        return self._embeddings
+
+    def predict(self, predictor, point_coords=None, point_labels=None, box=None, mask_input=None,
+                multimask_output=True):
+        """
+        Summary:
+            Predict masks for the prompts, like `SamPredictor.predict`.
+
+        Args:
+            predictor (SamPredictor): the predictor with the image set
+            point_coords (np.ndarray): Nx2 points (x, y) in pixels
+            point_labels (np.ndarray): N labels (1 foreground, 0 background)
+            box (np.ndarray): a box (x1, y1, x2, y2) in pixels
+            mask_input (np.ndarray): 1x256x256 low resolution mask logits of a previous prediction
+            multimask_output (bool): return 3 masks instead of 1
+
+        Returns:
+            masks (np.ndarray): CxHxW boolean masks
+            scores (np.ndarray): C scores
+            logits (np.ndarray): Cx256x256 low resolution mask logits
+        """
+        coords, labels = [], []
+        if point_coords is not None:
+            coords.append(np.asarray(point_coords, dtype=np.float32).reshape(-1, 2))
+            labels.append(np.asarray(point_labels, dtype=np.float32).reshape(-1))
+        if box is not None:
+            coords.append(np.asarray(box, dtype=np.float32).reshape(-1, 4)[0].reshape(2, 2))
+            labels.append(np.array([2, 3], dtype=np.float32))
+        else:
+            # padding point, as the exported model expects when there is no box
+            coords.append(np.zeros((1, 2), dtype=np.float32))
+            labels.append(np.array([-1], dtype=np.float32))
+        coords = predictor.transform.apply_coords(np.concatenate(coords), predictor.original_size)
+        if mask_input is None:
+            mask_input = np.zeros((1, 1, *self.mask_input_size), dtype=np.float32)
+            has_mask_input = np.zeros(1, dtype=np.float32)
+        else:
+            mask_input = np.asarray(mask_input, dtype=np.float32).reshape(1, 1, *self.mask_input_size)
+            has_mask_input = np.ones(1, dtype=np.float32)
+        masks, scores, logits = self.session.run(None, {
+            "image_embeddings": self._image_embeddings(predictor),
+            "point_coords": coords[None, :, :].astype(np.float32),
+            "point_labels": np.concatenate(labels)[None, :],
+            "mask_input": mask_input,
+            "has_mask_input": has_mask_input,
+            "orig_im_size": np.array(predictor.original_size, dtype=np.float32),
+        })
+        # the first mask is the single mask output, the others the multimask outputs
+        selection = slice(1, None) if multimask_output else slice(0, 1)
+        masks, scores, logits = masks[0][selection], scores[0][selection], logits[0][selection]
+        return masks > predictor.model.mask_threshold, scores, logits
@@ -0,0 +1,113 @@
+import threading
+
+import cv2
+
+from .sam_cache import token_key
+from .sam_cache import video_frame_token
+
+
+class SamEmbeddingPrecomputer(object):
+    """
+    Compute the SAM embeddings of video frames on a background thread into the
+    embedding cache of the SAM predictor, so SAM prompts and SAM interpolation
+    on these frames find their embedding already computed.
+
+    A request replaces the previous one (the frames of the previous request not
+    computed yet are dropped). The frames are read with a video capture of the
+    worker thread, and a request stops once the embeddings it computed reach the
+    memory cap, so it does not evict the embeddings it computed first.
+
+    Parameters
+    ----------
+    memory_mb : int
+        memory cap of the embeddings computed for a request in MB
+    """
+
+    def __init__(self, memory_mb=512):
+        self.budget = memory_mb * 1024 * 1024
+        self.predictor = None
+        self.condition = threading.Condition()
+        self.job = None
+        self.generation = 0
+        self.running = True
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def set_predictor(self, predictor):
+        """Set the SAM predictor (with an embedding cache) to precompute the embeddings of, None to stop."""
+        with self.condition:
+            self.predictor = predictor
+            self.generation += 1
+            self.job = None
+
+    def request(self, video_file, frames):
+        """
+        Summary:
+            Precompute the embeddings of video frames, in the given order, instead of the previous request.
+
+        Args:
+            video_file (str): path of the video
+            frames (list): frame indices (starting from 1)
+        """
+        with self.condition:
+            if self.predictor is None or self.predictor.cache is None:
+                return
+            self.generation += 1
+            self.job = (self.generation, self.predictor, video_file, list(frames))
+            self.condition.notify()
+
+    def cancel(self):
+        with self.condition:
+            self.generation += 1
+            self.job = None
+
+    def shutdown(self):
+        with self.condition:
+            self.running = False
+            self.generation += 1
+            self.job = None
+            self.condition.notify()
+
+    def _cancelled(self, generation):
+        return generation != self.generation or not self.running
+
+    def _run(self):
+        cap, cap_file = None, None
+        while True:
+            with self.condition:
+                while self.running and self.job is None:
+                    self.condition.wait()
+                if not self.running:
+                    break
+                generation, predictor, video_file, frames = self.job
+                self.job = None
+            if cap_file != video_file:
+                if cap is not None:
+                    cap.release()
+                cap, cap_file = cv2.VideoCapture(video_file), video_file
+            try:
+                self._precompute(generation, predictor, cap, video_file, frames)
+            except Exception as e:
+                print(f"Error precomputing the SAM embeddings: {e}")
+        if cap is not None:
+            cap.release()
+
+    def _precompute(self, generation, predictor, cap, video_file, frames):
+        size = 0
+        position = None
+        for frame_idx in frames:
+            if self._cancelled(generation) or size >= self.budget:
+                return
+            key = token_key(video_frame_token(video_file, frame_idx))
+            if predictor.cache.contains(predictor.model_type, key):
+                continue
+            # frames in order are read without seeking
+            if position != frame_idx - 1:
+                cap.set(cv2.CAP_PROP_POS_FRAMES, frame_idx - 1)
+            success, image = cap.read()
+            position = frame_idx
+            if not success:
+                return
+            embedding = predictor.compute_embedding(image)
+            predictor.cache.put(predictor.model_type, key, embedding)
+            size += embedding["features"].numel() * embedding["features"].element_size()
@@ -0,0 +1,148 @@
+import cv2
+import numpy as np
+
+from .helpers import mathOps
+
+
+class SamPropagator(object):
+    """
+    Track the masks of objects from frame to frame with SAM only (no detector),
+    so objects of any class can be tracked from a first annotated frame.
+
+    The box of each object in the next frame is its box moved by the motion of
+    the object, estimated with sparse optical flow (Lucas-Kanade) on points of
+    the object, or with its last motion (constant velocity) if too few points are
+    tracked. SAM is then prompted with the predicted boxes and the previous mask
+    logits moved the same way, for all the objects of the frame in one decoder pass.
+    An object whose mask is lost is no longer propagated.
+
+    Parameters
+    ----------
+    predictor : Sam_Predictor
+        the SAM predictor
+    max_corners : int
+        maximum number of points tracked per object
+    min_points : int
+        minimum number of tracked points to use the optical flow
+    """
+
+    def __init__(self, predictor, max_corners=30, min_points=3):
+        self.predictor = predictor
+        self.max_corners = max_corners
+        self.min_points = min_points
+        self.objects = {}
+        self.prev_gray = None
+
+    @staticmethod
+    def _gray(image):
+        return cv2.cvtColor(image, cv2.COLOR_BGR2GRAY) if image.ndim == 3 else image
+
+    @staticmethod
+    def _box(polygon):
+        polygon = np.asarray(polygon).reshape(-1, 2)
+        return [int(polygon[:, 0].min()), int(polygon[:, 1].min()), int(polygon[:, 0].max()), int(polygon[:, 1].max())]
+
+    def start(self, image, token, polygons):
+        """
+        Summary:
+            Start propagating objects from their polygons in a frame.
+
+        Args:
+            image (np.ndarray): the frame (BGR)
+            token (tuple): the SAM image token of the frame
+            polygons (dict): id -> polygon (list of [x, y] points) of the objects
+        """
+        self.objects = {}
+        ids = [id for id in polygons if len(polygons[id]) > 2]
+        self.prev_gray = self._gray(image)
+        if len(ids) == 0:
+            return
+        boxes = [self._box(polygons[id]) for id in ids]
+        # the mask logits of the objects in this frame, the mask prompts of the next frame
+        self.predictor.check_image(image, token)
+        _, _, logits = self.predictor.predict_boxes(boxes, batch_size=len(boxes), return_logits=True)
+        for id, box, logit in zip(ids, boxes, logits):
+            self.objects[id] = {"box": box, "polygon": np.asarray(polygons[id]).reshape(-1, 2),
+                                "logits": logit, "velocity": (0.0, 0.0)}
+
+    def _motions(self, gray):
+        # one Lucas-Kanade pass for the points of all the objects
+        ids, points = [], []
+        for id, object in self.objects.items():
+            x1, y1, x2, y2 = object["box"]
+            x1, y1 = max(x1, 0), max(y1, 0)
+            x2, y2 = min(x2 + 1, gray.shape[1]), min(y2 + 1, gray.shape[0])
+            if x2 - x1 < 2 or y2 - y1 < 2:
+                continue
+            mask = np.zeros((y2 - y1, x2 - x1), dtype=np.uint8)
+            cv2.fillPoly(mask, [(object["polygon"] - [x1, y1]).astype(np.int32)], 255)
+            corners = cv2.goodFeaturesToTrack(self.prev_gray[y1:y2, x1:x2], self.max_corners, 0.01, 3, mask=mask)
+            if corners is None:
+                continue
+            points.append(corners.reshape(-1, 2) + [x1, y1])
+            ids.extend([id] * len(corners))
+        motions = {}
+        if len(ids) == 0:
+            return motions
+        points = np.concatenate(points).astype(np.float32)
+        new_points, status, _ = cv2.calcOpticalFlowPyrLK(self.prev_gray, gray, points[:, None, :], None)
+        displacements = new_points.reshape(-1, 2) - points
+        status = status.reshape(-1).astype(bool)
+        ids = np.array(ids)
+        for id in self.objects:
+            tracked = (ids == id) & status
+            if tracked.sum() >= self.min_points:
+                motions[id] = tuple(np.median(displacements[tracked], axis=0).tolist())
+        return motions
+
+    def _shift_logits(self, logits, dx, dy):
+        # the low resolution logits cover the image resized to the SAM input size
+        scale = self.predictor.predictor.transform.target_length / max(self.predictor.predictor.original_size) / 4
+        matrix = np.float32([[1, 0, dx * scale], [0, 1, dy * scale]])
+        return cv2.warpAffine(logits.astype(np.float32), matrix, logits.shape[::-1],
+                              flags=cv2.INTER_LINEAR, borderMode=cv2.BORDER_CONSTANT, borderValue=-20.0)
+
+    def step(self, image, token):
+        """
+        Summary:
+            Propagate the objects to the next frame.
+
+        Args:
+            image (np.ndarray): the next frame (BGR)
+            token (tuple): the SAM image token of the frame
+
+        Returns:
+            results (dict): id -> (box, polygon, score) of the objects found in the frame
+        """
+        gray = self._gray(image)
+        if len(self.objects) == 0:
+            self.prev_gray = gray
+            return {}
+        motions = self._motions(gray)
+        h, w = gray.shape[:2]
+        ids, boxes, mask_inputs = [], [], []
+        for id, object in self.objects.items():
+            dx, dy = motions.get(id, object["velocity"])
+            object["velocity"] = (dx, dy)
+            x1, y1, x2, y2 = object["box"]
+            boxes.append([min(max(x1 + dx, 0), w - 1), min(max(y1 + dy, 0), h - 1),
+                          min(max(x2 + dx, 0), w - 1), min(max(y2 + dy, 0), h - 1)])
+            mask_inputs.append(self._shift_logits(object["logits"], dx, dy))
+            ids.append(id)
+
+        self.predictor.check_image(image, token)
+        masks, scores, logits = self.predictor.predict_boxes(
+            boxes, batch_size=len(boxes), mask_inputs=np.stack(mask_inputs), return_logits=True)
+
+        results = {}
+        for id, mask, score, logit in zip(ids, masks, scores, logits):
+            polygon = mathOps.mask_to_polygons(mask)
+            if len(polygon) < 3:
+                # the object is lost
+                del self.objects[id]
+                continue
+            box = self._box(polygon)
+            self.objects[id].update({"box": box, "polygon": polygon, "logits": logit})
+            results[id] = (box, polygon, score)
+        self.prev_gray = gray
+        return results
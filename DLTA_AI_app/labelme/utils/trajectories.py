@@ -0,0 +1,208 @@
+import os
+
+import numpy as np
+
+
+class Trajectories(object):
+    """
+    The centers of the tracked objects of a video, used to draw their trajectories.
+
+    Each id has a sparse frame -> center dict (only the frames where the object
+    is present), so updating the centers of some frames does not depend on the
+    length of the video. The centers can be saved next to the tracking results
+    with the size and modification time of the tracking results file, so opening
+    the video again loads them instead of going through all the tracking results.
+
+    Parameters
+    ----------
+    length : int
+        number of frames of the drawn trajectories
+    alpha : float
+        opacity of the drawn masks
+    """
+
+    VERSION = 1
+
+    def __init__(self, length=30, alpha=0.70):
+        self.length = length
+        self.alpha = alpha
+        self.centers = {}
+        self.colors = {}
+
+    def ids(self):
+        return list(self.centers)
+
+    def frames(self, id):
+        return list(self.centers.get(id, ()))
+
+    def color(self, id):
+        return self.colors.get(id)
+
+    def add(self, id, frame, center, color=None):
+        """
+        Summary:
+            Set the center of an object in a frame, smoothed with its center in the previous frame.
+
+        Args:
+            id (int): the object id
+            frame (int): the frame index (starting from 1)
+            center (tuple): the center (x, y) of the object
+            color (tuple): the color of the object trajectory
+        """
+        centers = self.centers.setdefault(id, {})
+        previous = centers.get(frame - 1)
+        if previous is not None:
+            r = 0.5
+            center = (r * center[0] + (1 - r) * previous[0], r * center[1] + (1 - r) * previous[1])
+        centers[frame] = (int(center[0]), int(center[1]))
+        if color is not None:
+            self.colors[id] = color
+
+    def remove(self, id, frames):
+        centers = self.centers.get(id)
+        if centers is None:
+            return
+        for frame in frames:
+            centers.pop(frame, None)
+
+    def transfer(self, id, new_id, frames):
+        """
+        Summary:
+            Move the centers of some frames from an id to another id.
+
+        Args:
+            id (int): the id to transfer from
+            new_id (int): the id to transfer to
+            frames (list): the frames to transfer
+        """
+        centers = self.centers.get(id, {})
+        new_centers = self.centers.setdefault(new_id, {})
+        for frame in frames:
+            if frame in centers:
+                new_centers[frame] = centers.pop(frame)
+        if new_id not in self.colors and id in self.colors:
+            self.colors[new_id] = self.colors[id]
+
+    def points(self, id, frame):
+        """
+        Summary:
+            Get the centers of an object in the last `length` frames up to a frame.
+
+        Args:
+            id (int): the object id
+            frame (int): the current frame index (starting from 1)
+
+        Returns:
+            points (list): the centers from the oldest frame to the current one, None for the frames without the object
+        """
+        centers = self.centers.get(id, {})
+        return [centers.get(f) for f in range(max(frame - self.length, 0) + 1, frame + 1)]
+
+    def update(self, frames, color_of):
+        """
+        Summary:
+            Set the centers of the objects of tracking results frames,
+            the centers in these frames of the ids that are no longer in them are removed.
+
+        Args:
+            frames (list): the frames (each frame is a dictionary with keys (frame_idx, frame_data))
+            color_of (callable): returns the color of a class name
+        """
+        present = {frame['frame_idx']: {object['tracker_id'] for object in frame['frame_data'] if len(object['segment'])}
+                   for frame in frames}
+        for id, centers in self.centers.items():
+            for frame_idx in centers.keys() & present.keys():
+                if id not in present[frame_idx]:
+                    del centers[frame_idx]
+        for frame in frames:
+            frame_idx = frame['frame_idx']
+            objects = [object for object in frame['frame_data'] if len(object['segment'])]
+            for object, center in zip(objects, segment_centers([object['segment'] for object in objects])):
+                self.add(object['tracker_id'], frame_idx, center, color_of(object['class_name']))
+
+    @staticmethod
+    def signature(source):
+        try:
+            stat = os.stat(source)
+        except OSError:
+            return None
+        return [stat.st_size, stat.st_mtime_ns]
+
+    def save(self, filename, source):
+        """
+        Summary:
+            Save the centers with the signature of the tracking results file they were calculated from.
+
+        Args:
+            filename (str): path of the trajectories file (.npz)
+            source (str): path of the tracking results file
+        """
+        signature = self.signature(source)
+        if signature is None:
+            return
+        ids = self.ids()
+        frames = [np.fromiter(self.centers[id].keys(), dtype=np.int32, count=len(self.centers[id])) for id in ids]
+        centers = [np.array(list(self.centers[id].values()), dtype=np.int32).reshape(-1, 2) for id in ids]
+        offsets = np.zeros(len(ids) + 1, dtype=np.int64)
+        offsets[1:] = np.cumsum([len(f) for f in frames])
+        colors = np.array([self.colors.get(id, (0, 0, 0)) for id in ids], dtype=np.int32).reshape(-1, 3)
+        # written to a temporary file first so a failed save does not corrupt the file
+        tmp_file = filename + ".tmp"
+        with open(tmp_file, "wb") as f:
+            np.savez(f, version=np.array(self.VERSION), signature=np.array(signature, dtype=np.int64),
+                     ids=np.array(ids, dtype=np.int64), colors=colors, offsets=offsets,
+                     frames=np.concatenate(frames) if ids else np.zeros(0, dtype=np.int32),
+                     centers=np.concatenate(centers) if ids else np.zeros((0, 2), dtype=np.int32))
+        os.replace(tmp_file, filename)
+
+    @classmethod
+    def load(cls, filename, source, length=30, alpha=0.70):
+        """
+        Summary:
+            Load the centers saved by `save`, if the tracking results file did not change since.
+
+        Args:
+            filename (str): path of the trajectories file (.npz)
+            source (str): path of the tracking results file
+
+        Returns:
+            trajectories (Trajectories): the trajectories, None if the file does not exist or is outdated
+        """
+        if not os.path.exists(filename):
+            return None
+        try:
+            with np.load(filename) as npz:
+                if int(npz["version"]) != cls.VERSION or npz["signature"].tolist() != cls.signature(source):
+                    return None
+                ids, colors, offsets = npz["ids"].tolist(), npz["colors"].tolist(), npz["offsets"].tolist()
+                frames, centers = npz["frames"].tolist(), npz["centers"].tolist()
+        except Exception as e:
+            print(f"Error loading the trajectories {filename}: {e}")
+            return None
+        trajectories = cls(length, alpha)
+        for i, id in enumerate(ids):
+            start, end = offsets[i], offsets[i + 1]
+            trajectories.centers[id] = dict(zip(frames[start:end], map(tuple, centers[start:end])))
+            trajectories.colors[id] = tuple(colors[i])
+        return trajectories
+
+
+def segment_centers(segments):
+    """
+    Summary:
+        Calculate the center of mass of the points of several segments at once.
+
+    Args:
+        segments (list): the segments (lists of [x, y] points, not empty)
+
+    Returns:
+        centers (list): the (x, y) center of each segment
+    """
+    if not segments:
+        return []
+    lengths = [len(segment) for segment in segments]
+    points = np.array([point for segment in segments for point in segment], dtype=np.float64).reshape(-1, 2)
+    starts = np.zeros(len(segments), dtype=np.int64)
+    starts[1:] = np.cumsum(lengths)[:-1]
+    centers = (np.add.reduceat(points, starts, axis=0) / np.array(lengths)[:, None]).astype(np.int64)
+    return [tuple(center) for center in centers.tolist()]
@@ -1,12 +1,14 @@
 import os
 import sys
 import cv2
-from PyQt6.QtWidgets import QApplication, QWidget, QLabel, QPushButton, QFileDialog, QSlider, QLineEdit, QVBoxLayout, QHBoxLayout, QDialog, QProgressBar
-from PyQt6.QtCore import Qt
+from PyQt6.QtWidgets import QApplication, QWidget, QLabel, QPushButton, QFileDialog, QSlider, QLineEdit, QVBoxLayout, QHBoxLayout, QDialog, QProgressBar, QComboBox, QSpinBox
+from PyQt6.QtCore import Qt, QThread, pyqtSignal
 from PyQt6.QtGui import QFont
 from PyQt6 import QtWidgets
 import qdarktheme
 
+from .frame_extraction import FORMATS, extract_frames, get_time_string
+
 
 class VideoFrameExtractor(QDialog):
     def __init__(self, mute = None, notification = None):
@@ -29,6 +31,7 @@ class VideoFrameExtractor(QDialog):
         self.fps = None
         self.stop = False
         self.path_name = None
+        self.worker = None
 
         font = QFont()
         font.setBold(True)
@@ -86,6 +89,16 @@ class VideoFrameExtractor(QDialog):
         self.end_time_label.setFont(font)
         self.end_time_label.setAlignment(Qt.AlignmentFlag.AlignRight)
 
+        self.format_label = QLabel("Image format:")
+        self.format_combo = QComboBox()
+        self.format_combo.addItems(FORMATS)
+        self.format_combo.currentTextChanged.connect(
+            lambda image_format: self.quality_spin.setEnabled(image_format != "png"))
+        self.quality_label = QLabel("Quality:")
+        self.quality_spin = QSpinBox()
+        self.quality_spin.setRange(1, 100)
+        self.quality_spin.setValue(95)
+
         self.extract_button = QPushButton("Extract Frames")
         self.extract_button.clicked.connect(self.extract_frames)
         self.extract_button.setEnabled(False)
@@ -144,6 +157,12 @@ class VideoFrameExtractor(QDialog):
         end_layout.setContentsMargins(20, 0, 0, 0)
         range_layout.addLayout(end_layout)
 
+        format_layout = QHBoxLayout()
+        format_layout.addWidget(self.format_label)
+        format_layout.addWidget(self.format_combo)
+        format_layout.addWidget(self.quality_label)
+        format_layout.addWidget(self.quality_spin)
+
         button_layout = QHBoxLayout()
         button_layout.addWidget(self.extract_button)
         button_layout.addWidget(self.stop_button)
@@ -156,6 +175,8 @@ class VideoFrameExtractor(QDialog):
 
         main_layout.addLayout(sampling_layout)
 
+        main_layout.addLayout(format_layout)
+
         main_layout.addLayout(button_layout)
 
         main_layout.addWidget(self.progress_bar)
@@ -277,107 +298,112 @@ class VideoFrameExtractor(QDialog):
             pass
 
     def extract_frames(self):
-        # Call the vid_to_frames function with the selected parameters
-        try:
-            self.path_name = self.vid_to_frames(self.vid_path, self.sampling_rate, self.start_frame, self.end_frame)
-        except ValueError as e:
-            self.progress_bar.setFormat(str(e))
+        # Extract the frames with the selected parameters on a worker thread
+        if self.worker is not None and self.worker.isRunning():
             return
-        self.close()
-        return self.path_name
-        
-    
-    def stop_extraction(self):
-        # stop the extraction process
-        self.stop = True
-
-    def get_time_string(self, seconds, separator=":"):
-        # Convert seconds to hh:mm:ss format
-        m, s = divmod(seconds, 60)
-        h, m = divmod(m, 60)
-        return f"{int(h):02d}{separator}{int(m):02d}{separator}{int(s):02d}"
-
-
-    def vid_to_frames(self, vid_path, sampling_rate, start_frame, end_frame):
-        """
-        Extracts frames from a video file and saves them as JPEG images.
-
-        Args:
-            vid_path (str): Path to the video file.
-            sampling_rate (int): How often to save a frame. For example, if sampling_rate = 2, every other frame will be saved.
-            start_frame (int): Starting frame number.
-            end_frame (int): Ending frame number.
-        """
-        # Check if the path exists
-        if not os.path.exists(vid_path):
-            raise ValueError("Video path does not exist")
-
-        # Create a directory to store the frames
-        frames_path = "".join([vid_path.split(".")[0], "_frames"])
-
-        # if the directory does not exist, create it
-        if not os.path.exists(frames_path):
-            os.mkdir(frames_path)
-        # if the directory exists, delete all the files it contains
-        else:
-            for file in os.listdir(frames_path):
-                os.remove(os.path.join(frames_path, file))
-
-        # Open the video file
-        vidcap = cv2.VideoCapture(vid_path)
-        # if the video file does not exist, raise an error
-
-        # Set the starting frame
-        vidcap.set(cv2.CAP_PROP_POS_FRAMES, start_frame)
-
-        # Get the total number of frames in the video
-        n_frames = int(vidcap.get(cv2.CAP_PROP_FRAME_COUNT))
-        print(f"Total number of frames: {n_frames}")
-
-        # Initialize counters
-        count = start_frame
-        success = True
-
-        # set progress bar Format
-        while success:
-            success, image = vidcap.read()
-            if count % sampling_rate == 0:
-                # Get the time in the video corresponding to the current frame
-                time_in_sec = count / self.fps
-                time_str = self.get_time_string(time_in_sec, separator="_")
-
-                # Save the image with the time in the file name
-                indented_count = str(count).zfill(len(str(n_frames)))
-                cv2.imwrite(f"{frames_path}/frame_{indented_count}_time_{time_str}.jpg", image)
-            
-            self.progress_bar.setValue(int(((count - start_frame) / (end_frame - start_frame)) * 100))
-            self.progress_bar.setFormat(f"{int(((count - start_frame) / (end_frame - start_frame)) * 100)}%")
-
-            count += 1
-            if count >= end_frame:
-                self.progress_bar.setValue(100)
-                break
-
-            QtWidgets.QApplication.processEvents()
-            if self.stop:
-                self.stop = False
-                self.progress_bar.setFormat("Extraction stopped")
-                self.progress_bar.setValue(0)
-                break
-            
-                    # Show a notification if the model explorer is not the active window
+        self.stop = False
+        self.extract_button.setEnabled(False)
+        self.progress_bar.setValue(0)
+        self.progress_bar.setFormat("0%")
+        self.worker = FrameExtractionWorker(
+            self, self.vid_path, self.sampling_rate, self.start_frame, self.end_frame,
+            self.format_combo.currentText(), self.quality_spin.value(), lambda: self.stop)
+        self.worker.progress.connect(self.update_progress)
+        self.worker.finished.connect(self.extraction_finished)
+        self.worker.start()
+
+    def update_progress(self, done, total):
+        percent = int(done / total * 100) if total else 100
+        self.progress_bar.setValue(percent)
+        self.progress_bar.setFormat(f"{percent}%")
+
+    def extraction_finished(self):
+        worker, self.worker = self.worker, None
+        self.extract_button.setEnabled(True)
+        if worker.error is not None:
+            self.progress_bar.setFormat(worker.error)
+            return
+        if self.stop:
+            self.stop = False
+            self.progress_bar.setFormat("Extraction stopped")
+            self.progress_bar.setValue(0)
+        # Show a notification if the model explorer is not the active window
         try:
             if not self.mute:
                 if not self.isActiveWindow():
                     self.notification(f"Video Extraction Completed")
         except:
             pass
-        return frames_path
+        self.path_name = worker.frames_path
+        self.close()
+
+    def stop_extraction(self):
+        # stop the extraction process, the extracted frames are kept so it can be resumed
+        if self.worker is not None:
+            self.stop = True
+
+    def stop_worker(self):
+        # stop the extraction and wait for the worker, so its thread is not destroyed while running
+        if self.worker is not None and self.worker.isRunning():
+            self.stop = True
+            self.worker.wait()
+
+    def done(self, result):
+        # reject (Esc) and accept hide the dialog without a close event
+        self.stop_worker()
+        super().done(result)
+
+    def closeEvent(self, event):
+        self.stop_worker()
+        super().closeEvent(event)
+
+    def get_time_string(self, seconds, separator=":"):
+        # Convert seconds to hh:mm:ss format
+        return get_time_string(seconds, separator)
+
+
+class FrameExtractionWorker(QThread):
+    """
+    Run `frame_extraction.extract_frames` in the background, so the dialog stays responsive.
+
+    Parameters
+    ----------
+    parent : QObject
+        the dialog
+    vid_path, sampling_rate, start_frame, end_frame, image_format, quality
+        the parameters of the extraction
+    stop : callable
+        returns True to stop the extraction
+    """
+
+    progress = pyqtSignal(int, int)
+
+    def __init__(self, parent, vid_path, sampling_rate, start_frame, end_frame, image_format, quality, stop):
+        super(FrameExtractionWorker, self).__init__(parent)
+        self.vid_path = vid_path
+        self.sampling_rate = sampling_rate
+        self.start_frame = start_frame
+        self.end_frame = end_frame
+        self.image_format = image_format
+        self.quality = quality
+        self.stop = stop
+        self.frames_path = None
+        self.error = None
+
+    def run(self):
+        try:
+            self.frames_path = extract_frames(
+                self.vid_path, self.sampling_rate, self.start_frame, self.end_frame,
+                image_format=self.image_format, quality=self.quality,
+                progress=self.progress.emit, stop=self.stop)
+        except Exception as e:
+            self.error = str(e)
 
 
+# the extraction without the dialog: python -m labelme.utils.frame_extraction VIDEO ...
 # if __name__ == "__main__":
 #     app = QApplication(sys.argv)
 #     qdarktheme.setup_theme()
 #     window = VideoFrameExtractor()
 #     window.show()
-#     sys.exit(app.exec())
\ No newline at end of file
+#     sys.exit(app.exec())
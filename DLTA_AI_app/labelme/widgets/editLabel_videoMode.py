@@ -234,31 +234,24 @@ def transfer_rec_and_traj(id, id_frames_rec, trajectories, frames, new_id):
         trajectories: a dictionary of trajectories
     """
     
-    # old id frame record and trajectory
+    # old id frame record
     id_rec = id_frames_rec['id_' + str(id)]
-    id_traj = trajectories['id_' + str(id)]
     
-    # new id frame record and trajectory
+    # new id frame record
     try:
         new_id_rec = id_frames_rec['id_' + str(new_id)]
-        new_id_traj = trajectories['id_' + str(new_id)]
     except:
         new_id_rec = set()
-        new_id_traj = [(-1, -1)] * len(id_traj)
         
     # transfer frames
     id_rec = id_rec - set(frames)
     new_id_rec = new_id_rec.union(set(frames))
     
     # transfer trajectories
-    for frame in frames:
-        new_id_traj[frame - 1] = id_traj[frame - 1]
-        id_traj[frame - 1] = (-1, -1)
+    trajectories.transfer(id, new_id, frames)
     
     id_frames_rec['id_' + str(id)] = id_rec
     id_frames_rec['id_' + str(new_id)] = new_id_rec
-    trajectories['id_' + str(id)] = id_traj
-    trajectories['id_' + str(new_id)] = new_id_traj
     
     return id_frames_rec, trajectories
 
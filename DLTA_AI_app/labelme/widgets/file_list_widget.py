@@ -0,0 +1,151 @@
+from PyQt6 import QtCore
+from PyQt6.QtCore import Qt
+from PyQt6 import QtWidgets
+
+
+class FileListModel(QtCore.QAbstractListModel):
+    """
+    The image paths of the file list, without an item object per image.
+
+    The paths are kept in a list with a path -> row dict, and whether an image
+    has a label file in a path -> bool dict, so finding, checking and
+    navigating files does not depend on the number of files. The rows shown
+    are the paths containing the filter text.
+    """
+
+    def __init__(self, parent=None):
+        super(FileListModel, self).__init__(parent)
+        self._checked = {}
+        self._filter = ""
+        self.files = []
+        self._rows = {}
+
+    def rowCount(self, parent=QtCore.QModelIndex()):
+        if parent.isValid():
+            return 0
+        return len(self.files)
+
+    def data(self, index, role=Qt.ItemDataRole.DisplayRole):
+        if not index.isValid():
+            return None
+        filename = self.files[index.row()]
+        if role == Qt.ItemDataRole.DisplayRole or role == Qt.ItemDataRole.ToolTipRole:
+            return filename
+        if role == Qt.ItemDataRole.CheckStateRole:
+            return Qt.CheckState.Checked if self._checked[filename] else Qt.CheckState.Unchecked
+        return None
+
+    def setData(self, index, value, role=Qt.ItemDataRole.EditRole):
+        if not index.isValid() or role != Qt.ItemDataRole.CheckStateRole:
+            return False
+        self._checked[self.files[index.row()]] = Qt.CheckState(value) == Qt.CheckState.Checked
+        self.dataChanged.emit(index, index, [role])
+        return True
+
+    def flags(self, index):
+        return (Qt.ItemFlag.ItemIsEnabled | Qt.ItemFlag.ItemIsSelectable
+                | Qt.ItemFlag.ItemIsUserCheckable | Qt.ItemFlag.ItemNeverHasChildren)
+
+    def addFiles(self, files):
+        """
+        Args:
+            files (list): (path, checked) of the images to add at the end of the list
+        """
+        new = []
+        for filename, checked in files:
+            if filename in self._checked:
+                continue
+            self._checked[filename] = checked
+            if self._filter in filename:
+                new.append(filename)
+        if not new:
+            return
+        start = len(self.files)
+        self.beginInsertRows(QtCore.QModelIndex(), start, start + len(new) - 1)
+        for i, filename in enumerate(new):
+            self._rows[filename] = start + i
+        self.files.extend(new)
+        self.endInsertRows()
+
+    def clear(self):
+        self.beginResetModel()
+        self._checked = {}
+        self.files = []
+        self._rows = {}
+        self.endResetModel()
+
+    def setFilter(self, pattern):
+        pattern = pattern or ""
+        if pattern == self._filter:
+            return
+        self.beginResetModel()
+        self._filter = pattern
+        self.files = [filename for filename in self._checked if pattern in filename]
+        self._rows = {filename: row for row, filename in enumerate(self.files)}
+        self.endResetModel()
+
+    def row(self, filename):
+        return self._rows.get(filename, -1)
+
+    def contains(self, filename):
+        return filename in self._checked
+
+    def setChecked(self, filename, checked):
+        if filename not in self._checked:
+            return
+        self._checked[filename] = checked
+        row = self.row(filename)
+        if row >= 0:
+            index = self.index(row)
+            self.dataChanged.emit(index, index, [Qt.ItemDataRole.CheckStateRole])
+
+
+class FileListWidget(QtWidgets.QListView):
+    """List view of a `FileListModel`, with the parts of the QListWidget API used by the app."""
+
+    itemSelectionChanged = QtCore.pyqtSignal()
+
+    def __init__(self, parent=None):
+        super(FileListWidget, self).__init__(parent)
+        self.fileModel = FileListModel(self)
+        self.setModel(self.fileModel)
+        # all the rows have the same height, so the view does not measure every row
+        self.setUniformItemSizes(True)
+        self.setSelectionMode(QtWidgets.QAbstractItemView.SelectionMode.SingleSelection)
+        self.setEditTriggers(QtWidgets.QAbstractItemView.EditTrigger.NoEditTriggers)
+        self.selectionModel().selectionChanged.connect(lambda *args: self.itemSelectionChanged.emit())
+
+    @property
+    def files(self):
+        return self.fileModel.files
+
+    def count(self):
+        return self.fileModel.rowCount()
+
+    def clear(self):
+        self.fileModel.clear()
+
+    def addFiles(self, files):
+        self.fileModel.addFiles(files)
+
+    def setFilter(self, pattern):
+        self.fileModel.setFilter(pattern)
+
+    def row(self, filename):
+        return self.fileModel.row(filename)
+
+    def contains(self, filename):
+        return self.fileModel.contains(filename)
+
+    def setChecked(self, filename, checked):
+        self.fileModel.setChecked(filename, checked)
+
+    def currentRow(self):
+        index = self.currentIndex()
+        return index.row() if index.isValid() else -1
+
+    def setCurrentRow(self, row):
+        self.setCurrentIndex(self.fileModel.index(row))
+
+    def selectedFiles(self):
+        return [self.fileModel.files[index.row()] for index in self.selectionModel().selectedIndexes()]
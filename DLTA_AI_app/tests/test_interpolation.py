@@ -0,0 +1,70 @@
+import copy
+
+from labelme.utils.interpolation import interpolate_ids
+
+
+def make_object(id, frame_idx):
+    return {'tracker_id': id, 'bbox': [frame_idx, frame_idx, frame_idx + 10, frame_idx + 10],
+            'confidence': '1.0', 'class_name': 'car', 'class_id': 2,
+            'segment': [[frame_idx, frame_idx], [frame_idx + 10, frame_idx], [frame_idx + 10, frame_idx + 10]]}
+
+
+def make_results(ids, n_frames):
+    # every id in every frame
+    return [{'frame_idx': frame_idx, 'frame_data': [make_object(id, frame_idx) for id in ids]}
+            for frame_idx in range(1, n_frames + 1)]
+
+
+def frames_of(listObj, id):
+    return [frame['frame_idx'] for frame in listObj for object_ in frame['frame_data'] if object_['tracker_id'] == id]
+
+
+def test_interpolate_all_frames():
+    listObj = make_results([1], 10)
+    for frame in listObj[1:9]:
+        frame['frame_data'] = []
+    added = interpolate_ids(listObj, [1])
+    assert added == {1: list(range(2, 10))}
+    assert frames_of(listObj, 1) == list(range(1, 11))
+    assert listObj[4]['frame_data'][0]['bbox'] == [5, 5, 15, 15]
+
+
+def test_interpolate_key_frames_replaces_the_other_frames():
+    listObj = make_results([1, 2], 10)
+    added = interpolate_ids(listObj, [1, 2], key_frames={1: {1, 10}, 2: {1, 10}})
+    assert sorted(added) == [1, 2]
+    for id in [1, 2]:
+        assert frames_of(listObj, id) == list(range(1, 11))
+
+
+def test_interrupted_key_frames_keep_the_objects_not_interpolated():
+    listObj = make_results([1, 2], 10)
+    original = copy.deepcopy(listObj)
+    calls = []
+
+    def stop():
+        # stop after the first id
+        calls.append(1)
+        return len(calls) > 1
+
+    added = interpolate_ids(listObj, [1, 2], key_frames={1: {1, 10}, 2: {1, 10}}, stop=stop)
+    assert list(added) == [1]
+    assert frames_of(listObj, 1) == list(range(1, 11))
+    # the id not interpolated is left as it was
+    assert [[o for o in frame['frame_data'] if o['tracker_id'] == 2] for frame in listObj] == \
+        [[o for o in frame['frame_data'] if o['tracker_id'] == 2] for frame in original]
+
+
+def test_interrupted_mid_id_keeps_the_unfilled_gaps():
+    listObj = make_results([1], 10)
+    original = copy.deepcopy(listObj)
+    calls = []
+
+    def stop():
+        # stop after the first gap
+        calls.append(1)
+        return len(calls) > 1
+
+    interpolate_ids(listObj, [1], key_frames={1: {1, 5, 10}}, stop=stop)
+    assert frames_of(listObj, 1) == list(range(1, 11))
+    assert listObj[6:] == original[6:]
@@ -0,0 +1,372 @@
+import argparse
+import inspect
+import os
+import sys
+import time
+from collections import defaultdict
+from pathlib import Path
+
+import cv2
+import numpy as np
+import orjson
+import torch
+from scipy.optimize import linear_sum_assignment
+
+FILE = Path(__file__).resolve()
+ROOT = FILE.parents[0].parents[0]  # DLTA_AI_app root directory
+
+if str(ROOT) not in sys.path:
+    sys.path.append(str(ROOT))  # add ROOT to PATH
+
+from trackers.multi_tracker_zoo import create_tracker
+from trackers.cmc import CMCService
+
+TRACKERS = ['bytetrack', 'strongsort', 'deepocsort', 'ocsort', 'botsort']
+ALPHAS = np.arange(0.05, 0.99, 0.05)
+EPS = np.finfo('float').eps
+
+
+# ------------------------------------------------------------------------------------------------
+# loading cached detections / results
+
+
+def load_tracks(path, box_format='xyxy'):
+    """
+    Summary:
+        Load per-frame boxes from a DLTA-AI tracking results json or a MOT txt file.
+
+    Args:
+        path (str): `*_tracking_results.json` or MOT txt (as written by `exportMOT`)
+        box_format (str): layout of the 4 box columns of a MOT txt, 'xyxy' (exportMOT) or 'tlwh' (MOTChallenge)
+
+    Returns:
+        frames (dict): frame_idx -> np.ndarray of shape (N, 7): x1, y1, x2, y2, confidence, class_id, tracker_id
+    """
+
+    frames = defaultdict(lambda: np.empty((0, 7)))
+    if str(path).endswith('.json'):
+        with open(path, 'rb') as f:
+            data = orjson.loads(f.read())
+        for frame in data:
+            rows = [[*obj['bbox'][:4],
+                     1.0 if obj['confidence'] is None else float(obj['confidence']),
+                     obj['class_id'],
+                     obj['tracker_id']] for obj in frame['frame_data']]
+            if rows:
+                frames[int(frame['frame_idx'])] = np.array(rows, dtype=np.float64)
+        return frames
+
+    data = np.loadtxt(path, delimiter=',', ndmin=2)
+    if len(data) == 0:
+        return frames
+    boxes = data[:, 2:6].copy()
+    if box_format == 'tlwh':
+        boxes[:, 2:] += boxes[:, :2]
+    # MOT class ids are 1 based
+    rows = np.column_stack([boxes, data[:, 6], data[:, 7] - 1, data[:, 1]])
+    for frame_idx in np.unique(data[:, 0]).astype(int):
+        frames[frame_idx] = rows[data[:, 0] == frame_idx]
+    return frames
+
+
+def iou_matrix(boxes1, boxes2):
+    # pairwise iou of two sets of xyxy boxes
+    if len(boxes1) == 0 or len(boxes2) == 0:
+        return np.zeros((len(boxes1), len(boxes2)))
+    lt = np.maximum(boxes1[:, None, :2], boxes2[None, :, :2])
+    rb = np.minimum(boxes1[:, None, 2:4], boxes2[None, :, 2:4])
+    wh = np.clip(rb - lt, 0, None)
+    inter = wh[..., 0] * wh[..., 1]
+    area1 = (boxes1[:, 2] - boxes1[:, 0]) * (boxes1[:, 3] - boxes1[:, 1])
+    area2 = (boxes2[:, 2] - boxes2[:, 0]) * (boxes2[:, 3] - boxes2[:, 1])
+    union = area1[:, None] + area2[None, :] - inter
+    return np.where(union > EPS, inter / np.maximum(union, EPS), 0.0)
+
+
+# ------------------------------------------------------------------------------------------------
+# metrics (same definitions as TrackEval: CLEAR MOTA, IDF1 and HOTA)
+
+
+def evaluate(gt_frames, tr_frames):
+    """
+    Summary:
+        Compute MOTA, IDF1 and HOTA of tracker results against ground truth.
+
+    Args:
+        gt_frames (dict): frame_idx -> (N, 7) array as returned by `load_tracks`
+        tr_frames (dict): frame_idx -> (M, 7) array in the same layout
+
+    Returns:
+        metrics (dict): MOTA, IDF1, HOTA, DetA, AssA, IDSW
+    """
+
+    frame_ids = sorted(set(gt_frames.keys()) | set(tr_frames.keys()))
+    gt_ids = np.unique(np.concatenate([gt_frames[f][:, 6] for f in frame_ids] + [np.empty(0)]))
+    tr_ids = np.unique(np.concatenate([tr_frames[f][:, 6] for f in frame_ids] + [np.empty(0)]))
+    n_gt, n_tr = len(gt_ids), len(tr_ids)
+
+    # per frame: contiguous gt ids, tracker ids and their iou matrix
+    timesteps = []
+    for f in frame_ids:
+        gt, tr = gt_frames[f], tr_frames[f]
+        timesteps.append((np.searchsorted(gt_ids, gt[:, 6]), np.searchsorted(tr_ids, tr[:, 6]),
+                          iou_matrix(gt[:, :4], tr[:, :4])))
+    num_gt = sum(len(g) for g, _, _ in timesteps)
+    num_tr = sum(len(t) for _, t, _ in timesteps)
+
+    # CLEAR MOTA
+    tp = fp = fn = idsw = 0
+    prev_timestep = np.full(n_gt, np.nan)
+    prev_matched = np.full(n_gt, np.nan)
+    for g, t, sim in timesteps:
+        if len(g) == 0 or len(t) == 0:
+            fp += len(t)
+            fn += len(g)
+            continue
+        score = 1000 * (prev_timestep[g][:, None] == t[None, :]) + sim
+        score[sim < 0.5 - EPS] = 0
+        rows, cols = linear_sum_assignment(-score)
+        keep = score[rows, cols] > EPS
+        mg, mt = g[rows[keep]], t[cols[keep]]
+        prev = prev_matched[mg]
+        idsw += int(np.sum(~np.isnan(prev) & (prev != mt)))
+        prev_matched[mg] = mt
+        prev_timestep[:] = np.nan
+        prev_timestep[mg] = mt
+        tp += len(mg)
+        fn += len(g) - len(mg)
+        fp += len(t) - len(mg)
+    mota = (tp - fp - idsw) / max(1, num_gt)
+
+    # IDF1, the id assignment maximising the number of identity true positives
+    potential = np.zeros((n_gt, n_tr))
+    for g, t, sim in timesteps:
+        rows, cols = np.nonzero(sim >= 0.5 - EPS)
+        np.add.at(potential, (g[rows], t[cols]), 1)
+    idtp = 0
+    if n_gt and n_tr:
+        rows, cols = linear_sum_assignment(-potential)
+        idtp = potential[rows, cols].sum()
+    idf1 = 2 * idtp / max(1, num_gt + num_tr)
+
+    # HOTA
+    potential = np.zeros((n_gt, n_tr))
+    gt_id_count = np.zeros((n_gt, 1))
+    tr_id_count = np.zeros((1, n_tr))
+    for g, t, sim in timesteps:
+        if len(g) and len(t):
+            denom = sim.sum(0)[None, :] + sim.sum(1)[:, None] - sim
+            potential[g[:, None], t[None, :]] += np.where(denom > EPS, sim / np.maximum(denom, EPS), 0)
+        gt_id_count[g, 0] += 1
+        tr_id_count[0, t] += 1
+    global_alignment = potential / np.maximum(1, gt_id_count + tr_id_count - potential)
+
+    hota_tp = np.zeros(len(ALPHAS))
+    hota_fn = np.zeros(len(ALPHAS))
+    hota_fp = np.zeros(len(ALPHAS))
+    matches_counts = np.zeros((len(ALPHAS), n_gt, n_tr))
+    for g, t, sim in timesteps:
+        if len(g) == 0 or len(t) == 0:
+            hota_fp += len(t)
+            hota_fn += len(g)
+            continue
+        rows, cols = linear_sum_assignment(-(global_alignment[g[:, None], t[None, :]] * sim))
+        for a, alpha in enumerate(ALPHAS):
+            ok = sim[rows, cols] >= alpha - EPS
+            n = int(ok.sum())
+            hota_tp[a] += n
+            hota_fn[a] += len(g) - n
+            hota_fp[a] += len(t) - n
+            matches_counts[a, g[rows[ok]], t[cols[ok]]] += 1
+    ass_a = matches_counts / np.maximum(1, gt_id_count + tr_id_count - matches_counts)
+    ass_a = (matches_counts * ass_a).sum(axis=(1, 2)) / np.maximum(1, hota_tp)
+    det_a = hota_tp / np.maximum(1, hota_tp + hota_fn + hota_fp)
+    hota = np.sqrt(det_a * ass_a)
+
+    return {'MOTA': mota, 'IDF1': idf1, 'HOTA': hota.mean(),
+            'DetA': det_a.mean(), 'AssA': ass_a.mean(), 'IDSW': idsw}
+
+
+# ------------------------------------------------------------------------------------------------
+# timing
+
+
+class StageTimer:
+    """
+    Wraps the motion, ReID and CMC methods of a tracker with timers.
+    Association time is what is left of `tracker.update` after motion and ReID.
+    """
+
+    def __init__(self):
+        self.times = defaultdict(float)
+        self._restore = []
+
+    def wrap(self, owner, name, stage):
+        if owner is None or not hasattr(owner, name):
+            return
+        static = inspect.isclass(owner) and isinstance(inspect.getattr_static(owner, name), staticmethod)
+        original = getattr(owner, name)
+        times = self.times
+
+        def timed(*args, **kwargs):
+            t0 = time.perf_counter()
+            try:
+                return original(*args, **kwargs)
+            finally:
+                times[stage] += time.perf_counter() - t0
+
+        if inspect.isclass(owner):
+            self._restore.append((owner, name, owner.__dict__[name]))
+        else:
+            self._restore.append((owner, name, None))
+        setattr(owner, name, staticmethod(timed) if static else timed)
+
+    def instrument(self, tracker_type, tracker):
+        import importlib
+        self.wrap(tracker, '_get_features', 'reid')
+        if tracker_type == 'strongsort':
+            self.wrap(tracker.tracker, 'predict', 'motion')
+        elif tracker_type in ['bytetrack', 'botsort']:
+            module = importlib.import_module(type(tracker).__module__)
+            self.wrap(module.STrack, 'multi_predict', 'motion')
+            self.wrap(getattr(tracker, 'gmc', None), 'apply', 'motion')
+        elif tracker_type in ['ocsort', 'deepocsort']:
+            module = importlib.import_module(type(tracker).__module__)
+            self.wrap(module.KalmanBoxTracker, 'predict', 'motion')
+            self.wrap(getattr(tracker, 'cmc', None), 'compute_affine', 'motion')
+
+    def restore(self):
+        for owner, name, original in reversed(self._restore):
+            if original is None:
+                delattr(owner, name)
+            else:
+                setattr(owner, name, original)
+        self._restore = []
+
+
+# ------------------------------------------------------------------------------------------------
+# benchmark
+
+
+def read_frames(source, frame_ids, imgsz):
+    # yields (frame_idx, frame); blank frames if there is no video
+    if source is None:
+        blank = np.zeros((imgsz[0], imgsz[1], 3), dtype=np.uint8)
+        for frame_idx in frame_ids:
+            yield frame_idx, blank
+        return
+    cap = cv2.VideoCapture(str(source))
+    current = 0
+    for frame_idx in frame_ids:
+        if frame_idx != current + 1:
+            cap.set(cv2.CAP_PROP_POS_FRAMES, frame_idx - 1)
+        success, frame = cap.read()
+        current = frame_idx
+        if not success:
+            break
+        yield frame_idx, frame
+    cap.release()
+
+
+def run_tracker(tracker_type, det_frames, args):
+    """
+    Summary:
+        Replay cached detections through one tracker the same way `MainWindow.track_buttonClicked` does,
+        frames without detections are skipped (the tracker is not updated on them).
+
+    Returns:
+        results (dict): frame_idx -> (M, 7) array of tracked boxes (same layout as `load_tracks`)
+        timing (dict): seconds spent in total and per stage
+        n_frames (int): number of frames given to the tracker
+    """
+
+    config = ROOT / 'trackers' / tracker_type / 'configs' / (tracker_type + '.yaml')
+    with torch.no_grad():
+        tracker = create_tracker(tracker_type, config, args.reid_weights, args.device, False, external_cmc=True)
+    cmc = CMCService(method=args.cmc, pyramid_levels=args.cmc_pyramid_levels)
+    timer = StageTimer()
+    timer.instrument(tracker_type, tracker)
+
+    results = defaultdict(lambda: np.empty((0, 7)))
+    total = 0.0
+    n_frames = 0
+    prev_frame, prev_idx = None, None
+    frame_ids = sorted(det_frames.keys())
+    try:
+        for frame_idx, frame in read_frames(args.source, range(frame_ids[0], frame_ids[-1] + 1), args.imgsz):
+            dets = det_frames[frame_idx]
+            dets = dets[dets[:, 4] >= args.conf_thres]
+            if len(dets) == 0:
+                continue
+            t0 = time.perf_counter()
+            if args.source is not None and prev_frame is not None:
+                t1 = time.perf_counter()
+                cmc.apply(tracker, cmc.compute(prev_frame, frame, prev_idx, frame_idx, detections=dets[:, :4]))
+                timer.times['motion'] += time.perf_counter() - t1
+            with torch.no_grad():
+                outputs = tracker.update(torch.from_numpy(dets[:, :6]).to(torch.float32), frame)
+            total += time.perf_counter() - t0
+            n_frames += 1
+            prev_frame, prev_idx = frame, frame_idx
+            rows = [[*track[:4], track[6], track[5], track[4]] for track in outputs]
+            if rows:
+                results[frame_idx] = np.array(rows, dtype=np.float64)
+    finally:
+        timer.restore()
+
+    timing = {'total': total, 'motion': timer.times['motion'], 'reid': timer.times['reid']}
+    timing['association'] = max(0.0, total - timing['motion'] - timing['reid'])
+    return results, timing, n_frames
+
+
+def main(args):
+    det_frames = load_tracks(args.dets, args.box_format)
+    # without ground truth only the speed is measured
+    gt_frames = load_tracks(args.gt, args.box_format) if args.gt is not None else None
+    if len(det_frames) == 0:
+        raise ValueError(f"No detections found in {args.dets}")
+    if args.source is None:
+        boxes = np.concatenate(list(det_frames.values()))
+        args.imgsz = args.imgsz or [int(boxes[:, 3].max()) + 1, int(boxes[:, 2].max()) + 1]
+        print('WARNING: no --source given, ReID trackers run on blank frames (timing only)')
+
+    report = {}
+    header = f"{'tracker':<12}{'FPS':>9}{'motion ms':>11}{'reid ms':>9}{'assoc ms':>10}{'MOTA':>8}{'IDF1':>8}{'HOTA':>8}"
+    print(header)
+    for tracker_type in args.trackers:
+        results, timing, n_frames = run_tracker(tracker_type, det_frames, args)
+        metrics = evaluate(gt_frames, results) if gt_frames is not None else {}
+        report[tracker_type] = {'frames': n_frames, 'fps': n_frames / max(EPS, timing['total']),
+                                **{f'{k}_ms_per_frame': 1000 * v / max(1, n_frames) for k, v in timing.items()},
+                                **metrics}
+        r = report[tracker_type]
+        scores = ''.join(f"{100 * r[k]:>8.1f}" if k in r else f"{'-':>8}" for k in ['MOTA', 'IDF1', 'HOTA'])
+        print(f"{tracker_type:<12}{r['fps']:>9.1f}{r['motion_ms_per_frame']:>11.2f}{r['reid_ms_per_frame']:>9.2f}"
+              f"{r['association_ms_per_frame']:>10.2f}{scores}")
+
+    if args.save:
+        with open(args.save, 'wb') as f:
+            f.write(orjson.dumps(report, option=orjson.OPT_INDENT_2 | orjson.OPT_SERIALIZE_NUMPY))
+    return report
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description="Tracker benchmark over cached detections")
+    parser.add_argument('--dets', type=str, required=True, help='tracking results json or MOT txt to replay')
+    parser.add_argument('--gt', type=str, default=None, help='ground truth json or MOT txt (default: no MOTA/IDF1/HOTA)')
+    parser.add_argument('--source', type=str, default=None, help='video the detections belong to (needed for ReID/CMC)')
+    parser.add_argument('--trackers', nargs='+', default=TRACKERS, choices=TRACKERS, help='trackers to benchmark')
+    parser.add_argument('--box-format', default='xyxy', choices=['xyxy', 'tlwh'], help='box columns of MOT txt files')
+    parser.add_argument('--conf-thres', type=float, default=0.0, help='drop detections below this confidence')
+    parser.add_argument('--imgsz', nargs=2, type=int, default=None, help='blank frame (h, w) when there is no --source')
+    parser.add_argument('--cmc', default='sparseOptFlow', choices=CMCService.METHODS, help='camera motion compensation')
+    parser.add_argument('--cmc-pyramid-levels', type=int, default=2, help='CMC downscale pyramid levels')
+    parser.add_argument('--reid-weights', type=Path, default=Path('osnet_x1_0_msmt17.pt'), help='ReID model path')
+    parser.add_argument('--device', default='cpu', help='cuda device, i.e. 0 or cpu')
+    parser.add_argument('--save', type=str, default=None, help='write the report to this json file')
+    args = parser.parse_args()
+
+    from ultralytics.yolo.utils.torch_utils import select_device
+    args.device = select_device(args.device)
+    main(args)
@@ -0,0 +1,236 @@
+import os
+import pickle
+
+import cv2
+import numpy as np
+
+
+class CMCService:
+    """
+    Camera motion compensation shared by all trackers.
+
+    The affine warp between two consecutive frames is estimated once on a
+    downscaled gray pyramid level and cached by frame index, so every tracker
+    (and every re-tracking run over the same frames) reuses the same warp
+    instead of estimating it per track or per tracker.
+
+    Parameters
+    ----------
+    method : str
+        One of 'ecc', 'sparseOptFlow', 'orb' or 'none'.
+    pyramid_levels : int
+        Number of `cv2.pyrDown` steps applied to the gray frame before
+        estimation (each level halves the resolution).
+    cache_path : str
+        Optional pickle file the per-frame warps are loaded from and dumped to.
+    """
+
+    METHODS = ['ecc', 'sparseOptFlow', 'orb', 'none']
+
+    def __init__(self, method='sparseOptFlow', pyramid_levels=2, cache_path=None):
+        if method not in self.METHODS:
+            raise ValueError("Error: Unknown CMC method:" + method)
+        self.method = method
+        self.pyramid_levels = max(0, int(pyramid_levels))
+        self.scale = 2 ** self.pyramid_levels
+
+        if self.method == 'orb':
+            self.detector = cv2.ORB_create(nfeatures=1000)
+            self.matcher = cv2.BFMatcher(cv2.NORM_HAMMING)
+        elif self.method == 'ecc':
+            self.warp_mode = cv2.MOTION_EUCLIDEAN
+            self.criteria = (cv2.TERM_CRITERIA_EPS | cv2.TERM_CRITERIA_COUNT, 100, 1e-5)
+        elif self.method == 'sparseOptFlow':
+            self.feature_params = dict(maxCorners=1000, qualityLevel=0.01, minDistance=1, blockSize=3,
+                                       useHarrisDetector=False, k=0.04)
+
+        self.cache_path = cache_path
+        self.cache = {}
+        if cache_path is not None and os.path.exists(cache_path):
+            with open(cache_path, "rb") as fp:
+                self.cache = pickle.load(fp)
+
+        # the last downscaled frame, so each frame is converted only once
+        self._gray_key = None
+        self._gray = None
+
+    def compute(self, prev_frame, curr_frame, prev_idx=None, curr_idx=None, detections=None):
+        """
+        Summary:
+            Get the 2x3 affine warp mapping `prev_frame` coordinates to `curr_frame` coordinates.
+            The warp is read from the cache if this pair of frames was already processed.
+
+        Args:
+            prev_frame (np.ndarray): previous BGR frame
+            curr_frame (np.ndarray): current BGR frame
+            prev_idx (int): index of the previous frame (cache key, optional)
+            curr_idx (int): index of the current frame (cache key, optional)
+            detections (np.ndarray): Nx4 xyxy boxes to exclude from feature matching (optional)
+
+        Returns:
+            warp (np.ndarray): 2x3 float affine matrix in full resolution coordinates
+        """
+
+        key = None
+        if prev_idx is not None and curr_idx is not None:
+            key = (self.method, self.pyramid_levels, int(prev_idx), int(curr_idx))
+        if key is not None and key in self.cache:
+            return self.cache[key].copy()
+        if self.method == 'none' or prev_frame is None or curr_frame is None:
+            return np.eye(2, 3)
+
+        prev_gray = self._downscaled_gray(prev_frame, prev_idx)
+        curr_gray = self._downscaled_gray(curr_frame, curr_idx)
+        mask = self._detections_mask(curr_gray.shape, detections)
+
+        if self.method == 'ecc':
+            warp = self._warp_ecc(prev_gray, curr_gray, mask)
+        elif self.method == 'sparseOptFlow':
+            warp = self._warp_sparse_flow(prev_gray, curr_gray, mask)
+        else:
+            warp = self._warp_orb(prev_gray, curr_gray, mask)
+
+        # the linear part is scale invariant, only the translation is rescaled
+        warp = np.asarray(warp, dtype=np.float64)
+        warp[:, 2] *= self.scale
+
+        if key is not None:
+            self.cache[key] = warp
+        return warp.copy()
+
+    def _downscaled_gray(self, frame, idx):
+        key = (idx, id(frame)) if idx is None else idx
+        if key == self._gray_key:
+            return self._gray
+        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY) if frame.ndim == 3 else frame
+        for _ in range(self.pyramid_levels):
+            gray = cv2.pyrDown(gray)
+        self._gray_key, self._gray = key, gray
+        return gray
+
+    def _detections_mask(self, shape, detections):
+        if detections is None or len(detections) == 0:
+            return None
+        mask = np.full(shape, 255, dtype=np.uint8)
+        boxes = np.round(np.asarray(detections, dtype=np.float64)[:, :4] / self.scale).astype(np.int32)
+        boxes[boxes < 0] = 0
+        for x1, y1, x2, y2 in boxes:
+            mask[y1:y2, x1:x2] = 0
+        return mask
+
+    def _warp_ecc(self, prev_gray, curr_gray, mask):
+        warp = np.eye(2, 3, dtype=np.float32)
+        try:
+            (cc, warp) = cv2.findTransformECC(prev_gray, curr_gray, warp, self.warp_mode, self.criteria, mask, 1)
+        except cv2.error:
+            print('Warning: find transform failed. Set warp as identity')
+            return np.eye(2, 3)
+        return warp
+
+    def _warp_sparse_flow(self, prev_gray, curr_gray, mask):
+        keypoints = cv2.goodFeaturesToTrack(prev_gray, mask=mask, **self.feature_params)
+        if keypoints is None:
+            return np.eye(2, 3)
+        matched, status, err = cv2.calcOpticalFlowPyrLK(prev_gray, curr_gray, keypoints, None)
+        status = status.reshape(-1).astype(bool)
+        return self._estimate(keypoints.reshape(-1, 2)[status], matched.reshape(-1, 2)[status])
+
+    def _warp_orb(self, prev_gray, curr_gray, mask):
+        prev_kp, prev_desc = self.detector.detectAndCompute(prev_gray, mask)
+        curr_kp, curr_desc = self.detector.detectAndCompute(curr_gray, mask)
+        if prev_desc is None or curr_desc is None:
+            return np.eye(2, 3)
+        good = [m for m, n in (p for p in self.matcher.knnMatch(prev_desc, curr_desc, 2) if len(p) == 2)
+                if m.distance < 0.9 * n.distance]
+        prev_points = np.float32([prev_kp[m.queryIdx].pt for m in good]).reshape(-1, 2)
+        curr_points = np.float32([curr_kp[m.trainIdx].pt for m in good]).reshape(-1, 2)
+        return self._estimate(prev_points, curr_points)
+
+    @staticmethod
+    def _estimate(prev_points, curr_points):
+        if prev_points.shape[0] <= 4:
+            print('Warning: not enough matching points')
+            return np.eye(2, 3)
+        warp, inliers = cv2.estimateAffinePartial2D(prev_points, curr_points, method=cv2.RANSAC)
+        if warp is None:
+            return np.eye(2, 3)
+        return warp
+
+    def apply(self, tracker, warp):
+        """
+        Summary:
+            Apply a warp computed by `compute` to all the tracks of a tracker created by `create_tracker`.
+
+        Args:
+            tracker: StrongSORT, OCSort, BYTETracker, BoTSORT or deep OCSort instance
+            warp (np.ndarray): 2x3 affine matrix
+        """
+
+        if self.method == 'none' or np.allclose(warp, np.eye(2, 3)):
+            return
+        if hasattr(tracker, 'tracker') and hasattr(tracker.tracker, 'tracks'):
+            # StrongSORT
+            for track in tracker.tracker.tracks:
+                track.apply_warp(warp)
+        elif hasattr(tracker, 'tracked_stracks'):
+            stracks = tracker.tracked_stracks + tracker.lost_stracks
+            if hasattr(tracker, 'gmc'):
+                # BoT-SORT keeps an (x, y, w, h) state
+                if len(stracks) > 0:
+                    type(stracks[0]).multi_gmc(stracks, warp)
+            else:
+                # ByteTrack keeps an (x, y, a, h) state
+                for strack in stracks:
+                    strack.mean, strack.covariance = warp_xyah_state(strack.mean, strack.covariance, warp)
+        elif hasattr(tracker, 'trackers'):
+            for trk in tracker.trackers:
+                if hasattr(trk, 'apply_affine_correction'):
+                    # deep OCSort
+                    trk.apply_affine_correction(warp)
+                else:
+                    warp_ocsort_track(trk, warp)
+
+    def reset(self):
+        """Forget the last frame (e.g. on seek), the warp cache is kept."""
+        self._gray_key, self._gray = None, None
+
+    def dump_cache(self):
+        if self.cache_path is None:
+            return
+        with open(self.cache_path, "wb") as fp:
+            pickle.dump(self.cache, fp)
+
+
+def warp_xyah_state(mean, covariance, warp):
+    """Warp a Kalman state of the form (x, y, a, h, vx, vy, va, vh)."""
+    R = warp[:2, :2]
+    t = warp[:2, 2]
+    scale = np.sqrt(abs(np.linalg.det(R)))
+    mean = mean.copy()
+    mean[:2] = R.dot(mean[:2]) + t
+    mean[4:6] = R.dot(mean[4:6])
+    mean[3] *= scale
+    mean[7] *= scale
+    T = np.eye(8)
+    T[:2, :2] = R
+    T[4:6, 4:6] = R
+    T[3, 3] = T[7, 7] = scale
+    return mean, T.dot(covariance).dot(T.T)
+
+
+def warp_ocsort_track(trk, warp):
+    """Warp an OC-SORT track whose state is (x, y, s, r, vx, vy, vs)."""
+    m = warp[:, :2]
+    t = warp[:, 2].reshape(2, 1)
+    area_scale = abs(np.linalg.det(m))
+    if trk.last_observation.sum() > 0:
+        ps = trk.last_observation[:4].reshape(2, 2).T
+        trk.last_observation[:4] = (m @ ps + t).T.reshape(-1)
+    for age in range(trk.age - trk.delta_t, trk.age + 1):
+        if age in trk.observations:
+            ps = trk.observations[age][:4].reshape(2, 2).T
+            trk.observations[age][:4] = (m @ ps + t).T.reshape(-1)
+    trk.kf.x[:2] = m @ trk.kf.x[:2] + t
+    trk.kf.x[4:6] = m @ trk.kf.x[4:6]
+    trk.kf.x[2] *= area_scale
+    trk.kf.x[6] *= area_scale
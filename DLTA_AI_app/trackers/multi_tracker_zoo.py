@@ -1,6 +1,8 @@
 from trackers.strongsort.utils.parser import get_config
 
-def create_tracker(tracker_type, tracker_config, reid_weights, device, half):
+def create_tracker(tracker_type, tracker_config, reid_weights, device, half, external_cmc=False):
+    # external_cmc: camera motion is compensated by a shared trackers.cmc.CMCService,
+    # so the trackers' own CMC is turned off to avoid compensating twice
     
     cfg = get_config()
     cfg.merge_from_file(tracker_config)
@@ -59,7 +61,7 @@ def create_tracker(tracker_type, tracker_config, reid_weights, device, half):
             match_thresh=cfg.botsort.match_thresh,
             proximity_thresh=cfg.botsort.proximity_thresh,
             appearance_thresh=cfg.botsort.appearance_thresh,
-            cmc_method =cfg.botsort.cmc_method,
+            cmc_method ='none' if external_cmc else cfg.botsort.cmc_method,
             frame_rate=cfg.botsort.frame_rate,
             lambda_=cfg.botsort.lambda_
         )
@@ -77,6 +79,7 @@ def create_tracker(tracker_type, tracker_config, reid_weights, device, half):
             delta_t=cfg.deepocsort.delta_t,
             asso_func=cfg.deepocsort.asso_func,
             inertia=cfg.deepocsort.inertia,
+            cmc_off=external_cmc,
         )
         return botsort
     else:
@@ -228,6 +228,10 @@ class Track:
         warp_matrix, src_aligned = self.ECC(previous_frame, next_frame)
         if warp_matrix is None and src_aligned is None:
             return
+        self.apply_warp(warp_matrix)
+
+    def apply_warp(self, warp_matrix):
+        """Move the track box by a 2x3 camera motion warp (see `trackers.cmc.CMCService`)."""
         [a,b] = warp_matrix
         warp_matrix=np.array([a,b,[0,0,1]])
         warp_matrix = warp_matrix.tolist()
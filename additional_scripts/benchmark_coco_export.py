@@ -0,0 +1,85 @@
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import tempfile
+
+sys.path.append(os.path.join(os.path.dirname(os.path.realpath(__file__)), "..", "DLTA_AI_app"))
+
+from labelme.utils.export import exportCOCO
+
+
+def make_label_files(directory: str, num_files: int, num_shapes: int) -> list:
+    """
+    Writes synthetic label files (same format as the app saves them) to a directory.
+
+    Args:
+        directory (str): The directory to write the label files to.
+        num_files (int): The number of label files.
+        num_shapes (int): The number of shapes per label file.
+
+    Returns:
+        list: The paths of the label files.
+    """
+    rng = random.Random(0)
+    labels = ["person", "car", "dog", "bicycle", "custom_label"]
+    json_paths = []
+    for i in range(num_files):
+        shapes = []
+        for _ in range(num_shapes):
+            x, y = rng.uniform(0, 1800), rng.uniform(0, 1000)
+            points = [[x + rng.uniform(0, 100), y + rng.uniform(0, 100)] for _ in range(20)]
+            shapes.append({
+                "label": rng.choice(labels),
+                "points": points,
+                "bbox": None,
+                "group_id": None,
+                "shape_type": "polygon",
+                "flags": {},
+                "content": str(round(rng.random(), 2)),
+            })
+        path = os.path.join(directory, f"{i:06d}.json")
+        with open(path, "w") as f:
+            json.dump({"version": "5.0.1", "flags": {}, "shapes": shapes, "imagePath": f"{i:06d}.jpg",
+                       "imageData": None, "imageHeight": 1080, "imageWidth": 1920}, f)
+        json_paths.append(path)
+    return json_paths
+
+
+def benchmark(num_files: int, num_shapes: int, workers: int = None) -> None:
+    """
+    Times the COCO export of synthetic label files sequentially and with the process pool.
+
+    Args:
+        num_files (int): The number of label files.
+        num_shapes (int): The number of shapes per label file.
+        workers (int, optional): The number of processes of the pool. Defaults to the number of CPUs.
+    """
+    with tempfile.TemporaryDirectory() as directory:
+        print(f"Writing {num_files} label files with {num_shapes} shapes each ...")
+        json_paths = make_label_files(directory, num_files, num_shapes)
+
+        outputs = {}
+        for name, n in [("sequential", 1), ("parallel", workers)]:
+            output = os.path.join(directory, f"coco_{name}.out")
+            start = time.perf_counter()
+            exportCOCO(json_paths, output, workers=n)
+            elapsed = time.perf_counter() - start
+            print(f"{name:>10}: {elapsed:.2f} s ({num_files / elapsed:.0f} files/s)")
+            with open(output) as f:
+                outputs[name] = json.load(f)
+
+        outputs["sequential"]["info"] = outputs["parallel"]["info"]
+        assert outputs["sequential"] == outputs["parallel"], "sequential and parallel exports differ"
+        print(f"{len(outputs['parallel']['annotations'])} annotations, outputs are identical")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the COCO export of a large directory of label files")
+    parser.add_argument("--num-files", type=int, default=100000, help="number of label files")
+    parser.add_argument("--shapes", type=int, default=10, help="number of shapes per label file")
+    parser.add_argument("--workers", type=int, default=None, help="number of processes (default: number of CPUs)")
+    args = parser.parse_args()
+    benchmark(args.num_files, args.shapes, args.workers)
@@ -0,0 +1,143 @@
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import tempfile
+
+import orjson
+
+sys.path.append(os.path.join(os.path.dirname(os.path.realpath(__file__)), "..", "DLTA_AI_app"))
+
+from labelme.utils import compact_format
+
+
+def make_label_data(rng: random.Random, num_shapes: int, num_points: int) -> dict:
+    """
+    Makes synthetic label file data (same format as the app saves it, with flat float points).
+
+    Args:
+        rng (random.Random): The random generator.
+        num_shapes (int): The number of shapes.
+        num_points (int): The number of points per shape.
+
+    Returns:
+        dict: The label file data.
+    """
+    shapes = []
+    for _ in range(num_shapes):
+        x, y = rng.uniform(0, 1800), rng.uniform(0, 1000)
+        points = []
+        for _ in range(num_points):
+            points += [x + rng.uniform(0, 100), y + rng.uniform(0, 100)]
+        shapes.append({"label": "person", "points": points, "bbox": [int(x), int(y), int(x) + 100, int(y) + 100],
+                       "group_id": None, "content": str(round(rng.random(), 2)), "shape_type": "polygon", "flags": {}})
+    return {"version": "5.0.1", "flags": {}, "shapes": shapes, "imagePath": "image.jpg",
+            "imageData": None, "imageHeight": 1080, "imageWidth": 1920}
+
+
+def make_tracking_results(rng: random.Random, num_frames: int, num_objects: int, num_points: int) -> list:
+    """
+    Makes synthetic video tracking results (same format as the app saves them, with nested int segments).
+
+    Args:
+        rng (random.Random): The random generator.
+        num_frames (int): The number of frames.
+        num_objects (int): The number of objects per frame.
+        num_points (int): The number of points per segment.
+
+    Returns:
+        list: The frames of the tracking results.
+    """
+    frames = []
+    for frame_idx in range(1, num_frames + 1):
+        frame_data = []
+        for tracker_id in range(num_objects):
+            x, y = rng.randint(0, 1800), rng.randint(0, 1000)
+            segment = [[x + rng.randint(0, 100), y + rng.randint(0, 100)] for _ in range(num_points)]
+            frame_data.append({"tracker_id": tracker_id, "bbox": [x, y, x + 100, y + 100],
+                               "confidence": str(round(rng.random(), 2)), "class_name": "car",
+                               "class_id": 2, "segment": segment})
+        frames.append({"frame_idx": frame_idx, "frame_data": frame_data})
+    return frames
+
+
+def timed(function, repeat: int) -> float:
+    """
+    Returns the best time of `repeat` calls of a function.
+    """
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def report(name: str, json_file: str, compact_file: str, times: dict) -> None:
+    json_size, compact_size = os.path.getsize(json_file), os.path.getsize(compact_file)
+    print(f"{name}")
+    print(f"  size : json {json_size / 1e6:8.2f} MB  compact {compact_size / 1e6:8.2f} MB  ({json_size / compact_size:.1f}x smaller)")
+    for operation in ["write", "read"]:
+        json_time, compact_time = times[("json", operation)], times[("compact", operation)]
+        print(f"  {operation:5}: json {json_time * 1000:8.1f} ms  compact {compact_time * 1000:8.1f} ms  ({json_time / compact_time:.1f}x faster)")
+
+
+def benchmark(num_shapes: int, num_frames: int, num_objects: int, num_points: int, repeat: int) -> None:
+    """
+    Compares the size and the write/read times of the JSON and the compact formats
+    for a label file and for video tracking results, and checks that they round-trip.
+    """
+    rng = random.Random(0)
+    with tempfile.TemporaryDirectory() as directory:
+        # label file, written and read the same way as LabelFile
+        data = make_label_data(rng, num_shapes, num_points)
+        json_file, compact_file = os.path.join(directory, "image.json"), os.path.join(directory, "image.npz")
+
+        def write_json():
+            with open(json_file, "w", encoding="utf-8") as f:
+                json.dump(data, f, ensure_ascii=False, indent=2)
+
+        def read_json():
+            with open(json_file, encoding="utf-8") as f:
+                return json.load(f)
+
+        times = {("json", "write"): timed(write_json, repeat),
+                 ("json", "read"): timed(read_json, repeat),
+                 ("compact", "write"): timed(lambda: compact_format.save_label_data(compact_file, data), repeat),
+                 ("compact", "read"): timed(lambda: compact_format.load_label_data(compact_file), repeat)}
+        assert compact_format.load_label_data(compact_file) == read_json(), "label file does not round-trip"
+        report(f"label file ({num_shapes} shapes x {num_points} points)", json_file, compact_file, times)
+
+        # tracking results, written and read the same way as the video mode
+        frames = make_tracking_results(rng, num_frames, num_objects, num_points)
+        json_file = os.path.join(directory, "video_tracking_results.json")
+        compact_file = os.path.join(directory, "video_tracking_results.npz")
+
+        def write_json():
+            with open(json_file, "wb") as f:
+                f.write(orjson.dumps(frames, option=orjson.OPT_INDENT_2))
+
+        def read_json():
+            with open(json_file, "rb") as f:
+                return orjson.loads(f.read())
+
+        times = {("json", "write"): timed(write_json, repeat),
+                 ("json", "read"): timed(read_json, repeat),
+                 ("compact", "write"): timed(lambda: compact_format.save_tracking_results(compact_file, frames), repeat),
+                 ("compact", "read"): timed(lambda: compact_format.load_tracking_results(compact_file), repeat)}
+        assert compact_format.load_tracking_results(compact_file) == read_json(), "tracking results do not round-trip"
+        report(f"tracking results ({num_frames} frames x {num_objects} objects x {num_points} points)",
+               json_file, compact_file, times)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the JSON and the compact label file formats")
+    parser.add_argument("--shapes", type=int, default=1000, help="number of shapes of the label file")
+    parser.add_argument("--frames", type=int, default=3000, help="number of frames of the tracking results")
+    parser.add_argument("--objects", type=int, default=20, help="number of objects per frame")
+    parser.add_argument("--points", type=int, default=30, help="number of points per polygon")
+    parser.add_argument("--repeat", type=int, default=3, help="number of runs (the best one is reported)")
+    args = parser.parse_args()
+    benchmark(args.shapes, args.frames, args.objects, args.points, args.repeat)
@@ -0,0 +1,149 @@
+import os
+import sys
+import time
+import random
+import argparse
+
+import numpy as np
+
+sys.path.append(os.path.join(os.path.dirname(os.path.realpath(__file__)), "..", "DLTA_AI_app"))
+
+from labelme.utils.helpers import mathOps
+
+
+# the previous (per vertex) implementations, for comparison
+
+def legacy_addPoints(shape, n):
+    sub = 1.0 * n / (len(shape) - 1)
+    if sub == 0:
+        return shape
+    if sub < 1:
+        res = [shape[0]]
+        for i in range(len(shape) - 1):
+            res.append([(shape[i][0] + shape[i + 1][0]) / 2, (shape[i][1] + shape[i + 1][1]) / 2])
+            res.append(shape[i + 1])
+        return legacy_handlePoints(res, n + len(shape))
+    toBeAdded = int(sub) + 1
+    res = [shape[0]]
+    for i in range(len(shape) - 1):
+        dif = [shape[i + 1][0] - shape[i][0], shape[i + 1][1] - shape[i][1]]
+        for j in range(1, toBeAdded):
+            res.append([shape[i][0] + dif[0] * j / toBeAdded, shape[i][1] + dif[1] * j / toBeAdded])
+        res.append(shape[i + 1])
+    return legacy_addPoints(res, n + len(shape) - len(res))
+
+
+def legacy_reducePoints(polygon, n):
+    if n >= len(polygon):
+        return polygon
+    distances = polygon.copy()
+    for i in range(len(polygon)):
+        x1, y1 = polygon[i - 1]
+        x2, y2 = polygon[(i + 1) % len(polygon)]
+        x, y = polygon[i]
+        if x1 == x2:
+            dist_perp = abs(x - x1)
+        elif y1 == y2:
+            dist_perp = abs(y - y1)
+        else:
+            m = (y2 - y1) / (x2 - x1)
+            c = y1 - m * x1
+            dist_perp = abs(m * x - y + c) / np.sqrt(m * m + 1)
+        dif_right = np.array(polygon[(i + 1) % len(polygon)]) - np.array(polygon[i])
+        dif_left = np.array(polygon[i - 1]) - np.array(polygon[i])
+        distances[i] = min(dist_perp, np.hypot(*dif_right), np.hypot(*dif_left))
+    distances = [distances[i] + random.random() for i in range(len(distances))]
+    threshold = np.percentile(distances, 100 - 100.0 * n / len(polygon))
+    i = 0
+    while i < len(polygon):
+        if distances[i] < threshold:
+            polygon[i] = None
+            i += 1
+        i += 1
+    return legacy_reducePoints([x for x in polygon if x is not None], n)
+
+
+def legacy_handlePoints(polygon, n):
+    if n == len(polygon):
+        return polygon
+    if n > len(polygon):
+        return legacy_addPoints(polygon, n - len(polygon))
+    return legacy_reducePoints(polygon, n)
+
+
+def legacy_allign(shape1, shape2):
+    def sort(shape):
+        center = mathOps.centerOFmass(shape)
+        org = [[x - center[0], y - center[1]] for x, y in shape]
+        org = sorted(org, key=lambda p: np.arctan2(p[1], p[0]), reverse=True)
+        return [[x + center[0], y + center[1]] for x, y in org]
+    return (sort(shape1), sort(shape2))
+
+
+def make_polygon(rng: np.random.Generator, num_points: int, cx: float, cy: float, radius: float) -> list:
+    """
+    Makes a random star-shaped polygon (int points, as the app stores segments).
+    """
+    angles = np.sort(rng.uniform(0, 2 * np.pi, num_points))[::-1]
+    radii = radius * rng.uniform(0.6, 1.0, num_points)
+    return np.stack([cx + radii * np.cos(angles), cy + radii * np.sin(angles)], axis=1).astype(int).tolist()
+
+
+def timed(function, repeat: int) -> float:
+    """
+    Returns the best time of `repeat` calls of a function.
+    """
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def matching_error(shape1: list, shape2: list) -> float:
+    """
+    Returns the mean distance between the matched points of two alligned polygons (around their centers).
+    """
+    shape1, shape2 = np.array(shape1, dtype=float), np.array(shape2, dtype=float)
+    return float(np.mean(np.hypot(*((shape1 - shape1.mean(0)) - (shape2 - shape2.mean(0))).T)))
+
+
+def benchmark(num_points: int, other_points: int, repeat: int) -> None:
+    """
+    Compares the previous and the vectorized resampling (500 -> 750 and 750 -> 500 points) and allignment
+    of polygons, and checks the vertex counts.
+    """
+    rng = np.random.default_rng(0)
+    small = make_polygon(rng, num_points, 500, 500, 100)
+    big = make_polygon(rng, other_points, 520, 480, 120)
+
+    cases = [
+        ("addPoints", lambda: legacy_addPoints(list(small), other_points - num_points),
+         lambda: mathOps.addPoints(small, other_points - num_points)),
+        ("reducePoints", lambda: legacy_reducePoints(list(big), num_points),
+         lambda: mathOps.reducePoints(big, num_points)),
+        ("handleTwoSegments", lambda: legacy_allign(legacy_handlePoints(list(small), other_points), big),
+         lambda: mathOps.handleTwoSegments(small, big)),
+    ]
+    for name, legacy, vectorized in cases:
+        legacy_time, vectorized_time = timed(legacy, repeat), timed(vectorized, repeat)
+        print(f"{name:18}: previous {legacy_time * 1000:8.2f} ms  vectorized {vectorized_time * 1000:8.2f} ms  "
+              f"({legacy_time / vectorized_time:.1f}x faster)")
+
+    assert len(mathOps.addPoints(small, other_points - num_points)) == other_points, "addPoints vertex count"
+    assert len(mathOps.reducePoints(big, num_points)) == num_points, "reducePoints vertex count"
+    segment1, segment2 = mathOps.handleTwoSegments(small, big)
+    assert len(segment1) == len(segment2) == other_points, "handleTwoSegments vertex count"
+    legacy1, legacy2 = legacy_allign(legacy_handlePoints(list(small), other_points), big)
+    print(f"matching error    : previous {matching_error(legacy1, legacy2):8.2f} px  "
+          f"vectorized {matching_error(segment1, segment2):8.2f} px")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the polygon resampling and allignment of the interpolation")
+    parser.add_argument("--points", type=int, default=500, help="number of points of the first polygon")
+    parser.add_argument("--other-points", type=int, default=750, help="number of points of the second polygon")
+    parser.add_argument("--repeat", type=int, default=5, help="number of runs (the best one is reported)")
+    args = parser.parse_args()
+    benchmark(args.points, args.other_points, args.repeat)
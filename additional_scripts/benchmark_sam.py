@@ -0,0 +1,87 @@
+import os
+import sys
+import json
+import time
+import argparse
+
+import numpy as np
+
+APP_DIR = os.path.join(os.path.dirname(os.path.realpath(__file__)), "..", "DLTA_AI_app")
+sys.path.append(APP_DIR)
+
+from labelme.utils.sam import Sam_Predictor
+
+
+def timed(function, repeat: int) -> float:
+    """
+    Returns the best time of `repeat` calls of a function.
+    """
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def load_image(image_file: str) -> np.ndarray:
+    """
+    Loads an RGB image, or makes a random 1920x1080 one if no file is given.
+    """
+    if image_file is None:
+        return np.random.default_rng(0).integers(0, 256, size=(1080, 1920, 3), dtype=np.uint8)
+    import cv2
+    return cv2.cvtColor(cv2.imread(image_file), cv2.COLOR_BGR2RGB)
+
+
+def benchmark(models: list, backends: list, image: np.ndarray, clicks: int, repeat: int, num_threads: int, device: str) -> None:
+    """
+    Measures the image encoder time and the time of a click (a point prompt) of SAM models
+    with the PyTorch and the onnxruntime (CPU) encoder and decoder.
+    """
+    rng = np.random.default_rng(0)
+    h, w = image.shape[:2]
+    points = [np.array([[rng.uniform(0, w), rng.uniform(0, h)]]) for _ in range(clicks)]
+    for model in models:
+        for encoder_backend, decoder_backend in backends:
+            try:
+                predictor = Sam_Predictor(model.get("model_type", model["name"]), model["checkpoint"], device,
+                                          encoder_backend=encoder_backend, decoder_backend=decoder_backend,
+                                          num_threads=num_threads)
+            except Exception as e:
+                print(f"{model['name']} ({encoder_backend} encoder, {decoder_backend} decoder): {e}")
+                continue
+            encoder_time = timed(lambda: predictor.compute_embedding(image), repeat)
+            predictor.set_new_image(image)
+
+            def click():
+                for point in points:
+                    predictor.clear_logit()
+                    predictor.predict(point_coords=point, point_labels=np.array([1]))
+
+            click_time = timed(click, repeat) / clicks
+            print(f"{model['name']:6} encoder {encoder_backend:11} {encoder_time * 1000:9.1f} ms   "
+                  f"decoder {decoder_backend:11} {click_time * 1000:7.1f} ms / click")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the encoder and the decoder (click) latency of the SAM models")
+    parser.add_argument("--image", default=None, help="image to segment (default: a random 1920x1080 image)")
+    parser.add_argument("--models", nargs="*", default=None, help="names of models_menu/sam_models.json (default: the downloaded ones)")
+    parser.add_argument("--encoder", nargs="*", default=["pytorch", "onnxruntime"], help="encoder backends")
+    parser.add_argument("--decoder", nargs="*", default=["pytorch", "onnxruntime"], help="decoder backends")
+    parser.add_argument("--clicks", type=int, default=20, help="number of clicks per run")
+    parser.add_argument("--repeat", type=int, default=3, help="number of runs (the best one is reported)")
+    parser.add_argument("--threads", type=int, default=0, help="onnxruntime threads (0: number of cores)")
+    parser.add_argument("--device", default="cpu", help="device of the PyTorch backend")
+    args = parser.parse_args()
+
+    # the checkpoint paths are relative to the app directory
+    os.chdir(APP_DIR)
+    with open("models_menu/sam_models.json") as f:
+        models = [model for model in json.load(f) if os.path.exists(model["checkpoint"])
+                  and (args.models is None or model["name"] in args.models)]
+    if len(models) == 0:
+        sys.exit("No SAM checkpoint found in mmdetection/checkpoints")
+    backends = [(encoder, decoder) for encoder in args.encoder for decoder in args.decoder]
+    benchmark(models, backends, load_image(args.image), args.clicks, args.repeat, args.threads, args.device)